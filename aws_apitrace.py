@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentation des appels d'API (opt-in) pour tous les clients aws_local.
+
+Chaque opération est enregistrée via les événements botocore : service,
+opération, latence, octets reçus, retries et throttles. À la sortie, un
+résumé par opération (p50/p95/p99) est affiché sur stderr et, si un fichier
+est donné, une timeline au format Chrome trace (chrome://tracing, Perfetto)
+y est écrite.
+
+Activation :
+    --trace-api [FICHIER]     dans les scripts qui utilisent add_argument()
+    AWS_TRACE_API=1           pour n'importe quel script (résumé seul)
+    AWS_TRACE_API=trace.json  résumé + timeline
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import atexit
+import threading
+
+from aws_throttle import THROTTLE_CODES
+
+
+def percentile(values, p):
+    """Percentile par rang le plus proche sur une liste triée."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Recorder:
+    """Collecte les mesures de chaque appel ; partagé par tous les threads."""
+
+    def __init__(self, timeline=None):
+        self.timeline = timeline
+        self.lock = threading.Lock()
+        self.ops = {}
+        self.events = []
+        self.t0 = time.perf_counter()
+
+    # --- Handlers botocore ---
+
+    def before_call(self, model, context, **kwargs):
+        context["apitrace_start"] = time.perf_counter()
+
+    def after_call(self, http_response, parsed, model, context, **kwargs):
+        end = time.perf_counter()
+        start = context.get("apitrace_start", end)
+        meta = parsed.get("ResponseMetadata", {}) if isinstance(parsed, dict) else {}
+        error = parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None
+        size = int(getattr(http_response, "headers", {}).get("content-length") or 0)
+        name = (model.service_model.service_name, model.name)
+
+        with self.lock:
+            op = self.ops.setdefault(name, {"latencies": [], "bytes": 0, "retries": 0, "throttles": 0, "errors": 0})
+            op["latencies"].append(end - start)
+            op["bytes"] += size
+            op["retries"] += meta.get("RetryAttempts", 0)
+            op["errors"] += 1 if error else 0
+            if self.timeline:
+                self.events.append({
+                    "name": f"{name[0]}.{name[1]}", "cat": name[0], "ph": "X",
+                    "ts": round((start - self.t0) * 1e6), "dur": round((end - start) * 1e6),
+                    "pid": os.getpid(), "tid": threading.get_ident(),
+                    "args": {"bytes": size, "retries": meta.get("RetryAttempts", 0), "error": error},
+                })
+
+    def needs_retry(self, response=None, operation=None, **kwargs):
+        # Appelé après chaque tentative : on compte les réponses de throttling
+        if not response or not isinstance(response[1], dict):
+            return None
+        if response[1].get("Error", {}).get("Code") in THROTTLE_CODES and operation is not None:
+            name = (operation.service_model.service_name, operation.name)
+            with self.lock:
+                op = self.ops.setdefault(name, {"latencies": [], "bytes": 0, "retries": 0, "throttles": 0, "errors": 0})
+                op["throttles"] += 1
+        return None
+
+    # --- Restitution ---
+
+    def summary(self, out=sys.stderr):
+        from rich.console import Console
+        from rich.table import Table, box
+
+        table = Table(box=box.SIMPLE_HEAVY, title="Appels d'API", header_style="bold cyan")
+        for col in ("Opération", "Appels", "Erreurs", "p50 ms", "p95 ms", "p99 ms", "Total s", "Octets", "Retries", "Throttles"):
+            table.add_column(col, justify="left" if col == "Opération" else "right")
+
+        with self.lock:
+            ops = sorted(self.ops.items(), key=lambda kv: -sum(kv[1]["latencies"]))
+            for (service, operation), op in ops:
+                lat = sorted(op["latencies"])
+                table.add_row(
+                    f"{service}.{operation}", str(len(lat)), str(op["errors"]),
+                    f"{percentile(lat, 50) * 1000:.1f}", f"{percentile(lat, 95) * 1000:.1f}",
+                    f"{percentile(lat, 99) * 1000:.1f}", f"{sum(lat):.2f}",
+                    f"{op['bytes']:,}", str(op["retries"]), str(op["throttles"]),
+                )
+        Console(file=out).print(table)
+
+    def write_timeline(self):
+        with self.lock:
+            with open(self.timeline, "w") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        print(f"Timeline des appels écrite dans {self.timeline}", file=sys.stderr)
+
+    def report(self):
+        if self.ops:
+            self.summary()
+        if self.timeline:
+            self.write_timeline()
+
+
+_recorder = None
+
+
+def enable(target=None):
+    """
+    Active l'instrumentation (idempotent). `target` : chemin de la timeline
+    Chrome trace, ou "1"/True/None pour le seul résumé.
+    """
+    import aws_local
+
+    global _recorder
+    if _recorder is not None:
+        return _recorder
+    timeline = target if isinstance(target, str) and target not in ("", "0", "1", "true", "yes") else None
+    _recorder = Recorder(timeline)
+    aws_local.register("before-call", _recorder.before_call)
+    aws_local.register("after-call", _recorder.after_call)
+    aws_local.register("needs-retry", _recorder.needs_retry)
+    atexit.register(_recorder.report)
+    return _recorder
+
+
+def add_argument(parser):
+    """Ajoute --trace-api [FICHIER] à un parser argparse."""
+    parser.add_argument("--trace-api", nargs="?", const="1", metavar="FICHIER",
+                        help="Mesure chaque appel d'API ; FICHIER reçoit une timeline Chrome trace")
+
+
+def setup(args):
+    """À appeler après parse_args() pour appliquer --trace-api."""
+    if getattr(args, "trace_api", None):
+        enable(args.trace_api)
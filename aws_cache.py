@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache local (SQLite) des résultats describe_* / list_*, partagé par les scripts.
+
+Chaque entrée est indexée par (compte, région, service, méthode, paramètres)
+et expire selon un TTL propre au type de ressource (TTLS). Exemples :
+
+    from aws_cache import cached
+    vols = cached(ec2, "describe_volumes", "Volumes")
+
+Variables d'environnement :
+    AWS_CACHE=0            désactive le cache
+    AWS_CACHE_DB=chemin    emplacement de la base (défaut ~/.cache/python-aws/inventory.sqlite)
+    AWS_CACHE_REFRESH=1    ignore les entrées existantes (équivalent de --refresh)
+
+En ligne de commande : aws_cache.py --stats | --clear [--service ec2] [--method describe_volumes]
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+import aws_local
+from aws_local import paginate
+
+DEFAULT_TTL = 300
+
+# TTL en secondes par méthode : ce qui bouge peu est gardé plus longtemps
+TTLS = {
+    "describe_instances": 300,
+    "describe_volumes": 300,
+    "describe_addresses": 300,
+    "describe_network_interfaces": 300,
+    "describe_snapshots": 900,
+    "describe_images": 3600,
+    "describe_security_groups": 600,
+    "describe_subnets": 3600,
+    "describe_vpcs": 3600,
+    "describe_route_tables": 1800,
+    "describe_internet_gateways": 3600,
+    "describe_network_acls": 1800,
+    "describe_load_balancers": 600,
+    "describe_target_groups": 600,
+    "list_buckets": 600,
+    "list_functions": 600,
+    "list_users": 900,
+    "list_roles": 900,
+}
+
+# Identité d'un périmètre (profil/section/endpoint) -> compte : ne change jamais
+ACCOUNT_TTL = 30 * 86400
+# Endpoint local sans STS : le libellé du périmètre sert d'identifiant, revérifié souvent
+FALLBACK_TTL = 3600
+
+_local = threading.local()
+_refresh = os.environ.get("AWS_CACHE_REFRESH", "") not in ("", "0")
+
+
+def enabled():
+    return os.environ.get("AWS_CACHE", "1") != "0"
+
+
+def set_refresh(value=True):
+    """Force le rechargement depuis l'API (les nouveaux résultats sont stockés)."""
+    global _refresh
+    _refresh = value
+
+
+def refreshing():
+    """Vrai si --refresh / AWS_CACHE_REFRESH est actif."""
+    return _refresh
+
+
+def db_path():
+    return os.path.expanduser(os.environ.get("AWS_CACHE_DB", "~/.cache/python-aws/inventory.sqlite"))
+
+
+def _db():
+    """Une connexion par thread (les connexions sqlite3 ne se partagent pas)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        path = db_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                account TEXT, region TEXT, service TEXT, method TEXT, params TEXT,
+                created REAL, expires REAL, data BLOB,
+                PRIMARY KEY (account, region, service, method, params)
+            )""")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, expires REAL, data BLOB)")
+        _local.conn = conn
+    return conn
+
+
+# --- Sérialisation (les datetime botocore doivent survivre à l'aller-retour) ---
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat()}
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return str(value)
+
+
+def _hook(obj):
+    if len(obj) == 1 and "__dt__" in obj:
+        return datetime.fromisoformat(obj["__dt__"])
+    return obj
+
+
+def dumps(value):
+    return zlib.compress(json.dumps(value, default=_default, separators=(",", ":")).encode())
+
+
+def loads(blob):
+    return json.loads(zlib.decompress(blob), object_hook=_hook)
+
+
+# --- Stockage clé/valeur générique ---
+
+def get(key):
+    """Valeur associée à `key`, ou None si absente/expirée."""
+    if not enabled():
+        return None
+    row = _db().execute("SELECT expires, data FROM kv WHERE key=?", (key,)).fetchone()
+    if row and (row[0] is None or row[0] > time.time()):
+        return loads(row[1])
+    return None
+
+
+def put(key, value, ttl=None):
+    """Stocke `value` ; ttl=None signifie sans expiration."""
+    if not enabled():
+        return
+    expires = time.time() + ttl if ttl is not None else None
+    _db().execute("INSERT OR REPLACE INTO kv VALUES (?,?,?)", (key, expires, dumps(value)))
+
+
+# --- Cache des appels d'API ---
+
+def scope(c):
+    """(profil, région, endpoint, section) du client tel que créé par aws_local."""
+    return getattr(c, "_aws_local_key", (None, c.meta.region_name, c.meta.endpoint_url, None))
+
+
+def _credentials_id(profile, region, section):
+    """Empreinte de la clé d'accès résolue (variables d'env, SSO, rôle d'instance...)."""
+    creds = aws_local.session(profile, region, section).get_credentials()
+    if creds is None or not creds.access_key:
+        return None
+    return hashlib.sha1(creds.access_key.encode()).hexdigest()[:16]
+
+
+def account_id(c):
+    """Identifiant du compte du client, résolu une fois puis mis en cache."""
+    profile, region, endpoint, section = scope(c)
+    label = f"{profile or section or 'default'}@{endpoint or 'aws'}"
+    key = f"account:{label}"
+    if not (profile or section):
+        # Sans profil ni section, les identifiants peuvent changer de compte
+        # d'un lancement à l'autre : l'entrée est liée à la clé d'accès, et
+        # rien n'est gardé si elle est inconnue
+        creds = _credentials_id(profile, region, section)
+        key = f"{key}:{creds}" if creds else None
+    account = get(key) if key else None
+    if account is None:
+        sts = aws_local.client("sts", profile=profile, region=region, endpoint=endpoint, section=section)
+        try:
+            account = sts.get_caller_identity()["Account"]
+            ttl = ACCOUNT_TTL
+        except (BotoCoreError, ClientError):
+            # Sur AWS, une erreur STS (throttling, SSO expiré...) est remontée
+            # plutôt que de ranger les entrées sous un faux compte
+            if not endpoint:
+                raise
+            # Endpoint sans STS (MinIO...) : le périmètre sert d'identifiant
+            account, ttl = label, FALLBACK_TTL
+        if key:
+            put(key, account, ttl=ttl)
+    return account
+
+
+def _params(kwargs):
+    return hashlib.sha1(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cached(c, method, key, ttl=None, refresh=None, **kwargs):
+    """
+    Équivalent de list(paginate(c, method, key, **kwargs)) avec cache SQLite.
+
+    ttl : durée de validité en secondes (défaut : TTLS[method]).
+    refresh : ignore l'entrée existante (défaut : --refresh / AWS_CACHE_REFRESH).
+    """
+    if not enabled():
+        return list(paginate(c, method, key, **kwargs))
+
+    ttl = TTLS.get(method, DEFAULT_TTL) if ttl is None else ttl
+    refresh = _refresh if refresh is None else refresh
+    ident = (account_id(c), c.meta.region_name or "", c.meta.service_model.service_name,
+             method, _params([key, kwargs]))
+    db = _db()
+    now = time.time()
+
+    if not refresh:
+        row = db.execute(
+            "SELECT data FROM entries WHERE account=? AND region=? AND service=? AND method=? AND params=? AND expires>?",
+            ident + (now,)).fetchone()
+        if row:
+            return loads(row[0])
+
+    items = list(paginate(c, method, key, **kwargs))
+    db.execute("INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?,?,?)",
+               ident + (now, now + ttl, dumps(items)))
+    return items
+
+
+def invalidate(service=None, method=None, account=None, region=None):
+    """Supprime les entrées correspondant aux critères donnés (toutes si aucun)."""
+    clauses, values = [], []
+    for column, value in (("service", service), ("method", method), ("account", account), ("region", region)):
+        if value:
+            clauses.append(f"{column}=?")
+            values.append(value)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return _db().execute(f"DELETE FROM entries{where}", values).rowcount
+
+
+def add_argument(parser):
+    """Ajoute --refresh à un parser argparse."""
+    parser.add_argument("--refresh", action="store_true", help="Ignore le cache local et recharge depuis l'API")
+
+
+def setup(args):
+    """À appeler après parse_args() pour appliquer --refresh."""
+    if getattr(args, "refresh", False):
+        set_refresh(True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestion du cache local d'inventaire AWS")
+    parser.add_argument("--stats", action="store_true", help="Affiche le contenu du cache")
+    parser.add_argument("--clear", action="store_true", help="Invalide des entrées")
+    parser.add_argument("--service", help="Filtre service (ec2, s3...)")
+    parser.add_argument("--method", help="Filtre méthode (describe_volumes...)")
+    args = parser.parse_args()
+
+    if args.clear:
+        n = invalidate(service=args.service, method=args.method)
+        print(f"{n} entrée(s) supprimée(s) de {db_path()}")
+        return
+
+    now = time.time()
+    rows = _db().execute(
+        "SELECT account, region, service, method, COUNT(*), SUM(LENGTH(data)), SUM(expires>?) "
+        "FROM entries GROUP BY account, region, service, method ORDER BY 1, 2, 3, 4", (now,)).fetchall()
+    if not rows:
+        print(f"Cache vide ({db_path()})")
+        return
+    for account, region, service, method, count, size, fresh in rows:
+        print(f"{account:<24} {region or '-':<16} {service:<10} {method:<32} {count:>4} entrées "
+              f"({fresh} valides, {size:,} octets)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
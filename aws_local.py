@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Fabrique de clients boto3 partagée par tous les scripts.
+
+Les sessions et les clients sont mis en cache par (profil, région, endpoint) :
+un même processus réutilise donc les credentials déjà résolus et les
+connexions HTTP déjà ouvertes, y compris depuis plusieurs threads.
+
+Les endpoints "locaux" (MinIO, LocalStack...) sont décrits dans aws_s3.ini :
+
+    [pepiniere]
+    endpoint=http://minio:9000
+    access_key_id=...
+    access_key_secret=...
+    region=eu-west-3
+    max_pool_connections=64
+
+La section utilisée est passée explicitement (section="pepiniere") ou via la
+variable d'environnement AWS_LOCAL_SECTION. Sans section, on parle à AWS avec
+le profil courant (AWS_PROFILE).
+"""
+
+import os
+import weakref
+import threading
+import configparser
+
+import boto3
+from botocore.config import Config
+
+import aws_throttle
+
+DEFAULT_POOL_SIZE = 50
+
+_lock = threading.RLock()
+_sessions = {}
+_clients = {}
+# Ressources par thread : le cache disparaît avec son thread
+_local = threading.local()
+# Clients des ressources vivantes, pour que register() les atteigne
+_resource_clients = weakref.WeakSet()
+# Incrémenté par clear() pour invalider les caches des autres threads
+_generation = 0
+_hooks = []
+_ini = None
+
+
+def _ini_path():
+    path = os.environ.get("AWS_LOCAL_INI")
+    if path:
+        return os.path.expanduser(path)
+    local = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aws_s3.ini")
+    if os.path.exists(local):
+        return local
+    return os.path.expanduser("~/.aws_s3.ini")
+
+
+def load_ini():
+    """Lit (une seule fois) le fichier aws_s3.ini."""
+    global _ini
+    with _lock:
+        if _ini is None:
+            _ini = configparser.ConfigParser()
+            _ini.read(_ini_path())
+        return _ini
+
+
+def get_section(section=None):
+    """Retourne la configuration de la section demandée (ou {} si aucune)."""
+    section = section or os.environ.get("AWS_LOCAL_SECTION")
+    if not section:
+        return {}
+    ini = load_ini()
+    if not ini.has_section(section):
+        raise KeyError(f"Section '{section}' absente de {_ini_path()}")
+    return dict(ini.items(section))
+
+
+def _pool_size(conf):
+    value = conf.get("max_pool_connections") or os.environ.get("AWS_MAX_POOL_CONNECTIONS")
+    return int(value) if value else DEFAULT_POOL_SIZE
+
+
+def _resolve(profile=None, region=None, endpoint=None, section=None):
+    """Normalise les paramètres de connexion en une clé de cache."""
+    conf = get_section(section)
+    if not conf and profile is None:
+        profile = os.environ.get("AWS_PROFILE")
+    region = region or conf.get("region")
+    endpoint = endpoint or conf.get("endpoint")
+    return conf, (profile, region, endpoint, section or os.environ.get("AWS_LOCAL_SECTION"))
+
+
+def session(profile=None, region=None, section=None):
+    """Session boto3 partagée pour (profil, région, section)."""
+    conf, (profile, region, _, section) = _resolve(profile, region, None, section)
+    key = (profile, region, section)
+    with _lock:
+        sess = _sessions.get(key)
+        if sess is None:
+            kwargs = {}
+            if profile:
+                kwargs["profile_name"] = profile
+            if region:
+                kwargs["region_name"] = region
+            if conf.get("access_key_id"):
+                kwargs["aws_access_key_id"] = conf["access_key_id"]
+                kwargs["aws_secret_access_key"] = conf.get("access_key_secret")
+            sess = boto3.Session(**kwargs)
+            # Les clients copient les handlers de leur session à la création
+            for event, handler in _hooks:
+                sess.events.register(event, handler)
+            _sessions[key] = sess
+        return sess
+
+
+def client_config(conf=None, **overrides):
+    """
+    Configuration botocore commune : pool de connexions, keep-alive, retries.
+
+    Le débit est limité par aws_throttle : les retries restent en mode
+    "standard" pour ne pas empiler le seau "adaptive" de botocore sur le
+    sien. Sans limiteur (AWS_THROTTLE=0), on retombe sur "adaptive".
+    """
+    conf = conf or {}
+    mode = "standard" if aws_throttle.enabled() else "adaptive"
+    params = {
+        "max_pool_connections": _pool_size(conf),
+        "tcp_keepalive": True,
+        "retries": {"max_attempts": 10, "mode": os.environ.get("AWS_RETRY_MODE", mode)},
+    }
+    params.update(overrides)
+    return Config(**params)
+
+
+def client(service, profile=None, region=None, endpoint=None, section=None):
+    """
+    Retourne un client boto3 mis en cache.
+
+    Les clients botocore sont thread-safe : le même objet peut être partagé
+    par tous les workers d'un pool.
+    """
+    conf, key = _resolve(profile, region, endpoint, section)
+    key = (service,) + key
+    with _lock:
+        c = _clients.get(key)
+        if c is None:
+            sess = session(profile, region, section)
+            kwargs = {"config": client_config(conf)}
+            if key[3]:
+                kwargs["endpoint_url"] = key[3]
+            c = sess.client(service, **kwargs)
+            # Périmètre de connexion, utilisé par aws_cache pour indexer les résultats
+            c._aws_local_key = key[1:]
+            aws_throttle.attach(c, (key[1], key[3], key[4]))
+            _clients[key] = c
+        return c
+
+
+def resource(service, profile=None, region=None, endpoint=None, section=None):
+    """
+    Retourne une ressource boto3 mise en cache par thread.
+
+    Contrairement aux clients, les ressources boto3 ne sont pas thread-safe.
+    """
+    conf, key = _resolve(profile, region, endpoint, section)
+    key = (service,) + key
+    if getattr(_local, "generation", None) != _generation:
+        _local.resources = {}
+        _local.generation = _generation
+    r = _local.resources.get(key)
+    if r is None:
+        with _lock:
+            sess = session(profile, region, section)
+            kwargs = {"config": client_config(conf)}
+            if key[3]:
+                kwargs["endpoint_url"] = key[3]
+            r = sess.resource(service, **kwargs)
+            r.meta.client._aws_local_key = key[1:]
+            aws_throttle.attach(r.meta.client, (key[1], key[3], key[4]))
+            _resource_clients.add(r.meta.client)
+        _local.resources[key] = r
+    return r
+
+
+def register(event, handler):
+    """
+    Branche un handler d'événement botocore sur tous les clients de la fabrique,
+    existants comme futurs (ex. register("before-call", compteur)).
+    """
+    with _lock:
+        _hooks.append((event, handler))
+        for sess in _sessions.values():
+            sess.events.register(event, handler)
+        # Les clients déjà créés ont leur propre copie de l'émetteur
+        for c in _clients.values():
+            c.meta.events.register(event, handler)
+        for c in _resource_clients:
+            c.meta.events.register(event, handler)
+
+
+def clear():
+    """Vide les caches (sessions, clients, ressources)."""
+    global _ini, _generation
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
+        _resource_clients.clear()
+        _generation += 1
+        _ini = None
+
+
+# --- Pagination ----------------------------------------------------------
+
+# (clé de la réponse, paramètre de la requête suivante)
+_TOKENS = [
+    ("NextToken", "NextToken"),
+    ("NextContinuationToken", "ContinuationToken"),
+    ("NextMarker", "Marker"),
+    ("NextPageToken", "NextPageToken"),
+]
+
+
+def _next_token(response):
+    for resp_key, req_key in _TOKENS:
+        if response.get(resp_key):
+            return req_key, response[resp_key]
+    # IAM : le marqueur s'appelle "Marker" et n'a de sens que si IsTruncated
+    if response.get("IsTruncated") and response.get("Marker"):
+        return "Marker", response["Marker"]
+    return None, None
+
+
+def pages(c, method, **kwargs):
+    """
+    Itère paresseusement sur toutes les pages d'un appel d'API.
+
+    Utilise le paginator botocore quand il existe, sinon suit à la main les
+    jetons NextToken / Marker / ContinuationToken / NextPageToken.
+    """
+    if c.can_paginate(method):
+        yield from c.get_paginator(method).paginate(**kwargs)
+        return
+
+    call = getattr(c, method)
+    seen = set()
+    while True:
+        response = call(**kwargs)
+        yield response
+        req_key, token = _next_token(response)
+        if not token or token in seen:
+            return
+        seen.add(token)
+        kwargs[req_key] = token
+
+
+def _extract(data, path):
+    """Déplie un chemin du type "Reservations[].Instances[]"."""
+    if not path:
+        yield data
+        return
+    head, _, rest = path.partition(".")
+    flatten = head.endswith("[]")
+    value = data.get(head[:-2] if flatten else head) if isinstance(data, dict) else None
+    if value is None:
+        return
+    if flatten:
+        for item in value:
+            yield from _extract(item, rest)
+    else:
+        yield from _extract(value, rest)
+
+
+def paginate(c, method, key, **kwargs):
+    """
+    Générateur des éléments `key` de toutes les pages d'un appel d'API.
+
+    `key` accepte les listes imbriquées : paginate(ec2, "describe_instances",
+    "Reservations[].Instances[]") retourne directement les instances. Une seule
+    page est gardée en mémoire à la fois.
+    """
+    if not key.endswith("[]"):
+        key += "[]"
+    for page in pages(c, method, **kwargs):
+        yield from _extract(page, key)
+
+
+# Instrumentation activée par variable d'environnement (voir aws_apitrace)
+if os.environ.get("AWS_TRACE_API", "").lower() not in ("", "0", "false", "no"):
+    import aws_apitrace
+    aws_apitrace.enable(os.environ["AWS_TRACE_API"])
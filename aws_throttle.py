@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Limiteur de débit partagé par tous les clients aws_local.
+
+Un seau à jetons par (compte, région, service) est commun à tous les clients
+et ressources du processus : N workers qui interrogent EC2 dans la même
+région se partagent le même débit au lieu de se déclencher chacun des
+erreurs de throttling.
+
+Le débit s'ajuste tout seul (AIMD) : chaque réponse réussie l'augmente un
+peu, chaque Throttling/RequestLimitExceeded le divise par deux. Les retries
+eux-mêmes restent confiés à botocore, en mode "standard" : le mode
+"adaptive" ajouterait son propre seau et limiterait chaque appel deux fois.
+
+Le compte est approché par le périmètre de connexion aws_local (profil,
+endpoint, section) : aucune résolution STS n'est faite ici.
+
+    AWS_THROTTLE=0          désactive le limiteur
+    AWS_THROTTLE_RATE=30    débit initial (requêtes/s) pour tous les services
+"""
+
+import os
+import time
+import threading
+
+THROTTLE_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+    "TooManyRequestsException", "RequestLimitExceeded", "SlowDown", "RequestThrottled",
+    "ProvisionedThroughputExceededException", "BandwidthLimitExceeded", "PriorRequestNotComplete",
+}
+
+# Débit initial (requêtes/s) et rafale par service, proches des quotas publiés
+RATES = {
+    "ec2": (20, 100),
+    "iam": (10, 20),
+    "sts": (20, 50),
+    "ce": (5, 5),
+    "elasticloadbalancing": (10, 40),
+    "s3": (500, 1000),
+}
+DEFAULT_RATE = (50, 100)
+
+MIN_RATE = 0.5
+# Le débit ne dépasse pas ce multiple du débit initial
+MAX_FACTOR = 10
+# Une seule réduction par fenêtre : une rafale de throttles concurrents ne
+# doit diviser le débit qu'une fois
+DECREASE_COOLDOWN = 1.0
+
+
+class Bucket:
+    """Seau à jetons à débit ajusté par AIMD ; partagé entre threads."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.max_rate = float(rate) * MAX_FACTOR
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.last_decrease = 0.0
+        self.throttles = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        """Réserve un jeton et attend (hors verrou) qu'il soit disponible."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def success(self):
+        # Augmentation additive : environ +1 req/s par seconde de trafic réussi
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+
+    def throttled(self):
+        now = time.monotonic()
+        with self.lock:
+            self.throttles += 1
+            if now - self.last_decrease < DECREASE_COOLDOWN:
+                return
+            self.last_decrease = now
+            self.rate = max(MIN_RATE, self.rate / 2)
+            # Les jetons en avance sont perdus : on repart du nouveau débit
+            self._refill(now)
+            self.tokens = min(self.tokens, 0)
+
+
+_lock = threading.Lock()
+_buckets = {}
+
+
+def enabled():
+    return os.environ.get("AWS_THROTTLE", "1") not in ("0", "false", "no")
+
+
+def bucket(scope, region, service):
+    """Seau partagé pour un périmètre aws_local, une région et un service."""
+    key = (scope, region, service)
+    with _lock:
+        b = _buckets.get(key)
+        if b is None:
+            rate, burst = RATES.get(service, DEFAULT_RATE)
+            if os.environ.get("AWS_THROTTLE_RATE"):
+                rate = float(os.environ["AWS_THROTTLE_RATE"])
+            b = _buckets[key] = Bucket(rate, burst)
+        return b
+
+
+class Limiter:
+    """Handlers botocore branchant un client sur son seau."""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def before_send(self, **kwargs):
+        # Appelé à chaque tentative HTTP, retries compris
+        self.bucket.acquire()
+
+    def needs_retry(self, response=None, **kwargs):
+        if response and isinstance(response[1], dict):
+            if response[1].get("Error", {}).get("Code") in THROTTLE_CODES:
+                self.bucket.throttled()
+            elif response[0] is not None and response[0].status_code < 400:
+                self.bucket.success()
+        return None
+
+
+def attach(c, scope):
+    """
+    Branche le client `c` sur le seau de (scope, région, service).
+    `scope` : (profil, endpoint, section), tel que vu par aws_local.
+    """
+    if not enabled():
+        return c
+    service = c.meta.service_model.endpoint_prefix
+    limiter = Limiter(bucket(scope, c.meta.region_name, service))
+    c.meta.events.register("before-send", limiter.before_send)
+    c.meta.events.register("needs-retry", limiter.needs_retry)
+    return c
+
+
+def stats():
+    """{(scope, région, service): (débit courant, nombre de throttles)}"""
+    with _lock:
+        return {k: (round(b.rate, 2), b.throttles) for k, b in _buckets.items()}
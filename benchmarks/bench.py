@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks hors ligne des scripts sur un compte synthétique.
+
+Un serveur moto local (pip install "moto[server]") est démarré puis peuplé
+selon un preset ou des tailles explicites ; chaque benchmark s'exécute
+ensuite dans un processus séparé et mesure le temps écoulé, le nombre
+d'appels d'API et le pic de mémoire (RSS).
+
+    ./bench.py --preset small                   # mesure et compare à baseline.json
+    ./bench.py --preset small --save-baseline   # enregistre la référence
+    ./bench.py --instances 10000 --snapshots 50000 --sgs 5000 --keys 1000000
+
+Code retour 1 si un benchmark échoue (y compris un collecteur get_orphans
+en erreur) ou si une régression dépasse --tolerance par rapport à la référence.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import resource
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+PRESETS = {
+    "tiny": {"instances": 20, "volumes": 20, "snapshots": 50, "sgs": 10, "users": 5, "roles": 5, "buckets": 1, "keys": 500},
+    "small": {"instances": 500, "volumes": 300, "snapshots": 2000, "sgs": 200, "users": 50, "roles": 100, "buckets": 2, "keys": 20000},
+    "large": {"instances": 10000, "volumes": 5000, "snapshots": 50000, "sgs": 5000, "users": 500, "roles": 2000, "buckets": 1, "keys": 1000000},
+}
+
+REGION = "us-east-1"
+SECTION = "bench"
+
+
+# --- Environnement local ------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(port):
+    from moto.server import ThreadedMotoServer
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    while True:
+        time.sleep(3600)
+
+
+def start_moto(port):
+    """Serveur moto dans un processus dédié, pour ne pas fausser les mesures."""
+    try:
+        import moto.server  # noqa: F401
+    except ImportError:
+        sys.exit('moto est requis : pip install "moto[server]"')
+    proc = multiprocessing.Process(target=_serve, args=(port,), daemon=True)
+    proc.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    sys.exit("Le serveur moto n'a pas démarré")
+
+
+def configure(endpoint):
+    """Fait pointer aws_local vers moto via une section d'ini temporaire."""
+    ini = os.path.join(tempfile.mkdtemp(prefix="bench-"), "aws_s3.ini")
+    with open(ini, "w") as f:
+        f.write(f"[{SECTION}]\nendpoint={endpoint}\naccess_key_id=testing\n"
+                f"access_key_secret=testing\nregion={REGION}\n")
+    os.environ.update({
+        "AWS_LOCAL_INI": ini,
+        "AWS_LOCAL_SECTION": SECTION,
+        "AWS_CACHE": "0",
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": REGION,
+    })
+
+
+# --- Peuplement ---------------------------------------------------------------
+
+def seed(sizes, workers=32):
+    from aws_local import client
+    ec2, s3, iam = client("ec2"), client("s3"), client("iam")
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    remaining = sizes["instances"]
+    while remaining > 0:
+        n = min(remaining, 1000)
+        ec2.run_instances(ImageId="ami-12c6146b", MinCount=n, MaxCount=n, InstanceType="t3.micro")
+        remaining -= n
+
+    vpc_id = ec2.describe_vpcs()["Vpcs"][0]["VpcId"]
+    list(pool.map(lambda i: ec2.create_security_group(GroupName=f"bench-{i}", Description="bench", VpcId=vpc_id),
+                  range(sizes["sgs"])))
+
+    # Des volumes dont la moitié sera supprimée : leurs snapshots deviennent orphelins
+    vols = list(pool.map(lambda i: ec2.create_volume(Size=8, AvailabilityZone=f"{REGION}a")["VolumeId"],
+                         range(sizes["volumes"])))
+    if vols:
+        list(pool.map(lambda i: ec2.create_snapshot(VolumeId=vols[i % len(vols)]), range(sizes["snapshots"])))
+        list(pool.map(lambda v: ec2.delete_volume(VolumeId=v), vols[::2]))
+
+    list(pool.map(lambda i: iam.create_user(UserName=f"bench-user-{i}"), range(sizes["users"])))
+    trust = json.dumps({"Version": "2012-10-17", "Statement": [
+        {"Effect": "Allow", "Principal": {"Service": "ec2.amazonaws.com"}, "Action": "sts:AssumeRole"}]})
+    list(pool.map(lambda i: iam.create_role(RoleName=f"bench-role-{i}", AssumeRolePolicyDocument=trust),
+                  range(sizes["roles"])))
+
+    for b in range(sizes["buckets"]):
+        bucket = f"bench-{b}"
+        s3.create_bucket(Bucket=bucket)
+        list(pool.map(lambda i: s3.put_object(Bucket=bucket, Key=f"p{i % 16:02d}/obj-{i:08d}", Body=b""),
+                      range(sizes["keys"])))
+    pool.shutdown()
+
+
+# --- Benchmarks (exécutés dans un processus enfant) -----------------------------
+
+def bench_get_orphans():
+    import get_orphans
+    results, errors = get_orphans.scan([None], [None])
+    # Un collecteur en erreur mesurerait un inventaire incomplet
+    if errors:
+        raise RuntimeError(f"{len(errors)} collecteur(s) en erreur : {errors}")
+    return results
+
+
+def bench_get_costs():
+    import get_costs
+    from aws_local import client
+    return get_costs.get_orphans(client("ec2"))
+
+
+def bench_list_services():
+    import list_services
+    return list_services.get_inventory()
+
+
+def bench_get_iam():
+    import get_iam
+    from aws_local import client
+    return get_iam.get_principals(client("iam"))
+
+
+def bench_crawl_s3_buckets():
+    import crawl_s3_buckets
+    from aws_local import client, paginate
+    s3 = client("s3")
+    totals = crawl_s3_buckets.Totals()
+    for b in paginate(s3, "list_buckets", "Buckets"):
+        for _ in crawl_s3_buckets.crawl(s3, b["Name"], totals=totals):
+            pass
+    return totals.count
+
+
+BENCHMARKS = {
+    "get_orphans": bench_get_orphans,
+    "get_costs": bench_get_costs,
+    "list_services": bench_list_services,
+    "get_iam": bench_get_iam,
+    "crawl_s3_buckets": bench_crawl_s3_buckets,
+}
+
+
+def reset_peak_rss():
+    """
+    Remet le pic de RSS du processus à sa RSS courante. ru_maxrss survit à
+    fork et exec : sans cela l'enfant hériterait du pic du peuplement.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Pic de RSS (octets) depuis le dernier reset_peak_rss()."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Hors Linux : ru_maxrss, pic depuis le démarrage (Ko sous Linux, octets sous macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_one(name):
+    """Exécute un benchmark et imprime ses mesures en JSON sur stdout."""
+    import aws_local
+    calls = [0]
+
+    def count(**kwargs):
+        calls[0] += 1
+
+    aws_local.register("before-call", count)
+
+    if not reset_peak_rss():
+        print("Pic de RSS non réinitialisable : mesure approchée", file=sys.stderr)
+    start = time.perf_counter()
+    BENCHMARKS[name]()
+    wall = time.perf_counter() - start
+    rss = peak_rss()
+    print(json.dumps({"wall": round(wall, 3), "calls": calls[0], "rss": rss}))
+
+
+# --- Comparaison ----------------------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    """Liste des régressions (temps/mémoire au-delà de la tolérance, appels en hausse)."""
+    regressions = []
+    for name, r in results.items():
+        ref = baseline.get(name)
+        if not ref:
+            continue
+        if r["wall"] > ref["wall"] * (1 + tolerance):
+            regressions.append(f"{name}: temps {ref['wall']}s -> {r['wall']}s")
+        if r["calls"] > ref["calls"]:
+            regressions.append(f"{name}: appels API {ref['calls']} -> {r['calls']}")
+        if r["rss"] > ref["rss"] * (1 + tolerance):
+            regressions.append(f"{name}: RSS {ref['rss'] // 2**20} Mo -> {r['rss'] // 2**20} Mo")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne sur un compte synthétique (moto)")
+    parser.add_argument("--preset", choices=PRESETS, default="small", help="Taille du compte (défaut: %(default)s)")
+    for key in PRESETS["small"]:
+        parser.add_argument(f"--{key}", type=int, help=f"Remplace la valeur du preset pour {key}")
+    parser.add_argument("-b", "--bench", action="append", choices=BENCHMARKS, help="Benchmarks à lancer (défaut: tous)")
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"), help="Fichier de référence")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistre les mesures comme référence")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Marge tolérée sur temps et RSS (défaut: %(default)s)")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one)
+        return
+
+    sizes = dict(PRESETS[args.preset])
+    sizes.update({k: getattr(args, k) for k in sizes if getattr(args, k) is not None})
+
+    port = free_port()
+    server = start_moto(port)
+    configure(f"http://127.0.0.1:{port}")
+
+    try:
+        print(f"Peuplement : {sizes}", file=sys.stderr)
+        t0 = time.perf_counter()
+        seed(sizes)
+        print(f"Peuplé en {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+        results, failed = {}, []
+        for name in args.bench or BENCHMARKS:
+            out = subprocess.run([sys.executable, __file__, "--run-one", name],
+                                 capture_output=True, text=True, env=os.environ)
+            if out.returncode:
+                print(f"{name}: ÉCHEC\n{out.stderr}", file=sys.stderr)
+                failed.append(name)
+                continue
+            results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+            r = results[name]
+            print(f"{name:<18} {r['wall']:>8.3f}s {r['calls']:>7} appels {r['rss'] // 2**20:>6} Mo")
+    finally:
+        server.terminate()
+
+    key = "/".join(f"{k}={v}" for k, v in sorted(sizes.items()))
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+
+    if failed:
+        # Une référence ou une comparaison partielle masquerait l'échec
+        sys.exit(f"Benchmarks en échec : {', '.join(failed)}")
+
+    if args.save_baseline:
+        stored[key] = results
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return
+
+    if key not in stored:
+        print("Aucune référence pour ces tailles (--save-baseline pour en créer une)")
+        return
+    regressions = compare(results, stored[key], args.tolerance)
+    for r in regressions:
+        print(f"RÉGRESSION {r}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,66 @@
 #!/usr/bin/env python3
-from aws_local import client
+import os
+import sys
+import csv
+import json
+import argparse
+import aws_apitrace
+from datetime import datetime, timezone
+from aws_local import client, paginate
 from rich.table import Table, box
 from rich.console import Console
 import humanize
 
 console = Console()
+err_console = Console(stderr=True)
 
-# --- Créer le client S3 ---
-s3 = client("s3")
+FIELDS = ["Bucket", "Key", "Size", "LastModified", "StorageClass"]
 
-# --- Lister les buckets ---
-buckets = s3.list_buckets().get("Buckets", [])
+class Totals:
+    """Totaux maintenus au fil du flux (aucun objet n'est conservé)."""
 
-for bucket in buckets:
-    bucket_name = bucket["Name"]
-    total_size = 0
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
 
-    # Lister les objets du bucket
-    response = s3.list_objects_v2(Bucket=bucket_name)
-    objects = response.get("Contents", [])
+    def add(self, size):
+        self.count += 1
+        self.bytes += size
 
+    def __str__(self):
+        return (f"{self.count:,} objets, {self.bytes:,} octets "
+                f"({humanize.naturalsize(self.bytes, binary=True)})")
+
+def parse_date(value):
+    """Date ISO (2024-01-31 ou 2024-01-31T12:00:00), UTC si pas de fuseau."""
+    d = datetime.fromisoformat(value)
+    return d if d.tzinfo else d.replace(tzinfo=timezone.utc)
+
+def crawl(s3, bucket, prefix="", min_size=0, modified_since=None, totals=None):
+    """
+    Générateur des objets d'un bucket, page par page, filtrés à la volée.
+
+    Le préfixe est appliqué côté serveur, la taille et la date côté client.
+    """
+    for obj in paginate(s3, "list_objects_v2", "Contents", Bucket=bucket, Prefix=prefix):
+        if obj["Size"] < min_size:
+            continue
+        if modified_since and obj["LastModified"] < modified_since:
+            continue
+        if totals is not None:
+            totals.add(obj["Size"])
+        yield obj
+
+def row(bucket, obj):
+    return {
+        "Bucket": bucket,
+        "Key": obj["Key"],
+        "Size": obj["Size"],
+        "LastModified": obj["LastModified"].isoformat(),
+        "StorageClass": obj.get("StorageClass", "STANDARD"),
+    }
+
+def print_table(bucket_name, objects, totals):
     table = Table(title=f"Bucket: {bucket_name}", box=box.SIMPLE_HEAVY, show_lines=False)
     table.add_column("Key", style="white", justify="center")
     table.add_column("Size", style="white", justify="right")
@@ -27,18 +68,62 @@ for bucket in buckets:
     table.add_column("Storage Class", style="yellow")
 
     for obj in objects:
-        key = obj["Key"]
-        size = obj["Size"]
-        lastmod = str(obj["LastModified"])
-        storage = obj.get("StorageClass", "STANDARD")
-        table.add_row(key, f"{size:,}", lastmod, storage)
-        total_size += size
+        table.add_row(obj["Key"], f"{obj['Size']:,}", str(obj["LastModified"]), obj.get("StorageClass", "STANDARD"))
 
     table.caption = (
-        f"Taille totale : {total_size:,} octets "
-        f"({humanize.naturalsize(total_size, binary=True)})"
+        f"Taille totale : {totals.bytes:,} octets "
+        f"({humanize.naturalsize(totals.bytes, binary=True)})"
     )
 
     console.print(table)
     console.print()
 
+def main():
+    parser = argparse.ArgumentParser(description="Parcourt le contenu des buckets S3")
+    parser.add_argument("buckets", nargs="*", help="Buckets à parcourir (défaut: tous)")
+    parser.add_argument("-f", "--format", choices=["table", "ndjson", "csv"], default="table",
+                        help="table (défaut) ou sortie en flux ndjson/csv sur stdout")
+    parser.add_argument("--prefix", default="", help="Ne lister que les clés sous ce préfixe")
+    parser.add_argument("--min-size", type=int, default=0, help="Taille minimale en octets")
+    parser.add_argument("--modified-since", type=parse_date, help="Date ISO de dernière modification minimale")
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    aws_apitrace.setup(args)
+
+    s3 = client("s3")
+    buckets = args.buckets or [b["Name"] for b in paginate(s3, "list_buckets", "Buckets")]
+    grand_total = Totals()
+
+    writer = None
+    if args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+        writer.writeheader()
+
+    for bucket_name in buckets:
+        totals = Totals()
+        objects = crawl(s3, bucket_name, args.prefix, args.min_size, args.modified_since, totals)
+
+        if args.format == "table":
+            print_table(bucket_name, objects, totals)
+        else:
+            for obj in objects:
+                if writer:
+                    writer.writerow(row(bucket_name, obj))
+                else:
+                    sys.stdout.write(json.dumps(row(bucket_name, obj), ensure_ascii=False) + "\n")
+            err_console.print(f"{bucket_name} : {totals}")
+
+        grand_total.count += totals.count
+        grand_total.bytes += totals.bytes
+
+    if args.format != "table":
+        err_console.print(f"[bold]Total[/] : {grand_total}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # Sortie coupée par le consommateur (head, jq...) : stdout pointe sur
+        # /dev/null pour que le flush final à la sortie n'échoue pas à nouveau
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import aws_apitrace
 from botocore.exceptions import ClientError
 from aws_local import client
 
@@ -13,7 +14,9 @@ def main():
         required=True,
         help="Nom de l'utilisateur IAM à créer"
     )
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_apitrace.setup(args)
     user_name = args.user
 
     # Création du client IAM
@@ -1,14 +1,27 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import boto3
 import argparse
+import aws_apitrace
 import os
 import sys
-from datetime import datetime, timedelta, timezone
+import json
+import hashlib
+from array import array
+from datetime import date, datetime, timedelta, timezone
 from rich.console import Console
 from rich.table import Table
 from rich.box import SIMPLE_HEAVY
+import aws_local
+import aws_cache
+from aws_cache import cached
+from get_orphans import existing_volume_ids
+
+try:
+    import numpy as np
+except ImportError:
+    # Repli sur des boucles Python sur les array.array (plus lent, même résultat)
+    np = None
 
 # --- CONFIGURATION ---
 FALLBACK_PRICES = {
@@ -18,19 +31,125 @@ FALLBACK_PRICES = {
     "ALB": 16.42
 }
 
+# --- Cache Cost Explorer ---
+# Chaque requête CE est facturée : les résultats sont gardés dans aws_cache.
+# Une période terminée depuis plus de SETTLE_DAYS ne bouge plus et est gardée
+# indéfiniment ; les plus récentes expirent après OPEN_TTL.
+SETTLE_DAYS = 3
+OPEN_TTL = 6 * 3600
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+def next_month(d):
+    return (d.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def ce_fetch(ce, method, start, end, granularity, **query):
+    """
+    Toutes les pages d'une requête CE. Les groupes d'une même période peuvent
+    être répartis sur plusieurs pages : ils sont fusionnés.
+    """
+    periods = {}
+    kwargs = dict(query, TimePeriod={'Start': start.isoformat(), 'End': end.isoformat()}, Granularity=granularity)
+    for page in aws_local.pages(ce, method, **kwargs):
+        for p in page.get('ResultsByTime', []):
+            cur = periods.setdefault(p['TimePeriod']['Start'], dict(p, Groups=[]))
+            cur['Groups'].extend(p.get('Groups', []))
+    return periods
+
+def _ce_key(account, method, granularity, query, start):
+    shape = hashlib.sha1(json.dumps(query, sort_keys=True).encode()).hexdigest()[:16]
+    return f"ce:{account}:{method}:{granularity}:{shape}:{start.isoformat()}"
+
+def _cached_periods(ce, method, granularity, bounds, query, today):
+    """
+    Une période CE par borne (début, fin) de `bounds`, contiguës. Les bornes
+    absentes du cache sont demandées par plages consécutives (une requête par
+    trou), puis stockées une par une. Cache désactivé : tout est demandé à CE.
+    """
+    # Compte résolu une fois pour toutes les bornes (sans cache, chaque
+    # résolution serait un appel STS)
+    enabled = aws_cache.enabled()
+    account = aws_cache.account_id(ce) if enabled else None
+    refresh = aws_cache.refreshing() or not enabled
+    found, missing = {}, []
+    for b in bounds:
+        hit = None if refresh else aws_cache.get(_ce_key(account, method, granularity, query, b[0]))
+        if hit is None:
+            missing.append(b)
+        else:
+            found[b] = hit
+
+    runs = []
+    for b in missing:
+        if runs and runs[-1][-1][1] == b[0]:
+            runs[-1].append(b)
+        else:
+            runs.append([b])
+    for run in runs:
+        fetched = ce_fetch(ce, method, run[0][0], run[-1][1], granularity, **query)
+        for start, end in run:
+            p = fetched.get(start.isoformat()) or {
+                'TimePeriod': {'Start': start.isoformat(), 'End': end.isoformat()},
+                'Total': {}, 'Groups': [], 'Estimated': True}
+            if enabled:
+                ttl = None if end + timedelta(days=SETTLE_DAYS) <= today else OPEN_TTL
+                aws_cache.put(_ce_key(account, method, granularity, query, start), p, ttl=ttl)
+            found[(start, end)] = p
+    return [found[b] for b in bounds]
+
+def _add_metrics(acc, metrics):
+    for name, m in metrics.items():
+        cur = acc.setdefault(name, {'Amount': '0', 'Unit': m.get('Unit')})
+        cur['Amount'] = str(float(cur['Amount']) + float(m['Amount']))
+
+def _merge_periods(periods, start, end):
+    """Somme de périodes quotidiennes en une seule (mois en cours)."""
+    total, groups = {}, {}
+    for p in periods:
+        _add_metrics(total, p.get('Total', {}))
+        for g in p.get('Groups', []):
+            _add_metrics(groups.setdefault(tuple(g['Keys']), {}), g['Metrics'])
+    return {'TimePeriod': {'Start': start.isoformat(), 'End': end.isoformat()}, 'Total': total,
+            'Groups': [{'Keys': list(k), 'Metrics': m} for k, m in groups.items()], 'Estimated': True}
+
+def ce_query(ce, granularity, start, end, method='get_cost_and_usage', **query):
+    """
+    Équivalent de ResultsByTime pour [start, end), toutes pages suivies, avec cache.
+
+    DAILY : un jour par entrée de cache.
+    MONTHLY : les mois clos sont demandés tels quels et gardés indéfiniment ;
+    le mois ouvert est reconstitué à partir des jours, pour ne redemander
+    que les jours récents.
+    """
+    today = utc_today()
+    # Pas de données pour les jours futurs
+    end = min(end, today + timedelta(days=1))
+    if granularity == 'DAILY':
+        days = [(start + timedelta(days=i), start + timedelta(days=i + 1)) for i in range((end - start).days)]
+        return _cached_periods(ce, method, 'DAILY', days, query, today)
+
+    months, d = [], start.replace(day=1)
+    while d < end:
+        months.append((d, next_month(d)))
+        d = next_month(d)
+    closed = [m for m in months if m[1] + timedelta(days=SETTLE_DAYS) <= today]
+    result = dict(zip(closed, _cached_periods(ce, method, 'MONTHLY', closed, query, today)))
+    for m_start, m_end in months[len(closed):]:
+        daily = ce_query(ce, 'DAILY', m_start, min(m_end, end), method, **query)
+        result[(m_start, m_end)] = _merge_periods(daily, m_start, m_end)
+    return [result[m] for m in months]
+
 def get_unit_costs(ce_client):
     """Récupère les prix réels du client pour l'affichage des gains potentiels."""
     prices = {"EBS": (FALLBACK_PRICES["EBS_GB"], True), "SNAP": (FALLBACK_PRICES["SNAP_GB"], True)}
     try:
-        today = datetime.now(timezone.utc).date()
-        start = (today - timedelta(days=32)).replace(day=1).isoformat()
-        end = today.replace(day=1).isoformat()
-        r = ce_client.get_cost_and_usage(
-            TimePeriod={'Start': start, 'End': end},
-            Granularity='MONTHLY', Metrics=['UnblendedCost', 'UsageQuantity'],
-            GroupBy=[{'Type': 'DIMENSION', 'Key': 'USAGE_TYPE'}]
-        )
-        for group in r.get('ResultsByTime', [])[0].get('Groups', []):
+        end = utc_today().replace(day=1)
+        start = (end - timedelta(days=1)).replace(day=1)
+        periods = ce_query(ce_client, 'MONTHLY', start, end,
+                           Metrics=['UnblendedCost', 'UsageQuantity'],
+                           GroupBy=[{'Type': 'DIMENSION', 'Key': 'USAGE_TYPE'}])
+        for group in (g for p in periods for g in p.get('Groups', [])):
             utype, cost, qty = group['Keys'][0], float(group['Metrics']['UnblendedCost']['Amount']), float(group['Metrics']['UsageQuantity']['Amount'])
             if qty > 0:
                 if "EBS:VolumeUsage" in utype: prices["EBS"] = (cost/qty, False)
@@ -38,36 +157,213 @@ def get_unit_costs(ce_client):
     except: pass
     return prices
 
-def get_orphans(session):
-    ec2_c = session.client('ec2')
-    ec2_r = session.resource('ec2')
-    elbv2 = session.client('elbv2')
-    
+# --- Moteur de coûts quotidiens (stockage en colonnes) ---
+
+# Dimension du rapport -> GroupBy Cost Explorer
+DIMENSIONS = {
+    "service": "SERVICE",
+    "usage_type": "USAGE_TYPE",
+    "region": "REGION",
+    "resource": "RESOURCE_ID",
+}
+# Données par ressource : 14 jours maximum côté Cost Explorer
+RESOURCE_DAYS = 14
+RESOURCE_SERVICES = ["Amazon Elastic Compute Cloud - Compute"]
+NO_VALUE = "(aucun)"
+
+class CostFrame:
+    """
+    Coûts quotidiens en colonnes : jour (ordinal), coût, quantité, et une
+    colonne d'entiers par dimension (codes vers self.labels[dim]).
+
+    Les colonnes sont des array.array remplis au chargement ; les calculs
+    passent par NumPy (vues sans copie) quand il est installé.
+    """
+
+    def __init__(self, dims):
+        self.dims = list(dims)
+        self.day = array('i')
+        self.cost = array('d')
+        self.usage = array('d')
+        self.codes = {d: array('i') for d in self.dims}
+        self.labels = {d: [] for d in self.dims}
+        self._index = {d: {} for d in self.dims}
+
+    def __len__(self):
+        return len(self.day)
+
+    def _code(self, dim, value):
+        index = self._index[dim]
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(self.labels[dim])
+            self.labels[dim].append(value)
+        return code
+
+    def add(self, day, cost, usage, **values):
+        self.day.append(day.toordinal())
+        self.cost.append(cost)
+        self.usage.append(usage)
+        for d in self.dims:
+            self.codes[d].append(self._code(d, values.get(d) or NO_VALUE))
+
+    def add_periods(self, periods, keys, **constants):
+        """
+        Ajoute des ResultsByTime quotidiens. `keys` nomme les dimensions des
+        Keys de chaque groupe (ordre du GroupBy) ; `constants` fixe les autres.
+        """
+        for p in periods:
+            day = date.fromisoformat(p['TimePeriod']['Start'])
+            for g in p.get('Groups', []):
+                values = dict(constants)
+                for dim, key in zip(keys, g['Keys']):
+                    # Groupement par tag : "Clé$valeur"
+                    values[dim] = key.split('$', 1)[1] if dim == "tag" else key
+                m = g['Metrics']
+                self.add(day, float(m.get('UnblendedCost', {}).get('Amount', 0)),
+                         float(m.get('UsageQuantity', {}).get('Amount', 0)), **values)
+
+    def span(self):
+        if not len(self):
+            return None, None
+        return date.fromordinal(min(self.day)), date.fromordinal(max(self.day))
+
+    def group_by(self, dim, start=None, end=None, column="cost"):
+        """{libellé: somme de `column`} sur les jours [start, end)."""
+        labels = self.labels[dim]
+        lo = start.toordinal() if start else -2**31
+        hi = end.toordinal() if end else 2**31 - 1
+        values = getattr(self, column)
+        if np is not None:
+            days = np.frombuffer(self.day, dtype=np.int32)
+            mask = (days >= lo) & (days < hi)
+            codes = np.frombuffer(self.codes[dim], dtype=np.int32)[mask]
+            sums = np.bincount(codes, weights=np.frombuffer(values, dtype=np.float64)[mask], minlength=len(labels))
+            return dict(zip(labels, sums.tolist()))
+        sums = [0.0] * len(labels)
+        for day, code, value in zip(self.day, self.codes[dim], values):
+            if lo <= day < hi:
+                sums[code] += value
+        return dict(zip(labels, sums))
+
+    def top(self, dim, n=20, start=None, end=None):
+        totals = self.group_by(dim, start, end)
+        return sorted(totals.items(), key=lambda kv: -kv[1])[:n]
+
+    def compare(self, dim, current, previous, n=20):
+        """
+        Écarts entre deux périodes (début, fin) : [(libellé, avant, après, écart)]
+        triés par écart absolu décroissant.
+        """
+        before = self.group_by(dim, *previous)
+        after = self.group_by(dim, *current)
+        rows = [(k, before.get(k, 0.0), after.get(k, 0.0), after.get(k, 0.0) - before.get(k, 0.0))
+                for k in set(before) | set(after)]
+        rows.sort(key=lambda r: -abs(r[3]))
+        return rows[:n]
+
+def load_costs(ce, dim, start, end, tag=None, services=None):
+    """
+    CostFrame quotidien pour le rapport `dim`, à partir des périodes CE
+    mises en cache (ce_query). Le service est toujours chargé avec la
+    dimension demandée.
+    """
+    metrics = ['UnblendedCost', 'UsageQuantity']
+    if dim == "resource":
+        frame = CostFrame(["service", "resource", "usage_type"])
+        for service in services or RESOURCE_SERVICES:
+            periods = ce_query(ce, 'DAILY', start, end, method='get_cost_and_usage_with_resources',
+                               Metrics=metrics, Filter={'Dimensions': {'Key': 'SERVICE', 'Values': [service]}},
+                               GroupBy=[{'Type': 'DIMENSION', 'Key': 'RESOURCE_ID'},
+                                        {'Type': 'DIMENSION', 'Key': 'USAGE_TYPE'}])
+            frame.add_periods(periods, ["resource", "usage_type"], service=service)
+        return frame
+
+    group_by = [{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
+    keys = ["service"]
+    if dim == "tag":
+        group_by.append({'Type': 'TAG', 'Key': tag})
+        keys.append("tag")
+    elif dim != "service":
+        group_by.append({'Type': 'DIMENSION', 'Key': DIMENSIONS[dim]})
+        keys.append(dim)
+    frame = CostFrame(keys)
+    frame.add_periods(ce_query(ce, 'DAILY', start, end, Metrics=metrics, GroupBy=group_by), keys)
+    return frame
+
+def report_windows(dim, days, today):
+    """
+    (début de chargement, période courante, période précédente).
+    Par ressource : deux demi-fenêtres des 14 derniers jours. Sinon : mois
+    en cours contre le même nombre de jours du mois précédent.
+    """
+    end = today + timedelta(days=1)
+    if dim == "resource":
+        days = min(days, RESOURCE_DAYS)
+        half = days // 2
+        current = (end - timedelta(days=half), end)
+        return end - timedelta(days=days), current, (current[0] - timedelta(days=half), current[0])
+    month = today.replace(day=1)
+    prev_month = (month - timedelta(days=1)).replace(day=1)
+    elapsed = end - month
+    previous = (prev_month, min(prev_month + elapsed, month))
+    return min(prev_month, end - timedelta(days=days)), (month, end), previous
+
+def print_report(frame, dim, current, previous, top):
+    console = Console()
+    fmt = lambda p: f"{p[0].isoformat()} → {(p[1] - timedelta(days=1)).isoformat()}"
+    t = Table(box=SIMPLE_HEAVY, header_style="bold cyan",
+              title=f"Coûts par {dim} : {fmt(previous)} / {fmt(current)}")
+    t.add_column(dim.capitalize())
+    t.add_column("Précédent", justify="right")
+    t.add_column("Courant", justify="right")
+    t.add_column("Écart", justify="right")
+    t.add_column("%", justify="right")
+    for label, before, after, delta in frame.compare(dim, current, previous, n=top):
+        pct = f"{delta / before * 100:+.0f}%" if before else "nouveau"
+        color = "red" if delta > 0 else "green"
+        t.add_row(label, f"${before:,.2f}", f"${after:,.2f}", f"[{color}]{delta:+,.2f}[/]", pct)
+    console.print(t)
+
+    first, last = frame.span()
+    if first:
+        total = sum(frame.group_by(dim).values())
+        console.print(f"[dim]{len(frame):,} lignes du {first} au {last}, total ${total:,.2f}[/]")
+
+def get_orphans(ec2_c, refresh=None):
+    """
+    EIP, volumes et snapshots orphelins. refresh=True recharge depuis l'API :
+    à utiliser dès que des scripts de suppression en sont tirés.
+    """
+    # Snapshots listés en premier : un volume créé après le listing des
+    # volumes ne doit pas rendre son snapshot orphelin
+    snapshots = cached(ec2_c, 'describe_snapshots', 'Snapshots', OwnerIds=['self'], refresh=refresh)
+
     # 1. EIPs
     eips = []
-    for e in ec2_c.describe_addresses().get('Addresses', []):
+    for e in cached(ec2_c, 'describe_addresses', 'Addresses', refresh=refresh):
         if not e.get('InstanceId') and not e.get('NetworkInterfaceId'):
             name = next((t['Value'] for t in e.get('Tags', []) if t['Key'] == 'Name'), "-")
             eips.append([e.get('PublicIp'), e.get('AllocationId'), name])
             
     # 2. Volumes Available
     vols = []
-    for v in ec2_r.volumes.filter(Filters=[{'Name': 'status', 'Values': ['available']}]):
-        name = next((t['Value'] for t in v.tags or [] if t['Key'] == 'Name'), "-")
-        vols.append([v.id, v.size, name])
+    for v in cached(ec2_c, 'describe_volumes', 'Volumes', refresh=refresh):
+        if v.get('State') != 'available': continue
+        name = next((t['Value'] for t in v.get('Tags', []) if t['Key'] == 'Name'), "-")
+        vols.append([v['VolumeId'], v['Size'], name])
 
     # 3. Snapshots (Vraiment orphelins : pas de volume, pas d'AMI)
     snaps = []
-    amis = ec2_c.describe_images(Owners=['self'])['Images']
-    snaps_in_amis = {bdm['Ebs']['SnapshotId'] for a in amis for bdm in a.get('BlockDeviceMappings', []) if 'Ebs' in bdm}
+    amis = cached(ec2_c, 'describe_images', 'Images', Owners=['self'], refresh=refresh)
+    snaps_in_amis = {bdm['Ebs']['SnapshotId'] for a in amis for bdm in a.get('BlockDeviceMappings', []) if 'Ebs' in bdm and 'SnapshotId' in bdm['Ebs']}
+    volumes = existing_volume_ids(ec2_c, refresh=refresh)
     
-    for s in ec2_r.snapshots.filter(OwnerIds=['self']):
-        if s.id in snaps_in_amis: continue
-        try:
-            ec2_r.Volume(s.volume_id).load()
-        except:
-            name = next((t['Value'] for t in s.tags or [] if t['Key'] == 'Name'), "-")
-            snaps.append([s.id, s.volume_size, name])
+    for s in snapshots:
+        if s['SnapshotId'] in snaps_in_amis: continue
+        if s.get('VolumeId') not in volumes:
+            name = next((t['Value'] for t in s.get('Tags', []) if t['Key'] == 'Name'), "-")
+            snaps.append([s['SnapshotId'], s['VolumeSize'], name])
 
     return eips, vols, snaps
 
@@ -94,15 +390,38 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-P', '--profile', default='default')
     parser.add_argument('-o', '--output', help="Répertoire de sortie (déclenche la création des scripts)")
+    parser.add_argument('--report', choices=list(DIMENSIONS) + ["tag"],
+                        help="Rapport de coûts quotidiens par dimension au lieu de l'audit des orphelins")
+    parser.add_argument('--tag', help="Clé de tag pour --report tag")
+    parser.add_argument('--days', type=int, default=90, help="Jours chargés pour --report (défaut: %(default)s)")
+    parser.add_argument('--top', type=int, default=20, help="Lignes affichées pour --report (défaut: %(default)s)")
+    parser.add_argument('--service', action='append', help="Services pour --report resource (défaut: EC2 compute)")
+    aws_cache.add_argument(parser)
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_cache.setup(args)
+    aws_apitrace.setup(args)
+
+    if args.report:
+        if args.report == "tag" and not args.tag:
+            parser.error("--report tag nécessite --tag")
+        if args.days < 2:
+            parser.error("--report nécessite --days >= 2 (deux périodes à comparer)")
+        start, current, previous = report_windows(args.report, args.days, utc_today())
+        frame = load_costs(aws_local.client('ce', profile=args.profile), args.report, start, current[1],
+                           tag=args.tag, services=args.service)
+        print_report(frame, args.report, current, previous, args.top)
+        return
 
-    session = boto3.Session(profile_name=args.profile)
+    session = aws_local.session(profile=args.profile)
     console = Console()
     region = session.region_name or "us-east-1"
 
     with console.status(f"[bold green]Audit des ressources inutilisées ({region})..."):
-        prices = get_unit_costs(session.client('ce'))
-        eips, vols, snaps = get_orphans(session)
+        prices = get_unit_costs(aws_local.client('ce', profile=args.profile))
+        # Les scripts générés (-o) suppriment des ressources : jamais à partir du cache
+        eips, vols, snaps = get_orphans(aws_local.client('ec2', profile=args.profile),
+                                        refresh=True if args.output else None)
 
     console.print(f"\n[bold white on red] AUDIT ORPHELINS - {args.profile} [/]\n", justify="center")
 
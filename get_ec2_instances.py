@@ -2,7 +2,7 @@
 
 import boto3
 from botocore.client import Config
-from aws_local import client
+from aws_local import client, paginate
 from rich.table import Table,box
 from rich.console import Console
 
@@ -13,13 +13,7 @@ def get_instances():
     ec2 = client("ec2")
 
     try:
-        response = ec2.describe_instances()
-    except Exception as e:
-        print(f"Erreur describe_instances : {e}")
-        return []
-
-    for reservation in response.get("Reservations", []):
-        for inst in reservation.get("Instances", []):
+        for inst in paginate(ec2, "describe_instances", "Reservations[].Instances[]"):
 
             tags = inst.get("Tags", [])
 
@@ -32,6 +26,8 @@ def get_instances():
                 "LaunchTime": inst.get("LaunchTime"),
                 "Tags": tags,
                 })
+    except Exception as e:
+        print(f"Erreur describe_instances : {e}")
 
 if __name__ == "__main__":
 
@@ -1,44 +1,109 @@
 #!/usr/bin/env python3
 
-from aws_local import client
+import sys
+import json
+import argparse
+import aws_apitrace
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from aws_local import client, pages, paginate
 from rich.table import Table, box
 from rich.console import Console
 
-iam = client("iam")
 console = Console()
 
-table = Table(box=box.SIMPLE_HEAVY)
-table.add_column("Type", style="cyan")
-table.add_column("Name", style="magenta")
-table.add_column("Arn", style="green")
-table.add_column("Policies", style="yellow")
+# Clés de get_account_authorization_details : type -> (liste, nom, policies inline)
+DETAILS = {
+    "User": ("UserDetailList", "UserName", "UserPolicyList"),
+    "Role": ("RoleDetailList", "RoleName", "RolePolicyList"),
+    "Group": ("GroupDetailList", "GroupName", "GroupPolicyList"),
+}
 
-for user in iam.list_users().get("Users", []):
-    name = user['UserName']
+def principal(kind, name, arn, attached, inline):
+    return {"Type": kind, "Name": name, "Arn": arn, "Attached": attached, "Inline": inline}
 
-    res = iam.get_user(UserName=name)
-    arn = res['User']['Arn']
+def get_principals_fast(iam):
+    """
+    Inventaire complet en quelques appels via get_account_authorization_details.
+    """
+    result = []
+    for page in pages(iam, "get_account_authorization_details", Filter=list(DETAILS)):
+        for kind, (list_key, name_key, inline_key) in DETAILS.items():
+            for item in page.get(list_key, []):
+                result.append(principal(
+                    kind, item[name_key], item["Arn"],
+                    [p["PolicyName"] for p in item.get("AttachedManagedPolicies", [])],
+                    [p["PolicyName"] for p in item.get(inline_key, [])],
+                ))
+    return result
 
-    attached = [p['PolicyName'] for p in iam.list_attached_user_policies(UserName=name).get('AttachedPolicies', [])]
-    inline = iam.list_user_policies(UserName=name).get('PolicyNames', [])
+def get_principals_slow(iam, workers=16):
+    """
+    Repli quand get_account_authorization_details est refusé : un appel de
+    listing par type, puis les policies de chaque principal en parallèle.
+    """
+    listings = [
+        ("User", "list_users", "Users", "UserName", "list_attached_user_policies", "list_user_policies"),
+        ("Role", "list_roles", "Roles", "RoleName", "list_attached_role_policies", "list_role_policies"),
+        ("Group", "list_groups", "Groups", "GroupName", "list_attached_group_policies", "list_group_policies"),
+    ]
 
-    all_policies = attached + [f"{p} (inline)" for p in inline]
-    policy_str = "\n".join(all_policies) if all_policies else "[grey62]No Policy[/grey62]"
+    def policies(job):
+        kind, item, name_key, attached_m, inline_m = job
+        name = item[name_key]
+        attached = [p['PolicyName'] for p in paginate(iam, attached_m, "AttachedPolicies", **{name_key: name})]
+        inline = list(paginate(iam, inline_m, "PolicyNames", **{name_key: name}))
+        return principal(kind, name, item["Arn"], attached, inline)
 
-    table.add_row("User", name, arn, policy_str)
+    jobs = [(kind, item, name_key, attached_m, inline_m)
+            for kind, method, key, name_key, attached_m, inline_m in listings
+            for item in paginate(iam, method, key)]
 
-for role in iam.list_roles().get("Roles", []):
-    name = role['RoleName']
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(policies, jobs))
 
-    res = iam.get_role(RoleName=name)
-    arn = res['Role']['Arn']
+def get_principals(iam, fast=True, workers=16):
+    if fast:
+        try:
+            return get_principals_fast(iam)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code", "")
+            if code not in ("AccessDenied", "AccessDeniedException", "UnauthorizedOperation"):
+                raise
+            print(f"get_account_authorization_details refusé ({code}), repli sur le mode par principal",
+                  file=sys.stderr)
+    return get_principals_slow(iam, workers=workers)
 
-    attached = [p['PolicyName'] for p in iam.list_attached_role_policies(RoleName=name).get('AttachedPolicies', [])]
-    inline = iam.list_role_policies(RoleName=name).get('PolicyNames', [])
+def print_table(principals):
+    table = Table(box=box.SIMPLE_HEAVY)
+    table.add_column("Type", style="cyan")
+    table.add_column("Name", style="magenta")
+    table.add_column("Arn", style="green")
+    table.add_column("Policies", style="yellow")
 
-    all_policies = attached + [f"{p} (inline)" for p in inline]
-    policy_str = "\n".join(all_policies) if all_policies else "[grey62]No Policy[/grey62]"
+    for p in principals:
+        all_policies = p["Attached"] + [f"{name} (inline)" for name in p["Inline"]]
+        policy_str = "\n".join(all_policies) if all_policies else "[grey62]No Policy[/grey62]"
+        table.add_row(p["Type"], p["Name"], p["Arn"], policy_str)
 
-    table.add_row("Role", name, arn, policy_str)
+    console.print(table)
 
-console.print(table)
+def main():
+    parser = argparse.ArgumentParser(description="Inventaire IAM (utilisateurs, rôles, groupes et policies)")
+    parser.add_argument("--slow", action="store_true", help="Force le mode par principal (sans get_account_authorization_details)")
+    parser.add_argument("-w", "--workers", type=int, default=16, help="Appels simultanés en mode par principal (défaut: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    aws_apitrace.setup(args)
+
+    principals = get_principals(client("iam"), fast=not args.slow, workers=args.workers)
+    principals.sort(key=lambda p: (list(DETAILS).index(p["Type"]), p["Name"]))
+
+    if args.json:
+        print(json.dumps(principals, ensure_ascii=False, indent=2))
+    else:
+        print_table(principals)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import boto3
 import argparse
+import aws_apitrace
 import os
+import sys
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from rich.console import Console
 from rich.table import Table
 from rich.box import SIMPLE_HEAVY
+from botocore.exceptions import ClientError
+from aws_local import client
+import aws_cache
+from aws_cache import cached
 
 # Estimations FinOps (Prix moyens mensuels)
 PRICES = {
@@ -17,98 +23,188 @@ PRICES = {
     "ALB": 18.00      
 }
 
+# Appels describe_target_health simultanés par compte/région
+HEALTH_WORKERS = 8
+
 def get_eip_orphans(ec2_c):
     data = []
-    try:
-        addrs = ec2_c.describe_addresses().get('Addresses', [])
-        for eip in addrs:
-            if not eip.get('InstanceId') and not eip.get('NetworkInterfaceId'):
-                name = next((t['Value'] for t in eip.get('Tags', []) if t['Key'] == 'Name'), "-")
-                data.append([eip.get('PublicIp'), eip.get('AllocationId'), name])
-    except: pass
+    for eip in cached(ec2_c, 'describe_addresses', 'Addresses'):
+        if not eip.get('InstanceId') and not eip.get('NetworkInterfaceId'):
+            name = next((t['Value'] for t in eip.get('Tags', []) if t['Key'] == 'Name'), "-")
+            data.append([eip.get('PublicIp'), eip.get('AllocationId'), name])
     return data
 
 def get_eni_orphans(ec2_c):
     data = []
-    try:
-        enis = ec2_c.describe_network_interfaces().get('NetworkInterfaces', [])
-        for eni in enis:
-            if eni.get('Status') != 'in-use':
-                name = next((t['Value'] for t in eni.get('Tags', []) if t['Key'] == 'Name'), "-")
-                data.append([eni.get('NetworkInterfaceId'), eni.get('PrivateIpAddress'), eni.get('VpcId'), name])
-    except: pass
+    for eni in cached(ec2_c, 'describe_network_interfaces', 'NetworkInterfaces'):
+        if eni.get('Status') != 'in-use':
+            name = next((t['Value'] for t in eni.get('Tags', []) if t['Key'] == 'Name'), "-")
+            data.append([eni.get('NetworkInterfaceId'), eni.get('PrivateIpAddress'), eni.get('VpcId'), name])
     return data
 
-def get_vol_orphans(ec2_r):
+def get_vol_orphans(ec2_c):
     data = []
-    try:
-        for v in ec2_r.volumes.filter(Filters=[{'Name': 'status', 'Values': ['available']}]):
-            name = next((t['Value'] for t in v.tags or [] if t['Key'] == 'Name'), "-")
-            data.append([v.id, v.size, v.volume_type, name])
-    except: pass
+    # Liste complète (partagée en cache avec existing_volume_ids), filtrée en mémoire
+    for v in cached(ec2_c, 'describe_volumes', 'Volumes'):
+        if v.get('State') != 'available':
+            continue
+        name = next((t['Value'] for t in v.get('Tags', []) if t['Key'] == 'Name'), "-")
+        data.append([v['VolumeId'], v['Size'], v.get('VolumeType'), name])
     return data
 
-def get_snap_orphans_safe(ec2_r, ec2_c):
+def existing_volume_ids(ec2_c, refresh=None):
+    """Ensemble des IDs de volumes existants (quelques appels, quel que soit le nombre de snapshots)."""
+    return {v['VolumeId'] for v in cached(ec2_c, 'describe_volumes', 'Volumes', refresh=refresh)}
+
+def get_snap_orphans_safe(ec2_c):
     """Détecte UNIQUEMENT les snapshots sans volume ET sans aucune AMI rattachée."""
     data = []
-    try:
-        # 1. On liste tous les snapshots utilisés par TOUTES les AMIs (même les publiques si besoin, mais ici 'self')
-        amis = ec2_c.describe_images(Owners=['self'])['Images']
-        snaps_in_amis = set()
-        for ami in amis:
-            for bdm in ami.get('BlockDeviceMappings', []):
-                if 'Ebs' in bdm and 'SnapshotId' in bdm['Ebs']:
-                    snaps_in_amis.add(bdm['Ebs']['SnapshotId'])
-
-        # 2. On filtre les snapshots
-        for s in ec2_r.snapshots.filter(OwnerIds=['self']):
-            # Vérifier si le snapshot est dans une AMI
-            if s.id in snaps_in_amis:
-                continue
-            
-            # Vérifier si le volume source existe encore
-            try:
-                ec2_r.Volume(s.volume_id).load()
-                continue # Le volume existe, on ne touche pas
-            except:
-                # Si on est ici : Pas d'AMI associée ET pas de volume source
-                name = next((t['Value'] for t in s.tags or [] if t['Key'] == 'Name'), "-")
-                data.append([s.id, s.volume_size, s.start_time.strftime("%Y-%m-%d"), name])
-    except: pass
+    # Les snapshots sont listés avant les volumes et les AMI : un volume créé
+    # entre les deux listings ne fait pas passer son snapshot pour orphelin
+    snapshots = cached(ec2_c, 'describe_snapshots', 'Snapshots', OwnerIds=['self'])
+
+    # 1. On liste tous les snapshots utilisés par TOUTES les AMIs (même les publiques si besoin, mais ici 'self')
+    snaps_in_amis = set()
+    for ami in cached(ec2_c, 'describe_images', 'Images', Owners=['self']):
+        for bdm in ami.get('BlockDeviceMappings', []):
+            if 'Ebs' in bdm and 'SnapshotId' in bdm['Ebs']:
+                snaps_in_amis.add(bdm['Ebs']['SnapshotId'])
+
+    # 2. Tous les volumes existants, en une seule passe paginée
+    volumes = existing_volume_ids(ec2_c)
+
+    # 3. On filtre les snapshots (jointure en mémoire, aucun appel par snapshot)
+    for s in snapshots:
+        # Vérifier si le snapshot est dans une AMI
+        if s['SnapshotId'] in snaps_in_amis:
+            continue
+        
+        # Vérifier si le volume source existe encore
+        if s.get('VolumeId') not in volumes:
+            # Si on est ici : Pas d'AMI associée ET pas de volume source
+            name = next((t['Value'] for t in s.get('Tags', []) if t['Key'] == 'Name'), "-")
+            data.append([s['SnapshotId'], s['VolumeSize'], s['StartTime'].strftime("%Y-%m-%d"), name])
     return data
 
-def get_lb_orphans(elbv2_c):
+def get_lb_orphans(elbv2_c, elb_c=None, workers=HEALTH_WORKERS):
+    """
+    Load balancers sans aucune cible : ALB/NLB/GWLB (elbv2) et Classic ELB (elb).
+
+    Les target groups sont indexés par ARN de LB en une passe, puis chaque
+    target group n'est interrogé qu'une fois, en parallèle. Les Classic ELB
+    ne sont ajoutés que si elb_c est donné ; scan() les collecte à part
+    (collecteur "clbs") pour qu'une erreur de l'un ne masque pas l'autre.
+    """
     data = []
-    try:
-        lbs = elbv2_c.describe_load_balancers()['LoadBalancers']
-        tgs = elbv2_c.describe_target_groups()['TargetGroups']
-        for lb in lbs:
-            arn = lb['LoadBalancerArn']
-            lb_tgs = [tg for tg in tgs if arn in tg.get('LoadBalancerArns', [])]
-            
-            active = False
-            for tg in lb_tgs:
-                health = elbv2_c.describe_target_health(TargetGroupArn=tg['TargetGroupArn'])
-                if health['TargetHealthDescriptions']:
-                    active = True
-                    break
-            
-            if not active:
-                data.append([lb['LoadBalancerName'], lb['Type'], lb['LoadBalancerArn']])
-    except: pass
+    lbs = cached(elbv2_c, 'describe_load_balancers', 'LoadBalancers')
+
+    # Index LB ARN -> [TG ARN]
+    tgs_by_lb = {}
+    for tg in cached(elbv2_c, 'describe_target_groups', 'TargetGroups'):
+        for lb_arn in tg.get('LoadBalancerArns', []):
+            tgs_by_lb.setdefault(lb_arn, []).append(tg['TargetGroupArn'])
+
+    def has_targets(tg_arn):
+        try:
+            health = elbv2_c.describe_target_health(TargetGroupArn=tg_arn)
+        except ClientError:
+            # TG supprimé en cours de scan, liste en cache périmée... : dans le
+            # doute le TG est considéré actif et son LB n'est pas signalé
+            return True
+        return bool(health['TargetHealthDescriptions'])
+
+    tg_arns = sorted({arn for arns in tgs_by_lb.values() for arn in arns})
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        active_tgs = {arn for arn, ok in zip(tg_arns, pool.map(has_targets, tg_arns)) if ok}
+
+    for lb in lbs:
+        arn = lb['LoadBalancerArn']
+        if not any(tg in active_tgs for tg in tgs_by_lb.get(arn, [])):
+            data.append([lb['LoadBalancerName'], lb['Type'], arn])
+
+    if elb_c is not None:
+        data.extend(get_clb_orphans(elb_c))
     return data
 
-def generate_scripts(eips, enis, vols, snaps, lbs, profile):
+def get_clb_orphans(elb_c):
+    """Classic ELB sans instance enregistrée."""
+    data = []
+    for lb in cached(elb_c, 'describe_load_balancers', 'LoadBalancerDescriptions'):
+        if not lb.get('Instances'):
+            data.append([lb['LoadBalancerName'], 'classic', lb['LoadBalancerName']])
+    return data
+
+# Collecteurs : nom -> (fonction, services des clients à lui passer)
+COLLECTORS = {
+    "eips": (get_eip_orphans, ("ec2",)),
+    "enis": (get_eni_orphans, ("ec2",)),
+    "vols": (get_vol_orphans, ("ec2",)),
+    "snaps": (get_snap_orphans_safe, ("ec2",)),
+    "lbs": (get_lb_orphans, ("elbv2",)),
+    "clbs": (get_clb_orphans, ("elb",)),
+}
+
+def list_regions(profile):
+    """Régions EC2 activées pour le profil."""
+    ec2 = client('ec2', profile=profile)
+    return sorted(r['RegionName'] for r in ec2.describe_regions()['Regions'])
+
+def run_collector(profile, region, name):
+    func, services = COLLECTORS[name]
+    return func(*[client(s, profile=profile, region=region) for s in services])
+
+def scan(profiles, regions, workers=16):
+    """
+    Lance chaque collecteur pour chaque couple (profil, région) dans un pool
+    de threads borné.
+
+    Retourne ({collecteur: [(profil, région, ligne), ...]},
+    [(profil, région, collecteur, erreur), ...]) : une région refusée ou en
+    erreur n'est pas confondue avec une région propre. Un profil dont les
+    régions ne peuvent être résolues donne une erreur "regions".
+    """
+    results = {name: [] for name in COLLECTORS}
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for profile in profiles:
+            try:
+                targets = list_regions(profile) if regions == ["all"] else regions
+                targets = [region or client('ec2', profile=profile).meta.region_name for region in targets]
+            except Exception as e:
+                # Profil inconnu ou refusé : les autres profils sont quand même scannés
+                errors.append((profile, ",".join(filter(None, regions)) or None, "regions", f"{type(e).__name__}: {e}"))
+                continue
+            for region in targets:
+                for name in COLLECTORS:
+                    futures[pool.submit(run_collector, profile, region, name)] = (profile, region, name)
+        for future in as_completed(futures):
+            profile, region, name = futures[future]
+            try:
+                results[name].extend((profile, region, row) for row in future.result())
+            except Exception as e:
+                errors.append((profile, region, name, f"{type(e).__name__}: {e}"))
+    for rows in results.values():
+        rows.sort(key=lambda r: (r[0], r[1]))
+    errors.sort(key=lambda e: (str(e[0]), str(e[1]), e[2]))
+    return results, errors
+
+def generate_scripts(results):
     folder = f"scripts-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
     os.makedirs(folder, exist_ok=True)
-    p = f"--profile {profile}" if profile else ""
-    
+
+    def opts(profile, region):
+        o = f"--profile {profile}" if profile else ""
+        return f"{o} --region {region}" if region else o
+
     files = {
-        "clean_ips.sh": [f"aws ec2 release-address {p} --allocation-id {r[1]}" for r in eips],
-        "clean_enis.sh": [f"aws ec2 delete-network-interface {p} --network-interface-id {r[0]}" for r in enis],
-        "clean_volumes.sh": [f"aws ec2 delete-volume {p} --volume-id {r[0]}" for r in vols],
-        "clean_snapshots.sh": [f"aws ec2 delete-snapshot {p} --snapshot-id {r[0]}" for r in snaps],
-        "clean_lbs.sh": [f"aws elbv2 delete-load-balancer {p} --load-balancer-arn {r[2]}" for r in lbs]
+        "clean_ips.sh": [f"aws ec2 release-address {opts(p, g)} --allocation-id {r[1]}" for p, g, r in results["eips"]],
+        "clean_enis.sh": [f"aws ec2 delete-network-interface {opts(p, g)} --network-interface-id {r[0]}" for p, g, r in results["enis"]],
+        "clean_volumes.sh": [f"aws ec2 delete-volume {opts(p, g)} --volume-id {r[0]}" for p, g, r in results["vols"]],
+        "clean_snapshots.sh": [f"aws ec2 delete-snapshot {opts(p, g)} --snapshot-id {r[0]}" for p, g, r in results["snaps"]],
+        "clean_lbs.sh": [f"aws elbv2 delete-load-balancer {opts(p, g)} --load-balancer-arn {r[2]}" if r[1] != 'classic'
+                         else f"aws elb delete-load-balancer {opts(p, g)} --load-balancer-name {r[2]}"
+                         for p, g, r in results["lbs"]]
     }
 
     for name, cmds in files.items():
@@ -122,46 +218,83 @@ def generate_scripts(eips, enis, vols, snaps, lbs, profile):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-P', '--profile', default='default')
+    parser.add_argument('--profiles', help="Liste de profils séparés par des virgules (remplace --profile)")
+    parser.add_argument('--regions', help="'all' ou liste de régions séparées par des virgules (défaut: région du profil)")
+    parser.add_argument('-w', '--workers', type=int, default=16, help="Nombre d'appels simultanés (défaut: %(default)s)")
     parser.add_argument('--scripts', action='store_true')
+    aws_cache.add_argument(parser)
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_cache.setup(args)
+    aws_apitrace.setup(args)
+    if args.scripts:
+        # Les scripts suppriment des ressources : jamais à partir du cache
+        aws_cache.set_refresh(True)
 
-    session = boto3.Session(profile_name=args.profile)
-    ec2_c, ec2_r, elbv2_c = session.client('ec2'), session.resource('ec2'), session.client('elbv2')
+    profiles = args.profiles.split(',') if args.profiles else [args.profile]
+    regions = args.regions.split(',') if args.regions else [None]
     console = Console()
 
     with console.status("[bold green]Scan en cours..."):
-        eips = get_eip_orphans(ec2_c)
-        enis = get_eni_orphans(ec2_c)
-        vols = get_vol_orphans(ec2_r)
-        snaps = get_snap_orphans_safe(ec2_r, ec2_c)
-        lbs = get_lb_orphans(elbv2_c)
+        results, errors = scan(profiles, regions, workers=args.workers)
+    # ALB/NLB et Classic ELB sont présentés ensemble
+    results["lbs"] = sorted(results["lbs"] + results.pop("clbs"), key=lambda r: (r[0], r[1]))
 
-    console.print(f"\n[bold white on red] AUDIT CLEANER - {args.profile} [/]\n", justify="center")
+    console.print(f"\n[bold white on red] AUDIT CLEANER - {', '.join(profiles)} [/]\n", justify="center")
+
+    # On n'affiche profil/région que si plusieurs périmètres ont été scannés
+    scopes = {(p, g) for rows in results.values() for p, g, _ in rows}
+    multi = len(profiles) > 1 or regions != [None]
 
     total = 0
+    subtotals = {}
     groups = [
-        (eips, "IPs Publiques", "yellow", ["IP", "ID", "Name"], lambda r: PRICES["EIP"]),
-        (vols, "Volumes EBS", "red", ["ID", "GiB", "Type", "Name"], lambda r: r[1] * PRICES["EBS"]),
-        (enis, "Interfaces ENI", "cyan", ["ID", "Private", "VPC", "Name"], lambda r: 0),
-        (snaps, "Snapshots 100% Orphelins", "magenta", ["ID", "GiB", "Date", "Name"], lambda r: r[1] * PRICES["SNAP"]),
-        (lbs, "Load Balancers Vides", "blue", ["Nom", "Type", "ARN"], lambda r: PRICES["ALB"])
+        ("eips", "IPs Publiques", "yellow", ["IP", "ID", "Name"], lambda r: PRICES["EIP"]),
+        ("vols", "Volumes EBS", "red", ["ID", "GiB", "Type", "Name"], lambda r: r[1] * PRICES["EBS"]),
+        ("enis", "Interfaces ENI", "cyan", ["ID", "Private", "VPC", "Name"], lambda r: 0),
+        ("snaps", "Snapshots 100% Orphelins", "magenta", ["ID", "GiB", "Date", "Name"], lambda r: r[1] * PRICES["SNAP"]),
+        ("lbs", "Load Balancers Vides", "blue", ["Nom", "Type", "ARN"], lambda r: PRICES["ALB"])
     ]
 
-    for data, title, color, cols, cost_f in groups:
+    for name, title, color, cols, cost_f in groups:
         table = Table(box=SIMPLE_HEAVY, title=f"[bold {color}]{title}[/]", header_style=f"bold {color}")
+        if multi:
+            table.add_column("Profile"); table.add_column("Region")
         for c in cols: table.add_column(c)
         table.add_column("Saving/Mo", justify="right")
-        for row in data:
+        for profile, region, row in results[name]:
             s = cost_f(row)
             total += s
-            table.add_row(*[str(x) for x in row], f"${s:.2f}")
+            sub = subtotals.setdefault((profile, region), [0, 0.0])
+            sub[0] += 1
+            sub[1] += s
+            scope = [profile, region] if multi else []
+            table.add_row(*scope, *[str(x) for x in row], f"${s:.2f}")
+        console.print(table)
+
+    if multi and scopes:
+        table = Table(box=SIMPLE_HEAVY, title="[bold green]Sous-totaux par région[/]", header_style="bold green")
+        table.add_column("Profile"); table.add_column("Region")
+        table.add_column("Ressources", justify="right"); table.add_column("Saving/Mo", justify="right")
+        for (profile, region), (count, saving) in sorted(subtotals.items()):
+            table.add_row(profile, region, str(count), f"${saving:.2f}")
         console.print(table)
 
     console.print(f"\n[bold green]ÉCONOMIE TOTALE : ${total:.2f}/mois[/]")
 
+    if errors:
+        table = Table(box=SIMPLE_HEAVY, title="[bold red]Collectes en erreur (résultats incomplets)[/]", header_style="bold red")
+        for c in ("Profile", "Region", "Collecteur", "Erreur"): table.add_column(c)
+        for profile, region, name, err in errors:
+            table.add_row(str(profile), str(region), name, err)
+        console.print(table)
+
     if args.scripts:
-        path = generate_scripts(eips, enis, vols, snaps, lbs, args.profile)
+        path = generate_scripts(results)
         console.print(f"[bold cyan]Scripts générés dans ./{path}[/]\n")
 
+    if errors:
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
@@ -2,22 +2,190 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import aws_apitrace
 import os
-import boto3
+import sys
+import ipaddress
+import aws_cache
 from botocore.exceptions import BotoCoreError, ClientError
 from rich.table import Table, box
 from rich.console import Console
+from aws_local import client, paginate
+from aws_cache import cached
+
+# Champs possibles de la cible d'une route, par ordre de priorité d'affichage
+ROUTE_TARGETS = ['GatewayId', 'NatGatewayId', 'TransitGatewayId', 'VpcPeeringConnectionId', 'NetworkInterfaceId',
+                 'InstanceId', 'EgressOnlyInternetGatewayId', 'LocalGatewayId', 'CarrierGatewayId', 'CoreNetworkArn']
+
+def route_target(route):
+    return next((route[k] for k in ROUTE_TARGETS if route.get(k)), "Unknown")
+
+class PrefixTrie:
+    """
+    Trie binaire (un bit par niveau) : le plus long préfixe couvrant une
+    adresse est trouvé en au plus 32 (IPv4) ou 128 (IPv6) pas.
+    Un nœud est une liste [fils 0, fils 1, valeur].
+    """
+
+    __slots__ = ("root", "bits")
+
+    def __init__(self, bits):
+        self.root = [None, None, None]
+        self.bits = bits
+
+    def insert(self, net, value, replace=True):
+        node, addr = self.root, int(net.network_address)
+        for i in range(net.prefixlen):
+            bit = (addr >> (self.bits - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None or replace:
+            node[2] = value
+
+    def longest(self, addr, length):
+        """Valeur du plus long préfixe couvrant les `length` premiers bits de `addr`."""
+        node = self.root
+        best = node[2]
+        for i in range(length):
+            node = node[(addr >> (self.bits - 1 - i)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                best = node[2]
+        return best
+
+class RouteEngine:
+    """
+    Tables de routage compilées en tries (une par table et par version IP).
+
+    Une table s'applique à un sous-réseau par association explicite, sinon
+    c'est la table principale de son VPC. Les routes vers une prefix list
+    sont développées en leurs CIDR ; à préfixe égal une route CIDR l'emporte.
+    Une route "blackhole" reste la plus spécifique : le trafic est perdu.
+    """
+
+    def __init__(self, route_tables, subnets=(), prefix_lists=None):
+        self.tries = {}
+        self.by_subnet, self.main = {}, {}
+        self.vpc_of = {s['SubnetId']: s.get('VpcId') for s in subnets}
+        for rt in route_tables:
+            rt_id = rt['RouteTableId']
+            tries = self.tries[rt_id] = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+            for r in rt.get('Routes', []):
+                route = {"table": rt_id, "target": route_target(r), "state": r.get('State', 'active'),
+                         "prefix_list": r.get('DestinationPrefixListId')}
+                if route["prefix_list"]:
+                    dests = (prefix_lists or {}).get(route["prefix_list"], [])
+                else:
+                    dests = [r.get('DestinationCidrBlock') or r.get('DestinationIpv6CidrBlock')]
+                for dest in filter(None, dests):
+                    net = ipaddress.ip_network(dest, strict=False)
+                    tries[net.version].insert(net, dict(route, destination=dest),
+                                              replace=not route["prefix_list"])
+            for assoc in rt.get('Associations', []):
+                if assoc.get('Main'):
+                    self.main[rt.get('VpcId')] = rt_id
+                elif assoc.get('SubnetId'):
+                    self.by_subnet[assoc['SubnetId']] = rt_id
+
+    @classmethod
+    def load(cls, ec2):
+        route_tables = cached(ec2, 'describe_route_tables', 'RouteTables')
+        referenced = {r['DestinationPrefixListId'] for rt in route_tables for r in rt.get('Routes', [])
+                      if r.get('DestinationPrefixListId')}
+        prefix_lists = {pl: [e['Cidr'] for e in cached(ec2, 'get_managed_prefix_list_entries', 'Entries',
+                                                       PrefixListId=pl)]
+                        for pl in referenced}
+        return cls(route_tables, cached(ec2, 'describe_subnets', 'Subnets'), prefix_lists)
+
+    def table_for(self, subnet_id, vpc_id=None):
+        return self.by_subnet.get(subnet_id) or self.main.get(vpc_id or self.vpc_of.get(subnet_id))
+
+    def lookup(self, subnet_id, destination, vpc_id=None):
+        """
+        Route retenue depuis `subnet_id` vers `destination` (adresse ou réseau :
+        la route doit alors couvrir tout le réseau), ou None.
+        """
+        table = self.table_for(subnet_id, vpc_id)
+        if table is None:
+            return None
+        destination = ipaddress.ip_network(destination, strict=False)
+        trie = self.tries[table][destination.version]
+        return trie.longest(int(destination.network_address), destination.prefixlen)
+
+    def lookup_many(self, queries):
+        """
+        [(sous-réseau, destination, route ou None, erreur ou None)] pour des
+        couples (sous-réseau, destination) : un sous-réseau inconnu ou une
+        destination invalide donne une erreur sur sa ligne sans interrompre
+        les autres.
+        """
+        results = []
+        for subnet, dest in queries:
+            if subnet not in self.vpc_of and subnet not in self.by_subnet:
+                # Sinon "aucune route" passerait pour une vraie réponse de routage
+                results.append((subnet, dest, None, f"sous-réseau inconnu '{subnet}'"))
+                continue
+            try:
+                results.append((subnet, dest, self.lookup(subnet, dest), None))
+            except ValueError:
+                results.append((subnet, dest, None, f"adresse invalide '{dest}'"))
+        return results
+
+def print_lookups(results):
+    console = Console()
+    table = Table(box=box.SIMPLE_HEAVY, header_style="bold white on blue")
+    for col in ("Subnet", "Destination", "Route Table", "Route", "Target", "State"):
+        table.add_column(col)
+    for subnet, dest, route, error in results:
+        if error:
+            table.add_row(subnet, dest, "-", "-", f"[bold red]{error}[/]", "-")
+            continue
+        if route is None:
+            table.add_row(subnet, dest, "-", "-", "[bold red]aucune route[/]", "-")
+            continue
+        dest_route = route["destination"] + (f" ({route['prefix_list']})" if route["prefix_list"] else "")
+        state = "[bold red]blackhole[/]" if route["state"] == "blackhole" else route["state"]
+        table.add_row(subnet, dest, route["table"], dest_route, route["target"], state)
+    console.print(table)
+
+def read_queries(path):
+    """
+    Lignes "<subnet> <ip>" d'un fichier ou de stdin ('-'). Une ligne sans
+    adresse est rendue avec une destination vide : elle ressort en erreur.
+    """
+    lines = sys.stdin if path == "-" else open(path)
+    with lines:
+        for line in lines:
+            fields = line.split('#', 1)[0].split()
+            if fields:
+                yield fields[0], fields[1] if len(fields) > 1 else ""
 
 def main():
     parser = argparse.ArgumentParser(description="Lister les tables de routage AWS avec détection de sortie Internet")
     parser.add_argument("--profile", default=os.environ.get("AWS_PROFILE", "default"), help="Profil AWS")
     parser.add_argument("--region", default=os.environ.get("AWS_REGION"), help="Région AWS")
+    parser.add_argument("--lookup", nargs=2, metavar=("SUBNET", "IP"),
+                        help="Route retenue depuis SUBNET vers IP (plus long préfixe)")
+    parser.add_argument("--batch", metavar="FICHIER", help="Lignes '<subnet> <ip>' à résoudre ('-' pour stdin)")
+    aws_cache.add_argument(parser)
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_cache.setup(args)
+    aws_apitrace.setup(args)
 
     try:
-        session = boto3.Session(profile_name=args.profile, region_name=args.region)
-        ec2 = session.client("ec2")
-        resp = ec2.describe_route_tables()
+        ec2 = client("ec2", profile=args.profile, region=args.region)
+        if args.lookup or args.batch:
+            engine = RouteEngine.load(ec2)
+            queries = [tuple(args.lookup)] if args.lookup else list(read_queries(args.batch))
+            results = engine.lookup_many(queries)
+            print_lookups(results)
+            if any(error for *_, error in results):
+                sys.exit(1)
+            return
+        route_tables = list(paginate(ec2, "describe_route_tables", "RouteTables"))
     except (BotoCoreError, ClientError) as e:
         print(f"Erreur connexion AWS : {e}")
         return
@@ -33,7 +201,7 @@ def main():
     table.add_column("Main", justify="center")
     table.add_column("Name")
 
-    for rt in resp.get("RouteTables", []):
+    for rt in route_tables:
         rt_id = rt.get("RouteTableId")
         routes = rt.get("Routes", [])
         
@@ -52,12 +220,7 @@ def main():
             state = route.get("State", "active")
             
             # Coloration de la cible
-            target = "Unknown"
-            target_keys = ['GatewayId', 'NatGatewayId', 'InstanceId', 'VpcPeeringConnectionId', 'NetworkInterfaceId']
-            for key in target_keys:
-                if key in route:
-                    target = route[key]
-                    break
+            target = route_target(route)
             
             target_display = f"[bold green]{target}[/]" if target == "local" or target.startswith("igw-") else f"[yellow]{target}[/]"
 
@@ -1,36 +1,195 @@
 #!/usr/bin/env python3
 
-import boto3
+import time
+import queue
+import argparse
+import aws_apitrace
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from rich.table import Table,box
 from rich.console import Console
+from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
 import humanize
-from aws_local import client
+from aws_local import client, paginate, pages
 
-s3 = client("s3")
-buckets = s3.list_buckets()
+console = Console()
 
-table = Table(box=box.SIMPLE_HEAVY)
-table.add_column("Name", style="cyan", no_wrap=True)
-table.add_column("Creation Time", style="magenta")
-table.add_column("Region", style="green")
-table.add_column("Files", justify="right")
-table.add_column("Size", justify="right")
+# Niveaux de préfixes explorés avec Delimiter quand un seul préfixe porte tout le bucket
+MAX_DEPTH = 3
 
-buckets_list=sorted(buckets.get("Buckets", []), key=lambda x: x["CreationDate"], reverse=True)
+class BucketSize:
+    """Totaux d'un bucket, alimentés en flux par plusieurs workers."""
 
-for bucket in buckets_list: 
-    nom = bucket["Name"]
-    date_form = str(bucket["CreationDate"])
-    region = bucket.get("BucketRegion") or s3.get_bucket_location(Bucket=nom).get("LocationConstraint") or "us-east-1"
+    def __init__(self, name):
+        self.name = name
+        self.region = None
+        self.count = 0
+        self.bytes = 0
+        self.classes = {}
+        self.error = None
+        self.lock = threading.Lock()
 
-    objets = s3.list_objects_v2(Bucket=nom)
-    nb_fichiers = objets.get('KeyCount', 0)
-    taille_octets = 0
+    def add(self, count, size, classes):
+        with self.lock:
+            self.count += count
+            self.bytes += size
+            for cls, (c, b) in classes.items():
+                cur = self.classes.setdefault(cls, [0, 0])
+                cur[0] += c
+                cur[1] += b
 
-    if 'Contents' in objets:
-        taille_octets = sum(obj.get('Size', 0) for obj in objets['Contents'])
+class Throughput:
+    """Compteurs globaux pour l'affichage de la progression."""
 
-    table.add_row(nom, date_form, region, str(nb_fichiers), humanize.naturalsize(taille_octets))
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
 
-console = Console()
-console.print(table)
+    def add(self, count, size):
+        with self.lock:
+            self.count += count
+            self.bytes += size
+
+    def describe(self):
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        return (f"{self.count:,} objets, {humanize.naturalsize(self.bytes, binary=True)} "
+                f"({self.count / elapsed:,.0f} obj/s)")
+
+def _aggregate(objects, stats, throughput):
+    """Agrège un flux d'objets page par page dans `stats`."""
+    count, size, classes = 0, 0, {}
+    for obj in objects:
+        s = obj.get("Size", 0)
+        cls = classes.setdefault(obj.get("StorageClass", "STANDARD"), [0, 0])
+        cls[0] += 1
+        cls[1] += s
+        count += 1
+        size += s
+        # On publie tous les 1000 objets (une page) pour garder une progression fluide
+        if count == 1000:
+            stats.add(count, size, classes)
+            throughput.add(count, size)
+            count, size, classes = 0, 0, {}
+    stats.add(count, size, classes)
+    throughput.add(count, size)
+
+def discover(s3, stats, throughput, spawn, prefix="", depth=0):
+    """
+    Liste un niveau du bucket avec Delimiter='/'.
+
+    Les objets de ce niveau sont comptés directement ; chaque préfixe est
+    confié à `spawn` dès que sa page arrive, sans attendre la fin du listing.
+    Un préfixe seul à son niveau (tout le bucket sous data/...) est découpé
+    au niveau suivant plutôt que listé d'un bloc, jusqu'à MAX_DEPTH.
+    """
+    if depth == 0:
+        stats.region = s3.get_bucket_location(Bucket=stats.name).get("LocationConstraint") or "us-east-1"
+    held = []
+
+    def level_objects():
+        split = False
+        for page in pages(s3, "list_objects_v2", Bucket=stats.name, Prefix=prefix, Delimiter="/"):
+            for p in page.get("CommonPrefixes", []):
+                held.append(p["Prefix"])
+                # Dès le deuxième préfixe, le niveau se parallélise tel quel
+                if split or len(held) > 1:
+                    split = True
+                    for h in held:
+                        spawn(size_shard, h)
+                    held.clear()
+            yield from page.get("Contents", [])
+
+    _aggregate(level_objects(), stats, throughput)
+    if held:
+        if depth + 1 < MAX_DEPTH:
+            spawn(discover, spawn, held[0], depth + 1)
+        else:
+            spawn(size_shard, held[0])
+
+def size_shard(s3, stats, throughput, prefix):
+    _aggregate(paginate(s3, "list_objects_v2", "Contents", Bucket=stats.name, Prefix=prefix), stats, throughput)
+
+def size_buckets(s3, names, workers=32, progress=None):
+    """
+    Calcule taille, nombre d'objets et répartition par storage class de
+    plusieurs buckets. Découverte des préfixes et listing des shards partagent
+    le même pool : les buckets sont donc traités en parallèle entre eux.
+
+    Une erreur (AccessDenied, NoSuchBucket...) est rangée dans stats.error
+    du bucket concerné sans interrompre les autres.
+    """
+    results = {name: BucketSize(name) for name in names}
+    throughput = Throughput()
+    task = progress.add_task("Sizing", total=None) if progress else None
+    # Tâches soumises depuis les workers, récupérées par la boucle principale
+    submitted = queue.Queue()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def spawner(stats):
+            def spawn(func, *args):
+                submitted.put((pool.submit(func, s3, stats, throughput, *args), stats))
+            return spawn
+
+        for n in names:
+            spawn = spawner(results[n])
+            spawn(discover, spawn)
+
+        pending = {}
+        # Une tâche soumet ses enfants avant de se terminer : la file est
+        # donc toujours à jour quand `pending` se vide
+        while pending or not submitted.empty():
+            while not submitted.empty():
+                future, stats = submitted.get()
+                pending[future] = stats
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                stats = pending.pop(future)
+                err = future.exception()
+                if err is not None and stats.error is None:
+                    stats.error = f"{type(err).__name__}: {err}"
+            if progress:
+                progress.update(task, description=throughput.describe())
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Taille des buckets S3 (listing parallèle par préfixe)")
+    parser.add_argument("buckets", nargs="*", help="Buckets à mesurer (défaut: tous)")
+    parser.add_argument("-w", "--workers", type=int, default=32, help="Listings simultanés (défaut: %(default)s)")
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    aws_apitrace.setup(args)
+
+    s3 = client("s3")
+    buckets = {b["Name"]: b for b in paginate(s3, "list_buckets", "Buckets")}
+    names = args.buckets or list(buckets)
+
+    with Progress(SpinnerColumn(), TextColumn("{task.description}"), TimeElapsedColumn(),
+                  console=console, transient=True) as progress:
+        sizes = size_buckets(s3, names, workers=args.workers, progress=progress)
+
+    table = Table(box=box.SIMPLE_HEAVY)
+    table.add_column("Name", style="cyan", no_wrap=True)
+    table.add_column("Creation Time", style="magenta")
+    table.add_column("Region", style="green")
+    table.add_column("Files", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Storage classes")
+
+    buckets_list = names if args.buckets else sorted(names, key=lambda n: buckets[n]["CreationDate"], reverse=True)
+
+    for nom in buckets_list:
+        stats = sizes[nom]
+        date_form = str(buckets[nom]["CreationDate"]) if nom in buckets else "-"
+        region = buckets.get(nom, {}).get("BucketRegion") or stats.region
+        if stats.error:
+            table.add_row(nom, date_form, region or "-", "-", "-", f"[red]{stats.error}[/red]")
+            continue
+        classes = "\n".join(f"{cls}: {c:,} / {humanize.naturalsize(b)}" for cls, (c, b) in sorted(stats.classes.items()))
+        table.add_row(nom, date_form, region, f"{stats.count:,}", humanize.naturalsize(stats.bytes), classes)
+
+    console.print(table)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
-import boto3
 import argparse
+import aws_apitrace
+from aws_local import resource
 
 def list_security_groups(ec2):
     sgs = ec2.security_groups.all()
@@ -12,18 +13,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Lister tous les Security Groups")
     parser.add_argument('--profile', help="Nom du profile AWS à utiliser", default=None)
     parser.add_argument('--region', help="Région AWS", default=None)
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_apitrace.setup(args)
 
-    session_args = {}
-    if args.profile:
-        session_args['profile_name'] = args.profile
-    session = boto3.Session(**session_args)
-
-    ec2_args = {}
-    if args.region:
-        ec2_args['region_name'] = args.region
-
-    ec2 = session.resource('ec2', **ec2_args)
+    ec2 = resource('ec2', profile=args.profile, region=args.region)
     
     try:
       list_security_groups(ec2)
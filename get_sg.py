@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
-import boto3
 import argparse
+import aws_apitrace
+import aws_cache
+from collections import deque
+from aws_local import client
+from aws_cache import cached
 from rich.text import Text
 from rich.table import Table, box
 from rich.console import Console
@@ -10,13 +14,9 @@ console=Console()
 
 def get_security_group(ec2, sg_identifier):
     try:
-        # On cherche soit par ID (sg-xxx), soit par Nom
-        if sg_identifier.startswith('sg-'):
-            filters = [{'Name': 'group-id', 'Values': [sg_identifier]}]
-        else:
-            filters = [{'Name': 'group-name', 'Values': [sg_identifier]}]
-        
-        groups = list(ec2.security_groups.filter(Filters=filters))
+        # On cherche soit par ID (sg-xxx), soit par Nom, dans la liste en cache
+        field = 'GroupId' if sg_identifier.startswith('sg-') else 'GroupName'
+        groups = [g for g in cached(ec2, 'describe_security_groups', 'SecurityGroups') if g.get(field) == sg_identifier]
         
         if not groups:
             print(f"Aucun Security Group trouvé pour '{sg_identifier}'")
@@ -26,21 +26,21 @@ def get_security_group(ec2, sg_identifier):
             print (f"Plusieurs groupes trouvés pour '{sg_identifier}'")
             print ()
             for g in groups: 
-                print (f" -- {g.group_id}")
+                print (f" -- {g['GroupId']}")
             return 
 
         sg = groups[0]
 
         infos = Text.assemble(
-            ("  Name           : ", "bold"), (f"{sg.group_name}\n", "white"),
-            ("  Description    : ", "bold"), (f"{sg.description}\n", "italic"),
+            ("  Name           : ", "bold"), (f"{sg.get('GroupName')}\n", "white"),
+            ("  Description    : ", "bold"), (f"{sg.get('Description')}\n", "italic"),
             ("\n"),
-            ("  Security Group : ", "bold"), (f"{sg.group_id}\n", "cyan"),
-            ("  VPC ID         : ", "bold"), (f"{sg.vpc_id}", "green"),
+            ("  Security Group : ", "bold"), (f"{sg.get('GroupId')}\n", "cyan"),
+            ("  VPC ID         : ", "bold"), (f"{sg.get('VpcId')}", "green"),
         )
 
-        ingress=get_rules(sg.ip_permissions)
-        egress=get_rules(sg.ip_permissions_egress)
+        ingress=get_rules(sg.get('IpPermissions'))
+        egress=get_rules(sg.get('IpPermissionsEgress'))
 
         table = Table(box=box.SIMPLE, header_style="yellow")
         table.add_column ("Ports", style="cyan")
@@ -63,6 +63,7 @@ def get_security_group(ec2, sg_identifier):
 
         console.print("  [purple]###### Ingress/Egress rules ######")
         console.print(table)
+        return sg['GroupId']
 
     except Exception as e:
         print(f"Erreur lors de la récupération du groupe : {e}")
@@ -96,8 +97,130 @@ def get_rules(permissions):
     
     return(ruleset)
 
+class SgGraph:
+    """
+    Graphe des références entre security groups, construit une fois.
+
+    refs[sg]       : [(sg référencé, direction, ports, proto)] (règles de sg)
+    referenced_by[sg] : [(sg qui le référence, direction, ports, proto)]
+    enis[sg]       : ENI qui portent sg
+
+    Toutes les requêtes sont en O(degré) ; expand() parcourt le graphe en largeur.
+    """
+
+    def __init__(self, groups, interfaces):
+        self.groups = {g['GroupId']: g for g in groups}
+        self.refs, self.referenced_by = {}, {}
+        for g in groups:
+            for direction, key in (("INGRESS", 'IpPermissions'), ("EGRESS", 'IpPermissionsEgress')):
+                for rule in g.get(key) or []:
+                    ports, proto, _ = get_rules([rule])[0]
+                    for pair in rule.get('UserIdGroupPairs', []):
+                        other = pair.get('GroupId')
+                        if not other:
+                            continue
+                        self.refs.setdefault(g['GroupId'], []).append((other, direction, ports, proto))
+                        self.referenced_by.setdefault(other, []).append((g['GroupId'], direction, ports, proto))
+        self.enis = {}
+        for eni in interfaces:
+            for sg in eni.get('Groups', []):
+                self.enis.setdefault(sg['GroupId'], []).append(eni)
+
+    @classmethod
+    def load(cls, ec2):
+        return cls(cached(ec2, 'describe_security_groups', 'SecurityGroups'),
+                   cached(ec2, 'describe_network_interfaces', 'NetworkInterfaces'))
+
+    def instances(self, sg_id):
+        return sorted({(eni.get('Attachment') or {}).get('InstanceId') for eni in self.enis.get(sg_id, [])} - {None})
+
+    def expand(self, sg_id, reverse=True, depth=None):
+        """
+        Fermeture transitive : {sg: distance} des groupes qui référencent
+        sg_id (reverse) ou qu'il référence, jusqu'à `depth` sauts.
+        """
+        edges = self.referenced_by if reverse else self.refs
+        seen = {sg_id: 0}
+        queue = deque([sg_id])
+        while queue:
+            current = queue.popleft()
+            if depth is not None and seen[current] >= depth:
+                continue
+            for other, *_ in edges.get(current, []):
+                if other not in seen:
+                    seen[other] = seen[current] + 1
+                    queue.append(other)
+        del seen[sg_id]
+        return seen
+
+    def impact(self, sg_id):
+        """
+        Ce qui casse si sg_id est supprimé : ENI qui le portent (AWS refuse
+        la suppression tant qu'elles existent), règles des autres groupes à
+        retirer, et ENI de ces groupes qui perdent le trafic venant de sg_id.
+        """
+        rules = [r for r in self.referenced_by.get(sg_id, []) if r[0] != sg_id]
+        return {
+            "default": self.groups.get(sg_id, {}).get('GroupName') == 'default',
+            "enis": self.enis.get(sg_id, []),
+            "instances": self.instances(sg_id),
+            "rules": rules,
+            "peer_enis": {other: [e['NetworkInterfaceId'] for e in self.enis.get(other, [])]
+                          for other in {r[0] for r in rules}},
+        }
+
+def print_refs(graph, sg_id):
+    table = Table(box=box.SIMPLE, header_style="yellow", title="Références")
+    table.add_column("Sens")
+    table.add_column("Groupe", style="cyan")
+    table.add_column("Nom")
+    table.add_column("Direction")
+    table.add_column("Ports", style="cyan")
+    table.add_column("Protocol")
+    for label, edges in (("référence →", graph.refs.get(sg_id, [])), ("← référencé par", graph.referenced_by.get(sg_id, []))):
+        for other, direction, ports, proto in edges:
+            name = graph.groups.get(other, {}).get('GroupName', '?')
+            table.add_row(label, other, name, direction, ports, proto)
+    console.print(table)
+
+    table = Table(box=box.SIMPLE, header_style="yellow", title="Utilisation")
+    table.add_column("ENI", style="cyan")
+    table.add_column("Type")
+    table.add_column("Instance", style="green")
+    table.add_column("Description")
+    for eni in graph.enis.get(sg_id, []):
+        table.add_row(eni['NetworkInterfaceId'], eni.get('InterfaceType', ''),
+                      (eni.get('Attachment') or {}).get('InstanceId') or "-", eni.get('Description', ''))
+    console.print(table)
+
+def print_impact(graph, sg_id):
+    impact = graph.impact(sg_id)
+    console.print(f"  [purple]###### Impact de la suppression de {sg_id} ######")
+    console.print()
+    if impact["default"]:
+        console.print("  [red]Groupe 'default' : ne peut pas être supprimé[/red]")
+    console.print(f"  ENI à détacher      : {len(impact['enis'])} ({', '.join(e['NetworkInterfaceId'] for e in impact['enis']) or '-'})")
+    console.print(f"  Instances touchées  : {', '.join(impact['instances']) or '-'}")
+    console.print(f"  Règles à retirer    : {len(impact['rules'])}")
+    for other, direction, ports, proto in impact["rules"]:
+        peers = impact["peer_enis"].get(other, [])
+        console.print(f"    - {other} {direction} {proto} {ports} (ENI concernées : {len(peers)})")
+    console.print()
+
+def print_expand(graph, sg_id, reverse, depth):
+    found = graph.expand(sg_id, reverse=reverse, depth=depth)
+    table = Table(box=box.SIMPLE, header_style="yellow",
+                  title=f"{'Référencent' if reverse else 'Référencés par'} {sg_id} (transitif)")
+    table.add_column("Distance", justify="right")
+    table.add_column("Groupe", style="cyan")
+    table.add_column("Nom")
+    table.add_column("ENI", justify="right")
+    for other, dist in sorted(found.items(), key=lambda kv: (kv[1], kv[0])):
+        table.add_row(str(dist), other, graph.groups.get(other, {}).get('GroupName', '?'), str(len(graph.enis.get(other, []))))
+    console.print(table)
+
 def list_security_groups(ec2):
-    sgs = ec2.security_groups.all()
+    sgs = cached(ec2, 'describe_security_groups', 'SecurityGroups')
 
     table = Table(box=box.SIMPLE_HEAVY, header_style="yellow")
     table.add_column("Id")
@@ -105,7 +228,7 @@ def list_security_groups(ec2):
     table.add_column("VPC")
 
     for sg in sgs:
-        table.add_row(sg.group_id, sg.group_name, sg.vpc_id)
+        table.add_row(sg.get('GroupId'), sg.get('GroupName'), sg.get('VpcId'))
 
     console.print(table)
     console.print()
@@ -115,21 +238,29 @@ if __name__ == "__main__":
     parser.add_argument('--profile', help="Nom du profile AWS à utiliser", default=None)
     parser.add_argument('--region', help="Région AWS", default=None)
     parser.add_argument("sg", nargs="?", help="Nom du security group à consulter", default=None)
+    parser.add_argument("--refs", action="store_true", help="Groupes référencés / qui le référencent, ENI et instances qui l'utilisent")
+    parser.add_argument("--impact", action="store_true", help="Ce qui casse si le groupe est supprimé")
+    parser.add_argument("--expand", choices=["in", "out"], help="Expansion transitive : groupes qui le référencent (in) ou qu'il référence (out)")
+    parser.add_argument("--depth", type=int, help="Profondeur maximale de --expand")
+    aws_cache.add_argument(parser)
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_cache.setup(args)
+    aws_apitrace.setup(args)
 
-    session_args = {}
-    if args.profile:
-        session_args['profile_name'] = args.profile
-    session = boto3.Session(**session_args)
-
-    ec2_args = {}
-    if args.region:
-        ec2_args['region_name'] = args.region
-
-    ec2 = session.resource('ec2', **ec2_args)
+    ec2 = client('ec2', profile=args.profile, region=args.region)
 
     if (args.sg):
-        get_security_group(ec2,args.sg)
+        sg_id = get_security_group(ec2,args.sg)
+        if sg_id and (args.refs or args.impact or args.expand):
+            graph = SgGraph.load(ec2)
+            console.print()
+            if args.refs:
+                print_refs(graph, sg_id)
+            if args.impact:
+                print_impact(graph, sg_id)
+            if args.expand:
+                print_expand(graph, sg_id, args.expand == "in", args.depth)
         exit(0)
     
     try:
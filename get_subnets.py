@@ -2,11 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import aws_apitrace
 import os
-import boto3
 from botocore.exceptions import BotoCoreError, ClientError
 from rich.table import Table, box
 from rich.console import Console
+from aws_local import client, paginate
 
 def main():
     parser = argparse.ArgumentParser(description="Lister les subnets AWS")
@@ -14,12 +15,13 @@ def main():
                         help="Profil AWS (default: %(default)s)")
     parser.add_argument("--region", default=os.environ.get("AWS_REGION"),
                         help="Région AWS (ex: eu-west-1)")
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_apitrace.setup(args)
 
     try:
-        session = boto3.Session(profile_name=args.profile, region_name=args.region)
-        ec2 = session.client("ec2")
-        resp = ec2.describe_subnets()
+        ec2 = client("ec2", profile=args.profile, region=args.region)
+        subnets = list(paginate(ec2, "describe_subnets", "Subnets"))
     except (BotoCoreError, ClientError) as e:
         print(f"Erreur connexion AWS : {e}")
         return
@@ -32,7 +34,7 @@ def main():
     table.add_column("VPC ID")
     table.add_column("Name")
 
-    for sn in resp.get("Subnets", []):
+    for sn in subnets:
         subnet_id = sn.get("SubnetId",None)
         cidr = sn.get("CidrBlock")
         az = sn.get("AvailabilityZone")
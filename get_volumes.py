@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import aws_apitrace
 import json, boto3
 import os, sys, csv
 from aws_local import client
@@ -16,6 +17,7 @@ def parse_args():
     parser.add_argument("--state", choices=["creating","available","in-use","deleting","deleted","error"], help="Filtrer par état du volume EBS.")
     parser.add_argument("--json", action="store_true", help="Sortie JSON.")
     parser.add_argument("--csv", metavar="PATH", help="Écrit la liste en CSV au chemin donné.")
+    aws_apitrace.add_argument(parser)
     return parser.parse_args()
 
 def list_volumes(client, state=None):
@@ -110,6 +112,7 @@ def write_csv(path, rows):
 
 def main():
     args = parse_args()
+    aws_apitrace.setup(args)
     ec2 = client("ec2")
 
     vols = [simplify(v) for v in list_volumes(ec2, state=args.state)]
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
-import boto3
 import argparse
+import aws_apitrace
+import aws_cache
+from aws_local import client
+from aws_cache import cached
+from get_routes import RouteEngine
 from rich.table import Table, box
 from rich.console import Console
 
 console = Console()
 
+def tag_name(item, default="N/A"):
+    return next((t['Value'] for t in (item.get('Tags') or []) if t['Key'] == 'Name'), default)
+
 def list_vpcs(ec2):
     table = Table(box=box.SIMPLE_HEAVY, header_style="yellow")
     table.add_column("VPC ID", style="cyan")
@@ -14,54 +21,73 @@ def list_vpcs(ec2):
     table.add_column("State", style="green")
     table.add_column("Name")
 
-    for vpc in ec2.vpcs.all():
-        name = next((t['Value'] for t in (vpc.tags or []) if t['Key'] == 'Name'), "N/A")
-        table.add_row(vpc.id, vpc.cidr_block, vpc.state, name)
+    for vpc in cached(ec2, 'describe_vpcs', 'Vpcs'):
+        table.add_row(vpc['VpcId'], vpc.get('CidrBlock'), vpc.get('State'), tag_name(vpc))
     console.print(table)
 
-def get_vpc_details(ec2, vpc_id):
+def get_vpc_details(ec2, vpc_id, destination=None):
     try:
-        vpc = ec2.Vpc(vpc_id)
+        vpc = next((v for v in cached(ec2, 'describe_vpcs', 'Vpcs') if v['VpcId'] == vpc_id), None)
+        if vpc is None:
+            raise LookupError("absent de describe_vpcs")
+
         console.print(f"\n[purple]###### Inventaire du VPC: {vpc_id} ######[/purple]\n")
-        console.print(f"  [bold]ID[/bold]      : {vpc.id}")
-        console.print(f"  [bold]CIDR[/bold]    : {vpc.cidr_block}")
-        console.print(f"  [bold]State[/bold]   : {vpc.state}")
-        
+        console.print(f"  [bold]ID[/bold]      : {vpc['VpcId']}")
+        console.print(f"  [bold]CIDR[/bold]    : {vpc.get('CidrBlock')}")
+        console.print(f"  [bold]State[/bold]   : {vpc.get('State')}")
+
         # Sous-réseaux
-        subnets = list(vpc.subnets.all())
+        subnets = [s for s in cached(ec2, 'describe_subnets', 'Subnets') if s.get('VpcId') == vpc_id]
+        engine = RouteEngine.load(ec2)
         if subnets:
             console.print("\n  [bold]Sous-réseaux associés :[/bold]\n")
             for sub in subnets:
-                console.print(f"    - {sub.id} ({sub.cidr_block}) en {sub.availability_zone}")
-        
+                table = engine.table_for(sub['SubnetId'], vpc_id) or "-"
+                console.print(f"    - {sub['SubnetId']} ({sub.get('CidrBlock')}) en {sub.get('AvailabilityZone')} -> {table}")
+
         # Tables de routage
         console.print("\n  [bold]Tables de routage :[/bold]\n")
-        for rt in vpc.route_tables.all():
-            main_str = " (Main)" if any(assoc.main for assoc in rt.associations) else ""
-            console.print(f"    - {rt.id}{main_str}")
-            for route in rt.routes:
-                dest = route.destination_cidr_block or route.destination_ipv6_cidr_block or "Local"
-                target = (route.gateway_id or route.nat_gateway_id or route.network_interface_id or 
-                          route.instance_id or route.vpc_peering_connection_id or "Local")
+        for rt in cached(ec2, 'describe_route_tables', 'RouteTables'):
+            if rt.get('VpcId') != vpc_id:
+                continue
+            main_str = " (Main)" if any(assoc.get('Main') for assoc in rt.get('Associations', [])) else ""
+            console.print(f"    - {rt['RouteTableId']}{main_str}")
+            for route in rt.get('Routes', []):
+                dest = route.get('DestinationCidrBlock') or route.get('DestinationIpv6CidrBlock') or "Local"
+                target = (route.get('GatewayId') or route.get('NatGatewayId') or route.get('NetworkInterfaceId') or
+                          route.get('InstanceId') or route.get('VpcPeeringConnectionId') or "Local")
                 console.print(f"        {dest} -> {target}")
 
         # Internet Gateways
-        igws = list(vpc.internet_gateways.all())
+        igws = [i for i in cached(ec2, 'describe_internet_gateways', 'InternetGateways')
+                if any(a.get('VpcId') == vpc_id for a in i.get('Attachments', []))]
         if igws:
             console.print("\n  [bold]Internet Gateways :[/bold]\n")
             for igw in igws:
-                console.print(f"    - {igw.id}")
+                console.print(f"    - {igw['InternetGatewayId']}")
 
         # Elastic IPs (associées aux instances du VPC via des interfaces réseau)
         console.print("\n  [bold]Elastic IPs (EIPs) :[/bold]\n")
         found_eip = False
-        for eni in vpc.network_interfaces.all():
-            if eni.association and eni.association.public_ip:
-                console.print(f"    - {eni.association.public_ip} (associée à {eni.id})")
+        for eni in cached(ec2, 'describe_network_interfaces', 'NetworkInterfaces'):
+            public_ip = (eni.get('Association') or {}).get('PublicIp')
+            if eni.get('VpcId') == vpc_id and public_ip:
+                console.print(f"    - {public_ip} (associée à {eni['NetworkInterfaceId']})")
                 found_eip = True
         if not found_eip:
             console.print("    - Aucune EIP trouvée.")
-                
+
+        # Route retenue vers une destination, depuis chaque sous-réseau
+        if destination:
+            console.print(f"\n  [bold]Routes vers {destination} :[/bold]\n")
+            for sub in subnets:
+                route = engine.lookup(sub['SubnetId'], destination, vpc_id)
+                if route is None:
+                    console.print(f"    - {sub['SubnetId']} : [red]aucune route[/red]")
+                    continue
+                state = " [red](blackhole)[/red]" if route['state'] == 'blackhole' else ""
+                console.print(f"    - {sub['SubnetId']} : {route['destination']} -> {route['target']}{state} ({route['table']})")
+
     except Exception as e:
         console.print(f"[red]Erreur : VPC {vpc_id} non trouvé. {e}[/red]")
 
@@ -70,13 +96,16 @@ if __name__ == "__main__":
     parser.add_argument('--profile', help="Profile AWS")
     parser.add_argument('--region', help="Région AWS")
     parser.add_argument('vpc', nargs='?', help="ID du VPC à inventorier")
-
+    parser.add_argument('--to', metavar="IP", help="Affiche la route retenue vers IP depuis chaque sous-réseau du VPC")
+    aws_cache.add_argument(parser)
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
-    
-    session = boto3.Session(profile_name=args.profile) if args.profile else boto3.Session()
-    ec2 = session.resource('ec2', region_name=args.region) if args.region else session.resource('ec2')
+    aws_cache.setup(args)
+    aws_apitrace.setup(args)
+
+    ec2 = client('ec2', profile=args.profile, region=args.region)
 
-    if args.vpc: 
-        get_vpc_details(ec2, args.vpc)
+    if args.vpc:
+        get_vpc_details(ec2, args.vpc, args.to)
     else:
         list_vpcs(ec2)
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3 
 
 import os, re
+import itertools
 import argparse
+import aws_apitrace
 from rich.console import Console
 from rich.table import Table, box
-from aws_local import client
+from aws_local import client, paginate
 
 console=Console()
 profile = os.environ.get("AWS_PROFILE", "default")
@@ -14,14 +16,16 @@ def list_ami(profile="Default"):
 
     try:
         ec2 = client("ec2")
-        response = ec2.describe_images(Owners=['self', 'amazon', 'aws-marketplace'])
+        images = paginate(ec2, "describe_images", "Images", Owners=['self', 'amazon', 'aws-marketplace'])
+        first = next(images, None)
     except Exception as e:
         console.print(f"[red]Connexion à EC2 impossible : {e}[/red]")
         return()
 
-    images = response['Images']
-    
-    for image in images:
+    if first is None:
+        return
+
+    for image in itertools.chain([first], images):
         ami_id = image.get('ImageId')
         name = image.get('Name')
         description = image.get('Description', 'N/A')
@@ -50,7 +54,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Lister les AMI")
     parser.add_argument('-g', '--grep', type=str, default=None, help='Filtre expression réguliere sur la description')
     parser.add_argument('-o', '--owner', type=int, default=None, help='Idenfiant owner de l\'AMI')
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
+    aws_apitrace.setup(args)
 
     result=list_ami()
 
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 
+import sys
 import json
+import time
+import argparse
+import aws_apitrace
+from concurrent.futures import ThreadPoolExecutor
+import aws_cache
 from aws_local import client
+from aws_cache import cached
 
 def get_tags_string(resource):
     """Extrait les tags d'une ressource et les formate en string."""
@@ -12,79 +19,110 @@ def get_tags_string(resource):
         return f" [{', '.join(sorted(tag_list))}]"
     return ""
 
-def get_inventory():
-    # Format : (service, méthode, clé_racine, clé_id, nom_affichage)
-    checks = [
-        # --- NETWORK ---
-        ("ec2", "describe_vpcs", "Vpcs", "VpcId", "vpcs"),
-        ("ec2", "describe_subnets", "Subnets", "SubnetId", "subnets"),
-        ("ec2", "describe_security_groups", "SecurityGroups", "GroupId", "security_groups"),
-        ("ec2", "describe_internet_gateways", "InternetGateways", "InternetGatewayId", "internet_gateways"),
-        ("ec2", "describe_route_tables", "RouteTables", "RouteTableId", "route_tables"),
-        ("ec2", "describe_addresses", "Addresses", "PublicIp", "elastic_ips"),
-        # --- COMPUTE & STORAGE ---
-        ("ec2", "describe_instances", "Reservations", "InstanceId", "instances"),
-        ("ec2", "describe_volumes", "Volumes", "VolumeId", "ebs_volumes"),
-        ("lambda", "list_functions", "Functions", "FunctionName", "lambdas"),
-        # --- DATA & SECRETS ---
-        ("s3", "list_buckets", "Buckets", "Name", "s3_buckets"),
-        ("dynamodb", "list_tables", "TableNames", None, "dynamodb_tables"),
-        ("secretsmanager", "list_secrets", "SecretList", "Name", "secrets"),
-        ("ssm", "describe_parameters", "Parameters", "Name", "ssm_parameters"),
-        # --- IDENTITY ---
-        ("iam", "list_users", "Users", "UserName", "iam_users")
-    ]
-    
-    inventory = {}
-
-    for svc_name, method, key, id_key, label in checks:
-        try:
-            c = client(svc_name)
-            data = getattr(c, method)()
-            items = []
-
-            # Cas particulier EC2 Instances (nested)
-            if method == "describe_instances":
-                for res in data.get('Reservations', []):
-                    for inst in res.get('Instances', []):
-                        items.append(f"{inst.get(id_key)}{get_tags_string(inst)}")
-            
-            # Cas particulier S3 (Tags nécessitent un appel séparé)
-            elif svc_name == "s3":
-                for b in data.get('Buckets', []):
-                    name = b.get('Name')
-                    try:
-                        t_data = c.get_bucket_tagging(Bucket=name)
-                        tag_str = get_tags_string(t_data)
-                    except: tag_str = ""
-                    items.append(f"{name}{tag_str}")
-
-            # Cas standard
+# Format : (service, méthode, clé_racine, clé_id, nom_affichage)
+CHECKS = [
+    # --- NETWORK ---
+    ("ec2", "describe_vpcs", "Vpcs", "VpcId", "vpcs"),
+    ("ec2", "describe_subnets", "Subnets", "SubnetId", "subnets"),
+    ("ec2", "describe_security_groups", "SecurityGroups", "GroupId", "security_groups"),
+    ("ec2", "describe_internet_gateways", "InternetGateways", "InternetGatewayId", "internet_gateways"),
+    ("ec2", "describe_route_tables", "RouteTables", "RouteTableId", "route_tables"),
+    ("ec2", "describe_addresses", "Addresses", "PublicIp", "elastic_ips"),
+    # --- COMPUTE & STORAGE ---
+    ("ec2", "describe_instances", "Reservations[].Instances[]", "InstanceId", "instances"),
+    ("ec2", "describe_volumes", "Volumes", "VolumeId", "ebs_volumes"),
+    ("lambda", "list_functions", "Functions", "FunctionName", "lambdas"),
+    # --- DATA & SECRETS ---
+    ("s3", "list_buckets", "Buckets", "Name", "s3_buckets"),
+    ("dynamodb", "list_tables", "TableNames", None, "dynamodb_tables"),
+    ("secretsmanager", "list_secrets", "SecretList", "Name", "secrets"),
+    ("ssm", "describe_parameters", "Parameters", "Name", "ssm_parameters"),
+    # --- IDENTITY ---
+    ("iam", "list_users", "Users", "UserName", "iam_users"),
+    # Rôles IAM (souvent rattachés à d'autres ressources), publiés sous "iam_roles"
+    ("iam", "list_roles", "Roles", "RoleName", "roles"),
+]
+
+def bucket_tags(c, name):
+    try:
+        return get_tags_string(c.get_bucket_tagging(Bucket=name))
+    except Exception:
+        return ""
+
+def run_check(clients, check, workers):
+    """Exécute une entrée de CHECKS ; retourne la liste triée des éléments."""
+    svc_name, method, key, id_key, label = check
+    c = clients[svc_name]
+    items = []
+
+    # Cas particulier S3 (Tags nécessitent un appel séparé par bucket, faits en parallèle)
+    if svc_name == "s3":
+        names = [b.get('Name') for b in cached(c, method, key)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            tags = pool.map(lambda n: bucket_tags(c, n), names)
+            items = [f"{name}{tag_str}" for name, tag_str in zip(names, tags)]
+
+    # Cas standard
+    else:
+        for item in cached(c, method, key):
+            if id_key and isinstance(item, dict):
+                tag_str = get_tags_string(item)
+                # Ajout du nom du SG pour la lisibilité
+                suffix = f" ({item.get('GroupName')})" if method == "describe_security_groups" else ""
+                items.append(f"{item.get(id_key)}{suffix}{tag_str}")
             else:
-                raw_list = data.get(key, [])
-                for item in raw_list:
-                    if id_key and isinstance(item, dict):
-                        tag_str = get_tags_string(item)
-                        # Ajout du nom du SG pour la lisibilité
-                        suffix = f" ({item.get('GroupName')})" if method == "describe_security_groups" else ""
-                        items.append(f"{item.get(id_key)}{suffix}{tag_str}")
-                    else:
-                        items.append(str(item))
-            
+                items.append(str(item))
+
+    return sorted(items)
+
+def inventory_key(check):
+    svc_name, _, _, _, label = check
+    return "iam_roles" if label == "roles" else f"{svc_name}_{label}"
+
+def get_inventory(workers=8):
+    """
+    Lance toutes les vérifications dans un pool borné, avec un client partagé
+    par service. Retourne (inventaire, rapport {clé: (durée, erreur)}).
+    """
+    clients = {svc: client(svc) for svc in {check[0] for check in CHECKS}}
+    inventory, report = {}, {}
+
+    def timed(check):
+        start = time.monotonic()
+        try:
+            return run_check(clients, check, workers), None, time.monotonic() - start
+        except Exception as e:
+            return [], e, time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for check, (items, error, elapsed) in zip(CHECKS, pool.map(timed, CHECKS)):
+            name = inventory_key(check)
+            report[name] = (elapsed, error)
             if items:
-                inventory[f"{svc_name}_{label}"] = sorted(items)
+                inventory[name] = items
 
-            # Cas particulier IAM Roles (souvent rattachés à d'autres ressources)
-            if label == "iam_users":
-                roles = c.list_roles().get('Roles', [])
-                role_items = [f"{r.get('RoleName')}{get_tags_string(r)}" for r in roles]
-                if role_items:
-                    inventory["iam_roles"] = sorted(role_items)
+    return inventory, report
 
-        except Exception:
-            pass
+def print_report(report):
+    for name, (elapsed, error) in sorted(report.items(), key=lambda r: -r[1][0]):
+        status = f"ERREUR {type(error).__name__}: {error}" if error else "ok"
+        print(f"{name:<32} {elapsed * 1000:>8.0f} ms  {status}", file=sys.stderr)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inventaire JSON des principaux services")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Vérifications simultanées (défaut: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Affiche durée et erreur de chaque vérification")
+    aws_cache.add_argument(parser)
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    aws_cache.setup(args)
+    aws_apitrace.setup(args)
+
+    inventory, report = get_inventory(workers=args.workers)
     print(json.dumps(inventory, indent=4, ensure_ascii=False))
 
-if __name__ == "__main__":
-    get_inventory()
+    errors = [name for name, (_, error) in report.items() if error]
+    if args.verbose:
+        print_report(report)
+    elif errors:
+        print(f"{len(errors)} vérification(s) en erreur : {', '.join(sorted(errors))} (-v pour le détail)", file=sys.stderr)
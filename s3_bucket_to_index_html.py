@@ -1,26 +1,153 @@
 #!/usr/bin/env python3
-import os
-from aws_local import client
 
-s3 = client("s3")
-bucket_name = "test"
-response = s3.list_objects_v2(Bucket=bucket_name)
+import re
+import json
+import hashlib
+import argparse
+import aws_apitrace
+from html import escape
+from urllib.parse import quote
+from botocore.exceptions import ClientError
+from aws_local import client, paginate
 
-with open("/tmp/index.html", "w", encoding="utf-8") as f:
-    f.write("<html><head><title>Index MinIO</title></head><body>\n")
-    f.write(f"<h1>Photos dans {bucket_name}</h1><hr/>\n")
+MANIFEST = ".index-manifest.json"
+# Les index générés ne doivent pas se lister eux-mêmes
+INDEX_RE = re.compile(r"(^|/)index(-\d+)?\.html$")
 
-    # On itère sur le contenu renvoyé par le client
-    for obj in response.get("Contents", []):
-        fname = obj["Key"]
+def photo_keys(s3, bucket, extensions):
+    """Générateur des clés à indexer, page par page, dans l'ordre lexicographique."""
+    for obj in paginate(s3, "list_objects_v2", "Contents", Bucket=bucket):
+        key = obj["Key"]
+        if key == MANIFEST or INDEX_RE.search(key):
+            continue
+        if key.lower().endswith(extensions):
+            yield key
 
-        # On évite d'inclure l'index lui-même dans la liste
-        if fname == "index.html": continue
+def shards_by_page(keys, page_size):
+    """
+    Découpe le flux en pages de `page_size` clés : index.html, index-2.html...
+    Une page d'avance est gardée pour savoir si un lien "suivante" est nécessaire.
+    """
+    def name(n):
+        return "index.html" if n == 1 else f"index-{n}.html"
 
-        if fname.lower().endswith(".jpg"):
-            f.write(f'<a href="{fname}">{fname}</a><br/>\n')
+    def flush(n, chunk, last):
+        nav = {"prev": name(n - 1) if n > 1 else None, "next": None if last else name(n + 1)}
+        return name(n), f"Page {n}", chunk, [], nav
 
-    f.write("</body></html>")
+    chunk, n, pending = [], 1, None
+    for key in keys:
+        chunk.append(key)
+        if len(chunk) == page_size:
+            if pending:
+                yield flush(*pending, last=False)
+            pending, chunk, n = (n, chunk), [], n + 1
+    if pending:
+        yield flush(*pending, last=not chunk)
+    if chunk or not pending:
+        yield flush(n, chunk, last=True)
 
-print(f"Upload de index.html vers le bucket {bucket_name}...")
-s3.upload_file( "/tmp/index.html", bucket_name, "index.html", ExtraArgs={'ContentType': 'text/html'})
+def shards_by_prefix(keys):
+    """
+    Un index par "répertoire" de premier niveau (<prefix>/index.html) plus un
+    index racine listant les fichiers de la racine et les sous-répertoires.
+    Les clés arrivent triées : chaque préfixe est émis dès qu'il est terminé.
+    """
+    root, prefixes = [], []
+    current, chunk = None, []
+    for key in keys:
+        prefix = key.split("/", 1)[0] + "/" if "/" in key else ""
+        if not prefix:
+            root.append(key)
+            continue
+        if prefix != current:
+            if current:
+                yield f"{current}index.html", current, [k[len(current):] for k in chunk], [], {"up": "../index.html"}
+            current, chunk = prefix, []
+            prefixes.append(prefix)
+        chunk.append(key)
+    if current:
+        yield f"{current}index.html", current, [k[len(current):] for k in chunk], [], {"up": "../index.html"}
+    yield "index.html", "/", root, prefixes, {}
+
+def render(bucket, title, keys, subdirs, nav):
+    lines = ["<html><head><meta charset=\"utf-8\"><title>Index MinIO</title></head><body>",
+             f"<h1>Photos dans {escape(bucket)} {escape(title)}</h1><hr/>"]
+    for label in ("up", "prev", "next"):
+        if nav.get(label):
+            lines.append(f'<a href="{quote(nav[label])}">{label}</a> ')
+    for d in subdirs:
+        lines.append(f'<a href="{quote(d)}index.html">{escape(d)}</a><br/>')
+    for k in keys:
+        lines.append(f'<a href="{quote(k)}">{escape(k)}</a><br/>')
+    lines.append("</body></html>")
+    return "\n".join(lines)
+
+def shard_hash(keys, subdirs, nav):
+    h = hashlib.sha256()
+    h.update(json.dumps(nav, sort_keys=True).encode())
+    for k in subdirs + [""] + keys:
+        h.update(k.encode() + b"\n")
+    return h.hexdigest()
+
+def load_manifest(s3, bucket):
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=MANIFEST)["Body"].read())
+    except ClientError:
+        return {}
+
+def publish(s3, bucket, shards, force=False, dry_run=False):
+    """
+    Génère et envoie uniquement les index dont la liste de clés a changé
+    (comparaison des hash avec le manifeste stocké dans le bucket).
+    Avec force, tout est régénéré mais l'ancien manifeste sert toujours à
+    supprimer les index disparus.
+    """
+    old = load_manifest(s3, bucket)
+    new, uploaded = {}, []
+    for name, title, keys, subdirs, nav in shards:
+        digest = shard_hash(keys, subdirs, nav)
+        new[name] = digest
+        if not force and old.get(name) == digest:
+            continue
+        uploaded.append(name)
+        if not dry_run:
+            s3.put_object(Bucket=bucket, Key=name, Body=render(bucket, title, keys, subdirs, nav).encode("utf-8"),
+                          ContentType="text/html")
+
+    stale = sorted(set(old) - set(new))
+    if not dry_run:
+        for i in range(0, len(stale), 1000):
+            s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": k} for k in stale[i:i + 1000]], "Quiet": True})
+        if uploaded or stale:
+            s3.put_object(Bucket=bucket, Key=MANIFEST, Body=json.dumps(new).encode(), ContentType="application/json")
+    return uploaded, stale, len(new)
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère les pages index.html d'une galerie S3")
+    parser.add_argument("bucket", nargs="?", default="test", help="Bucket (défaut: %(default)s)")
+    parser.add_argument("--section", help="Section de aws_s3.ini")
+    parser.add_argument("--mode", choices=["prefix", "pages"], default="prefix",
+                        help="Un index par répertoire (défaut) ou pages de --page-size clés")
+    parser.add_argument("--page-size", type=int, default=1000, help="Clés par page en mode pages (défaut: %(default)s)")
+    parser.add_argument("--ext", action="append", help="Extensions indexées (défaut: .jpg)")
+    parser.add_argument("--force", action="store_true", help="Régénère tous les index")
+    parser.add_argument("--dry-run", action="store_true", help="N'envoie rien, affiche ce qui changerait")
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    aws_apitrace.setup(args)
+
+    s3 = client("s3", section=args.section)
+    extensions = tuple(e.lower() for e in (args.ext or [".jpg"]))
+    keys = photo_keys(s3, args.bucket, extensions)
+    shards = shards_by_prefix(keys) if args.mode == "prefix" else shards_by_page(keys, args.page_size)
+
+    uploaded, stale, total = publish(s3, args.bucket, shards, force=args.force, dry_run=args.dry_run)
+    for name in uploaded:
+        print(f"Upload de {name} vers le bucket {args.bucket}...")
+    for name in stale:
+        print(f"Suppression de {name}")
+    print(f"{len(uploaded)}/{total} index régénéré(s), {len(stale)} supprimé(s)")
+
+if __name__ == "__main__":
+    main()
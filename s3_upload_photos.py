@@ -1,16 +1,297 @@
 #!/usr/bin/env python3
 
-from aws_local import client
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import aws_apitrace
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from boto3.s3.transfer import TransferConfig
+from rich.console import Console
+from rich.progress import (Progress, BarColumn, DownloadColumn, TransferSpeedColumn,
+                           TimeRemainingColumn, TextColumn)
+from aws_local import client, paginate
+from s3_bucket_to_index_html import MANIFEST as INDEX_MANIFEST, INDEX_RE
 
-s3 = client("s3")
+console = Console()
 
-p = Path("~/Images/Mangas/").expanduser()
-files=[f for f in p.glob("*") if f.is_file()]
+MB = 1024 * 1024
+RETRY_ROUNDS = 3
 
-for cpt, file in enumerate(files[:20]):
-    ext=file.suffix
-    tname=f'{(cpt+1):04d}{ext}'
-    tname=tname.strip()
-    print ("Uploading",file,"as",tname)
-    s3.upload_file(file,"test",tname)
+def transfer_config(threshold_mb=16, chunk_mb=16, concurrency=4):
+    """Multipart au-delà de `threshold_mb`, `concurrency` parts en parallèle par fichier."""
+    return TransferConfig(
+        multipart_threshold=threshold_mb * MB,
+        multipart_chunksize=chunk_mb * MB,
+        max_concurrency=concurrency,
+        use_threads=True,
+    )
+
+def scan(source, recursive=False, numbered=False, prefix="", limit=None):
+    """Liste des (chemin, clé, taille) à envoyer."""
+    pattern = "**/*" if recursive else "*"
+    files = sorted(f for f in source.glob(pattern) if f.is_file() and not f.name.startswith(".s3sync-"))
+    if limit:
+        files = files[:limit]
+    jobs = []
+    for cpt, file in enumerate(files):
+        if numbered:
+            key = f'{(cpt+1):04d}{file.suffix}'.strip()
+        else:
+            key = file.relative_to(source).as_posix()
+        jobs.append((file, prefix + key, file.stat().st_size))
+    return jobs
+
+def upload_files(s3, jobs, bucket, workers=8, config=None, progress=None):
+    """
+    Envoie les fichiers en parallèle (un thread par fichier, multipart géré par
+    TransferConfig). Les échecs sont remis en file et retentés RETRY_ROUNDS fois.
+
+    Retourne la liste des (chemin, clé, erreur) définitivement en échec.
+    """
+    config = config or transfer_config()
+    task = progress.add_task("Upload", total=sum(size for _, _, size in jobs)) if progress else None
+
+    def upload(job):
+        path, key, size = job
+        sent = [0]
+        lock = threading.Lock()
+
+        def callback(n):
+            with lock:
+                sent[0] += n
+            if progress:
+                progress.advance(task, n)
+
+        try:
+            s3.upload_file(str(path), bucket, key, Config=config, Callback=callback)
+        except Exception:
+            # On retire de la progression ce qui a été envoyé pour rien
+            if progress:
+                progress.advance(task, -sent[0])
+            raise
+
+    pending = list(jobs)
+    failures = []
+    for round_ in range(RETRY_ROUNDS):
+        failures = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(upload, job): job for job in pending}
+            for future in as_completed(futures):
+                if future.exception():
+                    failures.append(futures[future] + (future.exception(),))
+        if not failures:
+            break
+        pending = [f[:3] for f in failures]
+        if round_ < RETRY_ROUNDS - 1:
+            console.print(f"[yellow]{len(failures)} échec(s), nouvelle tentative...[/yellow]")
+            time.sleep(2 ** round_)
+    return [(path, key, err) for path, key, _, err in failures]
+
+# --- Synchronisation incrémentale -------------------------------------------
+
+def file_etag(path, threshold, chunk):
+    """
+    ETag S3 attendu pour le fichier : md5 simple sous le seuil multipart,
+    sinon md5 des md5 de chaque part suffixé du nombre de parts.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size < threshold:
+            h = hashlib.md5()
+            for block in iter(lambda: f.read(MB), b""):
+                h.update(block)
+            return f'"{h.hexdigest()}"'
+        digests = []
+        while True:
+            part = f.read(chunk)
+            if not part:
+                break
+            digests.append(hashlib.md5(part).digest())
+    return f'"{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}"'
+
+def load_manifest(path):
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(path, manifest):
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+def is_managed(key, prefix, recursive):
+    """
+    Vrai si la clé fait partie de ce que la synchro gère : sous le préfixe,
+    au premier niveau seulement sans --recursive, et hors des index générés
+    par s3_bucket_to_index_html.
+    """
+    rest = key[len(prefix):]
+    if not recursive and "/" in rest:
+        return False
+    return not (key.endswith(INDEX_MANIFEST) or INDEX_RE.search(key))
+
+def plan_sync(s3, jobs, bucket, prefix, manifest, config, hash_workers=None, recursive=True):
+    """
+    Compare fichiers locaux, manifeste et listing distant.
+
+    Retourne (fichiers à envoyer, clés distantes orphelines, nouveau manifeste).
+    Les orphelines sont limitées aux clés gérées (voir is_managed).
+    Le hachage n'a lieu que si taille/mtime ont changé depuis le dernier
+    passage, et il est réparti sur un pool de processus.
+    """
+    remote = {o["Key"]: (o["Size"], o["ETag"])
+              for o in paginate(s3, "list_objects_v2", "Contents", Bucket=bucket, Prefix=prefix)}
+    new_manifest, to_upload, to_hash = {}, [], []
+
+    for path, key, size in jobs:
+        mtime = path.stat().st_mtime
+        entry = manifest.get(key)
+        remote_size, remote_etag = remote.get(key, (None, None))
+
+        if remote_size is None:
+            to_upload.append((path, key, size))
+        elif entry and entry["size"] == size and entry["mtime"] == mtime and entry["etag"] in (None, remote_etag):
+            # Inchangé depuis le dernier passage : on adopte l'ETag distant
+            new_manifest[key] = {"size": size, "mtime": mtime, "etag": remote_etag}
+        elif remote_size != size:
+            to_upload.append((path, key, size))
+        else:
+            to_hash.append((path, key, size, mtime, remote_etag))
+
+    if to_hash:
+        with ProcessPoolExecutor(max_workers=hash_workers) as pool:
+            etags = pool.map(file_etag, [str(j[0]) for j in to_hash],
+                             [config.multipart_threshold] * len(to_hash),
+                             [config.multipart_chunksize] * len(to_hash), chunksize=16)
+            for (path, key, size, mtime, remote_etag), etag in zip(to_hash, etags):
+                if etag == remote_etag:
+                    new_manifest[key] = {"size": size, "mtime": mtime, "etag": etag}
+                else:
+                    to_upload.append((path, key, size))
+
+    local_keys = {key for _, key, _ in jobs}
+    orphans = sorted(k for k in remote if k not in local_keys and is_managed(k, prefix, recursive))
+    return to_upload, orphans, new_manifest
+
+def delete_keys(s3, bucket, keys):
+    for i in range(0, len(keys), 1000):
+        batch = [{"Key": k} for k in keys[i:i + 1000]]
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": batch, "Quiet": True})
+
+def sync(s3, args, jobs, config, source):
+    manifest_path = Path(args.manifest).expanduser() if args.manifest else source / f".s3sync-{args.bucket}.json"
+    manifest = load_manifest(manifest_path)
+
+    with console.status("Comparaison avec le bucket..."):
+        to_upload, orphans, new_manifest = plan_sync(s3, jobs, args.bucket, args.prefix, manifest, config,
+                                                     recursive=args.recursive)
+    console.print(f"{len(jobs) - len(to_upload)} inchangé(s), {len(to_upload)} à envoyer, "
+                  f"{len(orphans)} orphelin(s) distant(s)")
+
+    if args.dry_run:
+        for path, key, size in to_upload:
+            console.print(f"  envoi      {key}")
+        for key in orphans if args.delete else []:
+            console.print(f"  [red]suppression {key}[/red]")
+        return []
+
+    failures = []
+    if to_upload:
+        with progress_bar() as progress:
+            failures = upload_files(s3, to_upload, args.bucket, args.workers, config, progress)
+        failed = {key for _, key, _ in failures}
+        for path, key, size in to_upload:
+            if key not in failed:
+                # ETag inconnu tant qu'on n'a pas relisté : adopté au prochain passage
+                new_manifest[key] = {"size": size, "mtime": path.stat().st_mtime, "etag": None}
+
+    if orphans and args.delete and confirm_delete(orphans, args.yes):
+        delete_keys(s3, args.bucket, orphans)
+        console.print(f"{len(orphans)} objet(s) distant(s) supprimé(s)")
+
+    save_manifest(manifest_path, new_manifest)
+    return failures
+
+def confirm_delete(keys, assume_yes=False, shown=20):
+    """Affiche les clés à supprimer et demande confirmation (sauf --yes)."""
+    for key in keys[:shown]:
+        console.print(f"  [red]{key}[/red]")
+    if len(keys) > shown:
+        console.print(f"  ... et {len(keys) - shown} autre(s)")
+    if assume_yes:
+        return True
+    if not sys.stdin.isatty():
+        console.print("[red]Suppression annulée : confirmer avec --yes en mode non interactif[/red]")
+        return False
+    return input(f"Supprimer {len(keys)} objet(s) distant(s) ? [o/N] ").strip().lower() in ("o", "oui", "y", "yes")
+
+def progress_bar():
+    return Progress(TextColumn("{task.description}"), BarColumn(), DownloadColumn(),
+                    TransferSpeedColumn(), TimeRemainingColumn(), console=console)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload massif de photos vers S3/MinIO")
+    parser.add_argument("source", nargs="?", default="~/Images/Mangas/", help="Répertoire source (défaut: %(default)s)")
+    parser.add_argument("-b", "--bucket", default="test", help="Bucket cible (défaut: %(default)s)")
+    parser.add_argument("--section", help="Section de aws_s3.ini (endpoint MinIO/LocalStack)")
+    parser.add_argument("--endpoint", help="Endpoint S3 explicite")
+    parser.add_argument("--prefix", default="", help="Préfixe ajouté aux clés")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Parcourt les sous-répertoires")
+    parser.add_argument("--numbered", action="store_true", help="Renomme les fichiers en 0001.ext, 0002.ext...")
+    parser.add_argument("--limit", type=int, help="Nombre maximal de fichiers")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Fichiers envoyés en parallèle (défaut: %(default)s)")
+    parser.add_argument("--part-concurrency", type=int, default=4, help="Parts multipart parallèles par fichier (défaut: %(default)s)")
+    parser.add_argument("--threshold", type=int, default=16, help="Seuil multipart en Mo (défaut: %(default)s)")
+    parser.add_argument("--chunk", type=int, default=16, help="Taille des parts en Mo (défaut: %(default)s)")
+    parser.add_argument("--sync", action="store_true", help="N'envoie que les fichiers nouveaux ou modifiés")
+    parser.add_argument("--manifest", help="Manifeste local de synchro (défaut: <source>/.s3sync-<bucket>.json)")
+    parser.add_argument("--delete", action="store_true", help="Avec --sync : supprime les objets distants absents localement")
+    parser.add_argument("--dry-run", action="store_true", help="Avec --sync : affiche les envois et suppressions sans rien faire")
+    parser.add_argument("-y", "--yes", action="store_true", help="Supprime sans demander confirmation")
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    if (args.delete or args.dry_run) and not args.sync:
+        parser.error("--delete et --dry-run nécessitent --sync")
+    if args.delete and (args.limit or args.numbered):
+        # La liste locale ne représente alors pas tout le préfixe distant
+        parser.error("--delete est incompatible avec --limit et --numbered")
+    return args
+
+def main():
+    args = parse_args()
+    aws_apitrace.setup(args)
+    s3 = client("s3", section=args.section, endpoint=args.endpoint)
+    config = transfer_config(args.threshold, args.chunk, args.part_concurrency)
+
+    source = Path(args.source).expanduser()
+    jobs = scan(source, args.recursive, args.numbered, args.prefix, args.limit)
+    if not jobs:
+        console.print(f"Aucun fichier dans {source}")
+        return
+
+    total = sum(size for _, _, size in jobs)
+    console.print(f"{len(jobs)} fichier(s), {total / MB:,.1f} Mo vers s3://{args.bucket}/{args.prefix}")
+
+    t0 = time.monotonic()
+    if args.sync:
+        failures = sync(s3, args, jobs, config, source)
+    else:
+        with progress_bar() as progress:
+            failures = upload_files(s3, jobs, args.bucket, args.workers, config, progress)
+    elapsed = time.monotonic() - t0
+
+    console.print(f"Terminé en {elapsed:.1f}s ({total / MB / max(elapsed, 1e-6):,.1f} Mo/s)")
+    for path, key, err in failures:
+        console.print(f"[red]Échec {path} -> {key} : {err}[/red]")
+    if failures:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
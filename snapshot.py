@@ -1,28 +1,279 @@
 #!/usr/bin/env python3
 
+import io
+import os
+import sys
 import json
-from aws_local import client
+import gzip
+import time
+import hashlib
+import queue
+import argparse
+import aws_apitrace
+import threading
+from datetime import datetime, timezone
+from aws_local import client, paginate
 
+# service -> (méthode, clé des éléments dans la réponse)
 services = {
-    "ec2": lambda c: c.describe_instances(),
-    "ecs": lambda c: c.list_clusters(),
-    "s3": lambda c: c.list_buckets(),
-    "lambda": lambda c: c.list_functions(),
-    "sqs": lambda c: c.list_queues(),
-    "sns": lambda c: c.list_topics(),
-    "dynamodb": lambda c: c.list_tables(),
-    "apigateway": lambda c: c.get_rest_apis(),
+    "ec2": ("describe_instances", "Reservations[].Instances[]"),
+    "ecs": ("list_clusters", "clusterArns"),
+    "s3": ("list_buckets", "Buckets"),
+    "lambda": ("list_functions", "Functions"),
+    "sqs": ("list_queues", "QueueUrls"),
+    "sns": ("list_topics", "Topics"),
+    "dynamodb": ("list_tables", "TableNames"),
+    "apigateway": ("get_rest_apis", "items"),
 }
 
-snapshot = {}
+# Identifiant stable d'un élément par service (None : l'élément est lui-même l'ID)
+ID_KEYS = {
+    "ec2": "InstanceId",
+    "ecs": None,
+    "s3": "Name",
+    "lambda": "FunctionArn",
+    "sqs": None,
+    "sns": "TopicArn",
+    "dynamodb": None,
+    "apigateway": "id",
+}
+
+def open_output(path, compress=None):
+    """Flux texte de sortie, compressé en gzip ou zstd selon l'option ou l'extension."""
+    if compress is None and path:
+        compress = "gzip" if path.endswith(".gz") else "zstd" if path.endswith(".zst") else None
+    if compress == "gzip":
+        return gzip.open(path or sys.stdout.buffer, "wt", encoding="utf-8")
+    if compress == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            sys.exit("Compression zstd : installer le module 'zstandard' (pip install zstandard)")
+        raw = open(path, "wb") if path else sys.stdout.buffer
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(raw, closefd=bool(path)), encoding="utf-8")
+    return open(path, "w", encoding="utf-8") if path else sys.stdout
 
-for name, fn in services.items():
+def collect(name, out, cancelled):
+    """Worker : pousse chaque élément du service dans la file, page par page."""
+    method, key = services[name]
+    start = time.monotonic()
+    count = 0
     try:
-        c = client(name)
-        snapshot[name] = fn(c)
+        for item in paginate(client(name), method, key):
+            if name in cancelled:
+                return
+            out.put({"service": name, "item": item})
+            count += 1
+        out.put({"service": name, "status": "ok", "count": count, "seconds": round(time.monotonic() - start, 3)})
     except Exception as e:
-        snapshot[name] = {
-            "error": str(e),
+        out.put({"service": name, "status": "error", "error": str(e), "count": count,
+                 "seconds": round(time.monotonic() - start, 3)})
+
+def take_snapshot(names, write, timeout=30):
+    """
+    Interroge les services en parallèle et appelle write(record) au fil de l'eau.
+
+    Un service qui dépasse `timeout` secondes est abandonné (ses threads sont
+    des daemons : ils ne bloquent pas la fin du programme) et un enregistrement
+    de statut "timeout" est écrit à sa place.
+    """
+    out = queue.Queue(maxsize=10000)
+    cancelled = set()
+    deadline = time.monotonic() + timeout
+    running = set(names)
+    status = {}
+
+    for name in names:
+        threading.Thread(target=collect, args=(name, out, cancelled), daemon=True).start()
+
+    while running:
+        try:
+            record = out.get(timeout=max(deadline - time.monotonic(), 0.01))
+        except queue.Empty:
+            record = None
+        if record and record["service"] in running:
+            write(record)
+            if "status" in record:
+                running.discard(record["service"])
+                status[record["service"]] = record
+        if time.monotonic() >= deadline:
+            for name in sorted(running):
+                cancelled.add(name)
+                record = {"service": name, "status": "timeout", "seconds": timeout}
+                write(record)
+                status[name] = record
+            running.clear()
+    return status
+
+# --- Stockage incrémental adressé par contenu --------------------------------
+
+class Store:
+    """
+    Snapshots incrémentaux :
+
+        objects/ab/cdef...   un enregistrement (ou une table id -> hash), gzip
+        runs/<run>.json      manifeste d'un passage : service -> hash de sa table
+
+    Un enregistrement inchangé n'est jamais réécrit ; un service inchangé
+    produit la même table, donc le même hash et aucun nouvel objet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(path, "runs"), exist_ok=True)
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, "objects", digest[:2], digest[2:])
+
+    def put(self, value):
+        data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def get(self, digest):
+        with gzip.open(self._object_path(digest), "rb") as f:
+            return json.loads(f.read())
+
+    def runs(self):
+        return sorted(f[:-5] for f in os.listdir(os.path.join(self.path, "runs")) if f.endswith(".json"))
+
+    def resolve(self, run):
+        """Accepte un identifiant de passage, "latest" ou "latest~N"."""
+        if run.startswith("latest"):
+            back = int(run.partition("~")[2] or 0)
+            runs = self.runs()
+            if back >= len(runs):
+                raise SystemExit(f"Pas assez de passages dans {self.path} pour '{run}'")
+            return runs[-1 - back]
+        return run
+
+    def load_run(self, run):
+        with open(os.path.join(self.path, "runs", f"{self.resolve(run)}.json")) as f:
+            return json.load(f)
+
+    def save_run(self, maps, status):
+        run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        manifest = {
+            "run": run,
+            "services": {name: self.put(m) if status.get(name, {}).get("status") == "ok" else None
+                         for name, m in maps.items()},
+            "status": status,
         }
+        with open(os.path.join(self.path, "runs", f"{run}.json"), "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        return run
+
+class StoreWriter:
+    """Callback d'écriture de take_snapshot : hache et range chaque enregistrement."""
+
+    def __init__(self, store, names):
+        self.store = store
+        self.maps = {name: {} for name in names}
+
+    def __call__(self, record):
+        if "item" not in record:
+            return
+        name, item = record["service"], record["item"]
+        key = ID_KEYS.get(name)
+        rid = item.get(key) if key and isinstance(item, dict) else item
+        self.maps[name][str(rid)] = self.store.put(item)
+
+def changed_fields(old, new):
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return []
+    return sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+
+def diff(store, run_a, run_b):
+    """
+    Ressources ajoutées / supprimées / modifiées entre deux passages.
+
+    Les services dont la table a le même hash sont ignorés sans être lus : le
+    coût est proportionnel à ce qui a changé.
+    """
+    a, b = store.load_run(run_a), store.load_run(run_b)
+    changes = []
+    for name in sorted(set(a["services"]) | set(b["services"])):
+        ha, hb = a["services"].get(name), b["services"].get(name)
+        if ha == hb:
+            continue
+        if ha is None or hb is None:
+            changes.append(("?", name, "service non collecté dans l'un des passages", []))
+            continue
+        ma, mb = store.get(ha), store.get(hb)
+        for rid in sorted(set(mb) - set(ma)):
+            changes.append(("+", name, rid, []))
+        for rid in sorted(set(ma) - set(mb)):
+            changes.append(("-", name, rid, []))
+        for rid in sorted(set(ma) & set(mb)):
+            if ma[rid] != mb[rid]:
+                changes.append(("~", name, rid, changed_fields(store.get(ma[rid]), store.get(mb[rid]))))
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot NDJSON des principaux services")
+    parser.add_argument("-o", "--output", help="Fichier de sortie (.gz / .zst compressés), défaut: stdout")
+    parser.add_argument("--compress", choices=["gzip", "zstd"], help="Force la compression")
+    parser.add_argument("-t", "--timeout", type=float, default=30, help="Délai maximal par service en secondes (défaut: %(default)s)")
+    parser.add_argument("-s", "--services", help="Liste de services séparés par des virgules (défaut: tous)")
+    parser.add_argument("--store", help="Répertoire de stockage incrémental des snapshots")
+    parser.add_argument("--diff", nargs=2, metavar=("RUN_A", "RUN_B"),
+                        help="Avec --store : différences entre deux passages (ID, latest, latest~1...)")
+    parser.add_argument("--runs", action="store_true", help="Avec --store : liste les passages enregistrés")
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    aws_apitrace.setup(args)
+
+    if args.diff or args.runs:
+        if not args.store:
+            sys.exit("--diff et --runs nécessitent --store")
+        store = Store(args.store)
+        if args.runs:
+            print("\n".join(store.runs()))
+        else:
+            for op, name, rid, fields in diff(store, *args.diff):
+                print(f"{op} {name:<12} {rid}" + (f"  ({', '.join(fields)})" if fields else ""))
+        return
+
+    names = args.services.split(",") if args.services else list(services)
+    unknown = [n for n in names if n not in services]
+    if unknown:
+        sys.exit(f"Services inconnus : {', '.join(unknown)}")
+
+    if args.store:
+        store = Store(args.store)
+        writer = StoreWriter(store, names)
+        out = open_output(args.output, args.compress) if args.output else None
+
+        def write(record):
+            writer(record)
+            if out:
+                out.write(json.dumps(record, default=str) + "\n")
+
+        try:
+            status = take_snapshot(names, write, timeout=args.timeout)
+        finally:
+            if out:
+                out.close()
+        print(f"Passage {store.save_run(writer.maps, status)} enregistré dans {args.store}", file=sys.stderr)
+    else:
+        out = open_output(args.output, args.compress)
+        try:
+            status = take_snapshot(names, lambda r: out.write(json.dumps(r, default=str) + "\n"), timeout=args.timeout)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    for name, record in status.items():
+        print(f"{name:<12} {record['status']:<8} {record.get('count', 0):>7} éléments {record['seconds']:>7}s",
+              file=sys.stderr)
 
-print(json.dumps(snapshot, indent=2, default=str))
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 
 import random
 import os
-from aws_local import client
+from aws_local import client, paginate
 
 ec2 = client("ec2")
 
@@ -20,11 +20,8 @@ def chaos_monkey(lab_name, min_stop=1, max_stop=3, action='stop'):
     filters = [{'Name': 'instance-state-name', 'Values': ['running']},
                {'Name': 'tag:Lab', 'Values': [lab_name]}
               ]
-    response = ec2.describe_instances(Filters=filters)
-
-    for reservation in response.get('Reservations', []):
-        for instance in reservation.get('Instances', []):
-            instances.append(instance['InstanceId'])
+    for instance in paginate(ec2, 'describe_instances', 'Reservations[].Instances[]', Filters=filters):
+        instances.append(instance['InstanceId'])
 
     if not instances:
         print(f"Aucune instance running trouvée dans le lab {lab_name}")
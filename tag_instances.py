@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
 import argparse 
-import boto3
+import aws_apitrace
 import os
+from aws_local import resource
 
 profile = os.environ.get("AWS_PROFILE", "default")
-session = boto3.Session(profile_name=profile)
 ec2=None
 
 def tag_instances(instance_ids, key, value, dry_run=False):
@@ -26,8 +26,10 @@ if __name__ == "__main__" :
     parser.add_argument('--dry-run', action='store_true', help="Simule l'execution sans changer quoi que ce soit")
     parser.add_argument('instances', nargs='*', help="Liste d'instances à tagguer")
 
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
-    ec2 = session.resource('ec2')
+    aws_apitrace.setup(args)
+    ec2 = resource('ec2', profile=profile)
 
     if (not args.dry_run): 
         try:
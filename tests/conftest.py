@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""Fixtures communes : les scripts sont à la racine du dépôt, pas dans un paquet."""
+
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeClient:
+    """
+    Client minimal pour aws_local.pages/paginate : sans paginateur botocore,
+    `responses[méthode]` est rejoué page par page (suivi manuel des jetons).
+    """
+
+    def __init__(self, responses, region="eu-west-3", service="ec2"):
+        self.responses = responses
+        self.calls = []
+        self.meta = types.SimpleNamespace(region_name=region, endpoint_url=None,
+                                          service_model=types.SimpleNamespace(service_name=service))
+
+    def can_paginate(self, method):
+        return False
+
+    def __getattr__(self, method):
+        if method not in self.responses:
+            raise AttributeError(method)
+
+        def call(**kwargs):
+            self.calls.append((method, dict(kwargs)))
+            pages = self.responses[method]
+            # Le jeton demandé désigne la page suivante
+            token = next((v for k, v in kwargs.items() if k in ("NextToken", "Marker", "ContinuationToken")), None)
+            return pages[int(token) if token else 0]
+        return call
+
+
+@pytest.fixture
+def fake_client():
+    return FakeClient
+
+
+class Clock:
+    """Horloge manuelle, substituée au module time d'aws_cache."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    import aws_cache
+    clock = Clock()
+    monkeypatch.setattr(aws_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, clock):
+    """aws_cache sur une base SQLite jetable."""
+    import aws_cache
+    monkeypatch.setenv("AWS_CACHE", "1")
+    monkeypatch.setenv("AWS_CACHE_DB", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(aws_cache, "_refresh", False)
+    aws_cache._local.conn = None
+    yield aws_cache
+    if aws_cache._local.conn is not None:
+        aws_cache._local.conn.close()
+    aws_cache._local.conn = None
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import types
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+
+def test_put_get_roundtrip(cache):
+    when = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    cache.put("k", {"when": when, "n": [1, 2]}, ttl=60)
+    assert cache.get("k") == {"when": when, "n": [1, 2]}
+
+
+def test_entry_expires_after_ttl(cache, clock):
+    cache.put("k", "v", ttl=60)
+    clock.advance(59)
+    assert cache.get("k") == "v"
+    clock.advance(1)
+    assert cache.get("k") is None
+
+
+def test_entry_without_ttl_never_expires(cache, clock):
+    cache.put("k", "v")
+    clock.advance(10 * 365 * 86400)
+    assert cache.get("k") == "v"
+
+
+def test_disabled_cache_stores_nothing(cache, monkeypatch):
+    monkeypatch.setenv("AWS_CACHE", "0")
+    cache.put("k", "v")
+    monkeypatch.setenv("AWS_CACHE", "1")
+    assert cache.get("k") is None
+
+
+class Sts:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def get_caller_identity(self):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {"Account": "123456789012"}
+
+
+def _client(fake_client, endpoint=None):
+    c = fake_client({})
+    c._aws_local_key = ("prod", "eu-west-3", endpoint, None)
+    return c
+
+
+def test_account_id_cached_for_account_ttl(cache, clock, fake_client, monkeypatch):
+    sts = Sts()
+    monkeypatch.setattr(cache.aws_local, "client", lambda *a, **kw: sts)
+    c = _client(fake_client)
+    assert cache.account_id(c) == "123456789012"
+    clock.advance(cache.ACCOUNT_TTL - 1)
+    assert cache.account_id(c) == "123456789012"
+    assert sts.calls == 1
+
+
+def test_account_id_error_on_aws_is_raised_and_not_cached(cache, fake_client, monkeypatch):
+    sts = Sts(ClientError({"Error": {"Code": "ExpiredToken", "Message": "expired"}}, "GetCallerIdentity"))
+    monkeypatch.setattr(cache.aws_local, "client", lambda *a, **kw: sts)
+    with pytest.raises(ClientError):
+        cache.account_id(_client(fake_client))
+    assert cache.get("account:prod@aws") is None
+
+
+def test_account_id_fallback_on_custom_endpoint_is_short_lived(cache, clock, fake_client, monkeypatch):
+    sts = Sts(ClientError({"Error": {"Code": "NotImplemented", "Message": "-"}}, "GetCallerIdentity"))
+    monkeypatch.setattr(cache.aws_local, "client", lambda *a, **kw: sts)
+    c = _client(fake_client, endpoint="http://minio:9000")
+    assert cache.account_id(c) == "prod@http://minio:9000"
+    clock.advance(cache.FALLBACK_TTL)
+    cache.account_id(c)
+    assert sts.calls == 2
+
+
+def test_cached_respects_method_ttl(cache, clock, fake_client, monkeypatch):
+    monkeypatch.setattr(cache, "account_id", lambda c: "123456789012")
+    c = fake_client({"describe_volumes": [{"Volumes": [{"VolumeId": "vol-1"}]}]})
+    assert cache.cached(c, "describe_volumes", "Volumes") == [{"VolumeId": "vol-1"}]
+    assert cache.cached(c, "describe_volumes", "Volumes") == [{"VolumeId": "vol-1"}]
+    assert len(c.calls) == 1
+    clock.advance(cache.TTLS["describe_volumes"])
+    cache.cached(c, "describe_volumes", "Volumes")
+    assert len(c.calls) == 2
+
+
+def test_cached_refresh_bypasses_entry(cache, fake_client, monkeypatch):
+    monkeypatch.setattr(cache, "account_id", lambda c: "123456789012")
+    c = fake_client({"describe_vpcs": [{"Vpcs": []}]})
+    cache.cached(c, "describe_vpcs", "Vpcs")
+    cache.cached(c, "describe_vpcs", "Vpcs", refresh=True)
+    assert len(c.calls) == 2
+
+
+class Session:
+    def __init__(self, access_key):
+        self.access_key = access_key
+
+    def get_credentials(self):
+        return types.SimpleNamespace(access_key=self.access_key) if self.access_key else None
+
+
+def test_account_id_without_profile_follows_credentials(cache, fake_client, monkeypatch):
+    sts = Sts()
+    session = Session("AKIAFIRST")
+    monkeypatch.setattr(cache.aws_local, "client", lambda *a, **kw: sts)
+    monkeypatch.setattr(cache.aws_local, "session", lambda *a, **kw: session)
+    c = fake_client({})
+    c._aws_local_key = (None, "eu-west-3", None, None)
+    cache.account_id(c)
+    cache.account_id(c)
+    assert sts.calls == 1
+    # Autres identifiants (autre compte possible) : nouvelle résolution
+    session.access_key = "AKIASECOND"
+    cache.account_id(c)
+    assert sts.calls == 2
+
+
+def test_account_id_without_credentials_is_not_persisted(cache, fake_client, monkeypatch):
+    sts = Sts()
+    monkeypatch.setattr(cache.aws_local, "client", lambda *a, **kw: sts)
+    monkeypatch.setattr(cache.aws_local, "session", lambda *a, **kw: Session(None))
+    c = fake_client({})
+    c._aws_local_key = (None, "eu-west-3", None, None)
+    cache.account_id(c)
+    cache.account_id(c)
+    assert sts.calls == 2
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from aws_local import _extract, pages, paginate
+
+
+def test_extract_nested_lists():
+    page = {"Reservations": [{"Instances": [{"InstanceId": "i-1"}, {"InstanceId": "i-2"}]},
+                             {"Instances": [{"InstanceId": "i-3"}]},
+                             {}]}
+    ids = [i["InstanceId"] for i in _extract(page, "Reservations[].Instances[]")]
+    assert ids == ["i-1", "i-2", "i-3"]
+
+
+def test_extract_missing_key_yields_nothing():
+    assert list(_extract({"Other": []}, "Reservations[].Instances[]")) == []
+
+
+def test_pages_follows_tokens_until_exhausted(fake_client):
+    c = fake_client({"describe_volumes": [
+        {"Volumes": [1, 2], "NextToken": "1"},
+        {"Volumes": [3], "NextToken": "2"},
+        {"Volumes": [4]},
+    ]})
+    assert [p["Volumes"] for p in pages(c, "describe_volumes")] == [[1, 2], [3], [4]]
+    assert [kw.get("NextToken") for _, kw in c.calls] == [None, "1", "2"]
+
+
+def test_pages_stops_on_repeated_token(fake_client):
+    c = fake_client({"list_things": [{"Things": [1], "NextToken": "1"}, {"Things": [2], "NextToken": "1"}]})
+    assert len(list(pages(c, "list_things"))) == 2
+
+
+def test_pages_iam_marker_only_when_truncated(fake_client):
+    c = fake_client({"list_users": [
+        {"Users": ["a"], "IsTruncated": True, "Marker": "1"},
+        {"Users": ["b"], "IsTruncated": False, "Marker": "1"},
+    ]})
+    assert list(paginate(c, "list_users", "Users")) == ["a", "b"]
+
+
+def test_paginate_appends_list_suffix(fake_client):
+    c = fake_client({"describe_instances": [
+        {"Reservations": [{"Instances": [{"InstanceId": "i-1"}]}], "NextToken": "1"},
+        {"Reservations": [{"Instances": [{"InstanceId": "i-2"}]}]},
+    ]})
+    instances = paginate(c, "describe_instances", "Reservations[].Instances")
+    assert [i["InstanceId"] for i in instances] == ["i-1", "i-2"]
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+import pytest
+
+import get_costs
+from get_costs import NO_VALUE, CostFrame, report_windows
+
+
+def period(day, groups):
+    return {"TimePeriod": {"Start": day},
+            "Groups": [{"Keys": keys, "Metrics": {"UnblendedCost": {"Amount": str(cost)},
+                                                  "UsageQuantity": {"Amount": "1"}}}
+                       for keys, cost in groups]}
+
+
+@pytest.fixture(params=["numpy", "python"])
+def frame(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(get_costs, "np", None)
+    f = CostFrame(["service", "tag"])
+    f.add_periods([
+        period("2024-05-01", [(["EC2", "team$web"], 10), (["S3", "team$"], 1)]),
+        period("2024-05-02", [(["EC2", "team$web"], 12), (["EC2", "team$data"], 5)]),
+        period("2024-05-03", [(["S3", "team$data"], 2)]),
+    ], ["service", "tag"])
+    return f
+
+
+def test_add_periods_encodes_labels(frame):
+    assert len(frame) == 5
+    assert frame.labels["service"] == ["EC2", "S3"]
+    # Valeur de tag vide : regroupée sous NO_VALUE
+    assert frame.labels["tag"] == ["web", NO_VALUE, "data"]
+    assert frame.span() == (date(2024, 5, 1), date(2024, 5, 3))
+
+
+def test_group_by_window_is_half_open(frame):
+    assert frame.group_by("service") == pytest.approx({"EC2": 27, "S3": 3})
+    assert frame.group_by("service", date(2024, 5, 2), date(2024, 5, 3)) == pytest.approx({"EC2": 17, "S3": 0})
+    assert frame.group_by("tag", column="usage") == pytest.approx({"web": 2, NO_VALUE: 1, "data": 2})
+
+
+def test_top_and_compare(frame):
+    assert frame.top("service", n=1) == [("EC2", pytest.approx(27))]
+    rows = frame.compare("service", (date(2024, 5, 2), date(2024, 5, 4)), (date(2024, 5, 1), date(2024, 5, 2)))
+    assert rows == [("EC2", 10, 17, 7), ("S3", 1, 2, 1)]
+
+
+def test_empty_frame():
+    f = CostFrame(["service"])
+    assert f.span() == (None, None)
+    assert f.group_by("service") == {}
+
+
+def test_report_windows_resource_halves():
+    start, current, previous = report_windows("resource", 90, date(2024, 5, 20))
+    assert current == (date(2024, 5, 14), date(2024, 5, 21))
+    assert previous == (date(2024, 5, 7), date(2024, 5, 14))
+    assert start == date(2024, 5, 7)
+
+
+def test_report_windows_month_to_date():
+    start, current, previous = report_windows("service", 10, date(2024, 3, 31))
+    assert current == (date(2024, 3, 1), date(2024, 4, 1))
+    # Février est plus court : la période précédente s'arrête au 1er mars
+    assert previous == (date(2024, 2, 1), date(2024, 3, 1))
+    assert start == date(2024, 2, 1)
+
+
+@pytest.fixture
+def ce(fake_client):
+    days = [{"TimePeriod": {"Start": f"2024-05-0{d}", "End": f"2024-05-0{d + 1}"}, "Groups": []} for d in (1, 2, 3)]
+    return fake_client({"get_cost_and_usage": [{"ResultsByTime": days}]}, service="ce")
+
+
+def test_cached_periods_resolves_account_once(cache, ce, monkeypatch):
+    lookups = []
+    monkeypatch.setattr(cache, "account_id", lambda c: lookups.append(c) or "123456789012")
+    bounds = [(date(2024, 5, d), date(2024, 5, d + 1)) for d in (1, 2, 3)]
+    first = get_costs._cached_periods(ce, "get_cost_and_usage", "DAILY", bounds, {}, date(2024, 6, 1))
+    again = get_costs._cached_periods(ce, "get_cost_and_usage", "DAILY", bounds, {}, date(2024, 6, 1))
+    assert first == again and len(first) == 3
+    assert len(ce.calls) == 1 and len(lookups) == 2
+
+
+def test_cached_periods_without_cache_skips_account(cache, ce, monkeypatch):
+    monkeypatch.setenv("AWS_CACHE", "0")
+    monkeypatch.setattr(cache, "account_id", lambda c: pytest.fail("appel STS inutile"))
+    bounds = [(date(2024, 5, d), date(2024, 5, d + 1)) for d in (1, 2, 3)]
+    periods = get_costs._cached_periods(ce, "get_cost_and_usage", "DAILY", bounds, {}, date(2024, 6, 1))
+    assert [p["TimePeriod"]["Start"] for p in periods] == ["2024-05-01", "2024-05-02", "2024-05-03"]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from ipaddress import ip_address, ip_network
+
+import pytest
+
+from get_routes import PrefixTrie, RouteEngine
+
+
+def test_prefix_trie_longest_match():
+    trie = PrefixTrie(32)
+    for cidr in ("0.0.0.0/0", "10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24"):
+        trie.insert(ip_network(cidr), cidr)
+    lookup = lambda ip, length=32: trie.longest(int(ip_address(ip)), length)
+    assert lookup("10.1.2.3") == "10.1.2.0/24"
+    assert lookup("10.1.3.3") == "10.1.0.0/16"
+    assert lookup("10.200.0.1") == "10.0.0.0/8"
+    assert lookup("8.8.8.8") == "0.0.0.0/0"
+    # Un réseau /12 n'est couvert que par des préfixes d'au plus 12 bits
+    assert lookup("10.1.0.0", 12) == "10.0.0.0/8"
+
+
+def test_prefix_trie_no_default_route():
+    trie = PrefixTrie(128)
+    trie.insert(ip_network("2001:db8::/32"), "doc")
+    assert trie.longest(int(ip_address("2001:db8::1")), 128) == "doc"
+    assert trie.longest(int(ip_address("2001:db9::1")), 128) is None
+
+
+def test_prefix_trie_replace_flag():
+    trie = PrefixTrie(32)
+    net = ip_network("10.0.0.0/8")
+    trie.insert(net, "cidr")
+    trie.insert(net, "prefix-list", replace=False)
+    assert trie.longest(int(net.network_address), 32) == "cidr"
+
+
+@pytest.fixture
+def engine():
+    tables = [
+        {"RouteTableId": "rtb-main", "VpcId": "vpc-1", "Associations": [{"Main": True}], "Routes": [
+            {"DestinationCidrBlock": "10.0.0.0/16", "GatewayId": "local"},
+            {"DestinationCidrBlock": "0.0.0.0/0", "NatGatewayId": "nat-1"},
+        ]},
+        {"RouteTableId": "rtb-public", "VpcId": "vpc-1", "Associations": [{"SubnetId": "subnet-pub"}], "Routes": [
+            {"DestinationCidrBlock": "10.0.0.0/16", "GatewayId": "local"},
+            {"DestinationCidrBlock": "0.0.0.0/0", "GatewayId": "igw-1"},
+            {"DestinationPrefixListId": "pl-s3", "GatewayId": "vpce-1"},
+            {"DestinationCidrBlock": "192.0.2.0/24", "GatewayId": "igw-1", "State": "blackhole"},
+        ]},
+    ]
+    subnets = [{"SubnetId": "subnet-pub", "VpcId": "vpc-1"}, {"SubnetId": "subnet-priv", "VpcId": "vpc-1"}]
+    return RouteEngine(tables, subnets, {"pl-s3": ["52.216.0.0/15"]})
+
+
+def test_route_engine_association_and_main_table(engine):
+    assert engine.lookup("subnet-pub", "8.8.8.8")["target"] == "igw-1"
+    assert engine.lookup("subnet-priv", "8.8.8.8")["target"] == "nat-1"
+    assert engine.lookup("subnet-priv", "10.0.3.4")["target"] == "local"
+    assert engine.lookup("subnet-unknown", "8.8.8.8") is None
+
+
+def test_route_engine_prefix_list_and_blackhole(engine):
+    route = engine.lookup("subnet-pub", "52.217.1.1")
+    assert (route["target"], route["prefix_list"]) == ("vpce-1", "pl-s3")
+    assert engine.lookup("subnet-pub", "192.0.2.10")["state"] == "blackhole"
+
+
+def test_lookup_many_reports_invalid_address(engine):
+    results = engine.lookup_many([("subnet-pub", "8.8.8.8"), ("subnet-pub", "8.8.8"), ("subnet-priv", "")])
+    assert [r[3] for r in results] == [None, "adresse invalide '8.8.8'", "adresse invalide ''"]
+    assert results[0][2]["target"] == "igw-1"
+
+
+def test_lookup_many_reports_unknown_subnet(engine):
+    results = engine.lookup_many([("subnet-nope", "8.8.8.8"), ("subnet-priv", "8.8.8.8")])
+    assert results[0][2:] == (None, "sous-réseau inconnu 'subnet-nope'")
+    assert results[1][3] is None
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from get_sg import SgGraph
+
+
+def ref(*group_ids):
+    return [{"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443,
+             "UserIdGroupPairs": [{"GroupId": g} for g in group_ids]}]
+
+
+@pytest.fixture
+def graph():
+    # lb -> web -> app -> db, et un cycle db -> app
+    groups = [
+        {"GroupId": "sg-lb", "GroupName": "lb"},
+        {"GroupId": "sg-web", "GroupName": "web", "IpPermissions": ref("sg-lb")},
+        {"GroupId": "sg-app", "GroupName": "app", "IpPermissions": ref("sg-web", "sg-db")},
+        {"GroupId": "sg-db", "GroupName": "db", "IpPermissions": ref("sg-app"),
+         "IpPermissionsEgress": ref("sg-app")},
+    ]
+    interfaces = [
+        {"NetworkInterfaceId": "eni-1", "Groups": [{"GroupId": "sg-web"}], "Attachment": {"InstanceId": "i-1"}},
+        {"NetworkInterfaceId": "eni-2", "Groups": [{"GroupId": "sg-web"}, {"GroupId": "sg-app"}]},
+    ]
+    return SgGraph(groups, interfaces)
+
+
+def test_expand_reverse_distances(graph):
+    # Groupes dont les règles mènent à sg-lb, de proche en proche
+    assert graph.expand("sg-lb") == {"sg-web": 1, "sg-app": 2, "sg-db": 3}
+
+
+def test_expand_forward_with_cycle(graph):
+    assert graph.expand("sg-db", reverse=False) == {"sg-app": 1, "sg-web": 2, "sg-lb": 3}
+
+
+def test_expand_depth_limit(graph):
+    assert graph.expand("sg-lb", depth=1) == {"sg-web": 1}
+    assert graph.expand("sg-lb", depth=0) == {}
+
+
+def test_impact(graph):
+    impact = graph.impact("sg-web")
+    assert impact["instances"] == ["i-1"]
+    assert [r[0] for r in impact["rules"]] == ["sg-app"]
+    assert impact["peer_enis"] == {"sg-app": ["eni-2"]}
+    assert not impact["default"]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from s3_bucket_to_index_html import shards_by_page
+
+
+def pages(n_keys, page_size):
+    return [(name, chunk, nav) for name, _, chunk, _, nav in
+            shards_by_page((f"k{i}" for i in range(n_keys)), page_size)]
+
+
+def test_partial_last_page():
+    result = pages(5, 2)
+    assert [(name, chunk) for name, chunk, _ in result] == [
+        ("index.html", ["k0", "k1"]), ("index-2.html", ["k2", "k3"]), ("index-3.html", ["k4"])]
+    assert [nav for *_, nav in result] == [
+        {"prev": None, "next": "index-2.html"},
+        {"prev": "index.html", "next": "index-3.html"},
+        {"prev": "index-2.html", "next": None},
+    ]
+
+
+@pytest.mark.parametrize("n_keys", [2, 4])
+def test_exact_multiple_has_no_empty_trailing_page(n_keys):
+    result = pages(n_keys, 2)
+    assert len(result) == n_keys // 2
+    assert result[-1][2]["next"] is None
+    assert all(chunk for _, chunk, _ in result)
+
+
+def test_no_keys_gives_single_empty_page():
+    assert pages(0, 2) == [("index.html", [], {"prev": None, "next": None})]
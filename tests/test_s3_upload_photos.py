@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import types
+
+import pytest
+
+from s3_upload_photos import MB, file_etag, is_managed, plan_sync
+
+
+def test_file_etag_single_part(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"x" * 1000)
+    assert file_etag(str(path), 8 * MB, 8 * MB) == f'"{hashlib.md5(b"x" * 1000).hexdigest()}"'
+
+
+def test_file_etag_multipart(tmp_path):
+    data = os.urandom(2500)
+    path = tmp_path / "a.mov"
+    path.write_bytes(data)
+    parts = [data[0:1000], data[1000:2000], data[2000:]]
+    expected = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts)).hexdigest()
+    assert file_etag(str(path), 1000, 1000) == f'"{expected}-3"'
+
+
+def test_file_etag_exact_threshold_is_multipart(tmp_path):
+    path = tmp_path / "a.raw"
+    path.write_bytes(b"y" * 1000)
+    assert file_etag(str(path), 1000, 1000).endswith('-1"')
+
+
+@pytest.mark.parametrize("key, recursive, managed", [
+    ("photos/a.jpg", False, True),
+    ("photos/2024/a.jpg", False, False),
+    ("photos/2024/a.jpg", True, True),
+    ("photos/index.html", True, False),
+    ("photos/index-3.html", True, False),
+    ("photos/.index-manifest.json", True, False),
+])
+def test_is_managed(key, recursive, managed):
+    assert is_managed(key, "photos/", recursive) is managed
+
+
+@pytest.fixture
+def local(tmp_path):
+    """Trois fichiers locaux et leurs jobs (chemin, clé, taille)."""
+    files = {"same.jpg": b"same", "changed.jpg": b"new content", "new.jpg": b"new"}
+    jobs = []
+    for name, data in files.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        jobs.append((path, f"p/{name}", len(data)))
+    return jobs
+
+
+def remote_listing(fake_client, objects):
+    return fake_client({"list_objects_v2": [{"Contents": [{"Key": k, "Size": s, "ETag": e} for k, s, e in objects]}]},
+                       service="s3")
+
+
+def test_plan_sync(fake_client, local):
+    same_etag = f'"{hashlib.md5(b"same").hexdigest()}"'
+    s3 = remote_listing(fake_client, [
+        ("p/same.jpg", 4, same_etag),
+        ("p/changed.jpg", 3, '"old"'),
+        ("p/gone.jpg", 1, '"x"'),
+        ("p/sub/kept.jpg", 1, '"x"'),
+        ("p/index.html", 1, '"x"'),
+    ])
+    config = types.SimpleNamespace(multipart_threshold=8 * MB, multipart_chunksize=8 * MB)
+    to_upload, orphans, manifest = plan_sync(s3, local, "bucket", "p/", {}, config, hash_workers=1,
+                                             recursive=False)
+    assert sorted(key for _, key, _ in to_upload) == ["p/changed.jpg", "p/new.jpg"]
+    assert orphans == ["p/gone.jpg"]
+    assert manifest["p/same.jpg"]["etag"] == same_etag
+
+
+def test_plan_sync_trusts_unchanged_manifest_entry(fake_client, local):
+    path, key, size = local[0]
+    manifest = {key: {"size": size, "mtime": path.stat().st_mtime, "etag": '"remote"'}}
+    s3 = remote_listing(fake_client, [(key, size, '"remote"')])
+    config = types.SimpleNamespace(multipart_threshold=8 * MB, multipart_chunksize=8 * MB)
+    to_upload, _, new_manifest = plan_sync(s3, local[:1], "bucket", "p/", manifest, config)
+    # Pas de hachage : l'entrée du manifeste suffit
+    assert to_upload == [] and new_manifest[key]["etag"] == '"remote"'
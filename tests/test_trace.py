@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+from ipaddress import ip_address, ip_network
+
+import pytest
+
+from trace import Nacl, Ranges, SgIndex, check_ingress, parse_queries, source_arg
+
+
+def test_ranges_merges_adjacent_and_overlapping():
+    r = Ranges(["10.0.0.0/25", "10.0.0.128/25", "10.0.0.64/26", "2001:db8::/64"])
+    assert r.starts[4] == [int(ip_address("10.0.0.0"))]
+    assert ip_address("10.0.0.255") in r
+    assert ip_address("10.0.1.0") not in r
+    assert ip_address("2001:db8::1") in r
+
+
+def test_ranges_covers_and_overlaps():
+    r = Ranges(["10.0.0.0/24", "10.0.2.0/24"])
+    assert r.covers(ip_network("10.0.0.0/25"))
+    assert not r.covers(ip_network("10.0.0.0/22"))
+    assert r.overlaps(ip_network("10.0.0.0/22"))
+    assert not r.overlaps(ip_network("10.0.1.0/24"))
+    assert not Ranges().overlaps(ip_network("0.0.0.0/0"))
+
+
+@pytest.fixture
+def nacl():
+    return Nacl({"NetworkAclId": "acl-1", "Entries": [
+        {"RuleNumber": 32767, "Protocol": "-1", "CidrBlock": "0.0.0.0/0", "RuleAction": "deny", "Egress": False},
+        {"RuleNumber": 200, "Protocol": "6", "PortRange": {"From": 22, "To": 22},
+         "CidrBlock": "0.0.0.0/0", "RuleAction": "allow", "Egress": False},
+        {"RuleNumber": 100, "Protocol": "6", "PortRange": {"From": 22, "To": 22},
+         "CidrBlock": "10.0.0.0/24", "RuleAction": "deny", "Egress": False},
+        {"RuleNumber": 100, "Protocol": "-1", "CidrBlock": "0.0.0.0/0", "RuleAction": "allow", "Egress": True},
+    ]})
+
+
+@pytest.mark.parametrize("source, port, proto, verdict", [
+    ("10.0.0.5/32", 22, "tcp", ("deny", 100)),
+    ("192.168.1.1/32", 22, "tcp", ("allow", 200)),
+    ("192.168.1.1/32", 80, "tcp", ("deny", 32767)),
+    ("192.168.1.1/32", 22, "udp", ("deny", 32767)),
+    ("10.0.0.0/16", 22, "tcp", ("partial", 100)),
+])
+def test_nacl_first_match_in_rule_order(nacl, source, port, proto, verdict):
+    assert nacl.evaluate(ip_network(source), port, proto) == verdict
+
+
+@pytest.fixture
+def index():
+    groups = [
+        {"GroupId": "sg-web", "IpPermissions": [
+            {"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443, "IpRanges": [{"CidrIp": "0.0.0.0/0"}]},
+            {"IpProtocol": "tcp", "FromPort": 22, "ToPort": 22, "UserIdGroupPairs": [{"GroupId": "sg-bastion"}]},
+            {"IpProtocol": "tcp", "FromPort": 8000, "ToPort": 8100, "PrefixListIds": [{"PrefixListId": "pl-1"}]},
+        ]},
+        {"GroupId": "sg-all", "IpPermissions": [{"IpProtocol": "-1", "IpRanges": [{"CidrIp": "10.0.0.0/8"}]}]},
+    ]
+    interfaces = [{"Groups": [{"GroupId": "sg-bastion"}], "PrivateIpAddresses": [{"PrivateIpAddress": "10.1.0.5"}]}]
+    return SgIndex(groups, interfaces, {"pl-1": ["172.16.0.0/12"]})
+
+
+def test_sg_index_match(index):
+    assert index.match("sg-web", "8.8.8.8", 443).text == "tcp 443 <- 0.0.0.0/0"
+    assert index.match("sg-web", "8.8.8.8", 22) is None
+    # Référence SG->SG résolue par l'adresse de l'ENI
+    assert index.match("sg-web", "10.1.0.5", 22) is not None
+    assert index.match("sg-web", "sg-bastion", 22) is not None
+    assert index.match("sg-web", "172.20.0.1", 8050) is not None
+    assert index.match("sg-web", "172.20.0.1", 8200) is None
+
+
+def test_sg_index_all_traffic_rule(index):
+    assert index.match("sg-all", "10.2.3.4", 5432, "tcp") is not None
+    assert index.match("sg-all", "10.2.3.4", None, "all") is not None
+    # Une requête "tout le trafic" ne passe pas par une règle limitée à un port
+    assert index.match("sg-web", "8.8.8.8", None, "all") is None
+
+
+def test_sg_index_allows_any_group(index):
+    assert index.allows(["sg-all", "sg-web"], "8.8.8.8", 443)[0] == "sg-web"
+    assert index.allows(["sg-all", "sg-web"], "8.8.8.8", 22) is None
+
+
+def test_sg_index_coverage(index):
+    assert index.coverage(["sg-web"], ip_network("192.0.2.0/24"), 443) == ("allow", None)
+    assert index.coverage(["sg-all"], ip_network("0.0.0.0/0"), 22) == ("partial", None)
+    assert index.coverage(["sg-web"], ip_network("192.0.2.0/24"), 22) == ("deny", None)
+
+
+def test_parse_queries_product_and_errors():
+    queries, errors = parse_queries([
+        "i-1,i-2 10.0.0.1 22,53/udp  # commentaire",
+        "",
+        "* 10.0.0.2",
+        "i-3 10.0.0.3 http/tcp",
+        "i-4 10.0.0.4 80-90",
+        "i-5",
+    ], lambda: ["i-a"])
+    assert queries == [
+        ("i-1", "10.0.0.1", 22, "tcp"), ("i-1", "10.0.0.1", 53, "udp"),
+        ("i-2", "10.0.0.1", 22, "tcp"), ("i-2", "10.0.0.1", 53, "udp"),
+        ("i-a", "10.0.0.2", None, "all"),
+    ]
+    assert [e["reason"].split(" :")[0] for e in errors] == ["ligne 4", "ligne 5", "ligne 6"]
+    assert all(e["verdict"] == "error" for e in errors)
+
+
+def test_sg_index_evaluate_network_and_group_sources(index):
+    assert index.evaluate(["sg-all"], "10.0.0.0/8", 22) == ("allow", None)
+    assert index.evaluate(["sg-all"], "10.0.0.0/7", 22) == ("partial", None)
+    assert index.evaluate(["sg-web"], "sg-bastion", 22)[0] == "allow"
+    assert index.evaluate(["sg-web"], "8.8.8.8", 443)[1] == "sg-web: tcp 443 <- 0.0.0.0/0"
+
+
+def test_check_ingress_accepts_networks(index):
+    assert check_ingress("sg-all", "10.0.0.0/8", 22, index=index)
+    assert not check_ingress("sg-all", "0.0.0.0/0", 22, index=index)
+
+
+@pytest.mark.parametrize("value", ["10.0.0.1", "10.0.0.0/8", "2001:db8::/32", "sg-123"])
+def test_source_arg_accepts(value):
+    assert source_arg(value) == value
+
+
+def test_source_arg_rejects_garbage():
+    with pytest.raises(argparse.ArgumentTypeError):
+        source_arg("10.0.0.300")
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from vacuum_s3_bucket import Checkpoint
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "vacuum.json")
+
+
+def saved(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_complete_out_of_order_waits_for_earlier_batches(path):
+    ckpt = Checkpoint(path)
+    ckpt.complete(1, {"KeyMarker": "b"})
+    ckpt.complete(2, {"KeyMarker": "c"})
+    assert ckpt.load() is None
+    ckpt.complete(0, {"KeyMarker": "a"})
+    assert saved(path) == {"mode": "versions", "marker": {"KeyMarker": "c"}}
+    assert ckpt.next_index == 3 and ckpt.done == {}
+
+
+def test_complete_gap_keeps_last_contiguous_marker(path):
+    ckpt = Checkpoint(path, "objects")
+    ckpt.complete(0, {"ContinuationToken": "t0"})
+    ckpt.complete(2, {"ContinuationToken": "t2"})
+    assert ckpt.load() == {"ContinuationToken": "t0"}
+
+
+def test_load_rejects_other_mode(path):
+    Checkpoint(path, "objects").complete(0, {"ContinuationToken": "t"})
+    with pytest.raises(ValueError):
+        Checkpoint(path, "versions").load()
+
+
+def test_load_legacy_format_infers_mode(path):
+    with open(path, "w") as f:
+        json.dump({"KeyMarker": "k", "VersionIdMarker": "v"}, f)
+    assert Checkpoint(path).load() == {"KeyMarker": "k", "VersionIdMarker": "v"}
+    with pytest.raises(ValueError):
+        Checkpoint(path, "objects").load()
+
+
+def test_without_path_nothing_is_written(tmp_path):
+    ckpt = Checkpoint(None)
+    ckpt.complete(0, {"KeyMarker": "a"})
+    assert ckpt.load() is None
+    assert list(tmp_path.iterdir()) == []
@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
+import aws_apitrace
 import sys
+import csv
+import json
+import ipaddress
+import itertools
+import weakref
+import aws_cache
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from aws_local import client
+from aws_cache import cached
+from botocore.exceptions import ClientError
+from get_routes import RouteEngine
 from rich.console import Console
 
 console = Console()
@@ -16,32 +28,207 @@ def is_elbv2_available():
     except Exception:
         return False
 
-def check_ingress(security_group_id, source_ip, port):
-    """Vérifie si une règle autorise le trafic."""
-    ec2 = client("ec2")
+PROTOCOLS = {"tcp": "6", "udp": "17", "icmp": "1", "icmpv6": "58", "all": "-1"}
+
+def protocol_number(proto):
+    """Protocole tel qu'écrit dans IpProtocol ("tcp" et "6" sont équivalents)."""
+    proto = str(proto).lower()
+    return PROTOCOLS.get(proto, proto)
+
+class Ranges:
+    """
+    Ensemble de CIDR (IPv4 et IPv6) fusionnés en intervalles d'entiers
+    disjoints : l'appartenance d'une adresse se teste par bisection.
+    """
+
+    def __init__(self, cidrs=()):
+        by_version = {4: [], 6: []}
+        for cidr in cidrs:
+            net = ipaddress.ip_network(cidr, strict=False)
+            by_version[net.version].append((int(net.network_address), int(net.broadcast_address)))
+        self.starts, self.ends = {}, {}
+        for version, items in by_version.items():
+            merged = []
+            for lo, hi in sorted(items):
+                if merged and lo <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], hi)
+                else:
+                    merged.append([lo, hi])
+            self.starts[version] = [m[0] for m in merged]
+            self.ends[version] = [m[1] for m in merged]
+
+    def __contains__(self, ip):
+        starts = self.starts[ip.version]
+        i = bisect_right(starts, int(ip)) - 1
+        return i >= 0 and int(ip) <= self.ends[ip.version][i]
+
+    def covers(self, net):
+        """Vrai si tout le réseau `net` est inclus."""
+        lo, hi = int(net.network_address), int(net.broadcast_address)
+        i = bisect_right(self.starts[net.version], lo) - 1
+        return i >= 0 and hi <= self.ends[net.version][i]
+
+    def overlaps(self, net):
+        lo, hi = int(net.network_address), int(net.broadcast_address)
+        i = bisect_right(self.starts[net.version], hi) - 1
+        return i >= 0 and self.ends[net.version][i] >= lo
+
+class Rule:
+    """Une IpPermission compilée : intervalle de ports, plages d'IP, SG et prefix lists sources."""
+
+    __slots__ = ("lo", "hi", "cidrs", "ranges", "groups", "prefix_lists", "text")
+
+    def __init__(self, perm):
+        proto = protocol_number(perm.get('IpProtocol', '-1'))
+        from_port, to_port = perm.get('FromPort'), perm.get('ToPort')
+        if proto == "-1" or from_port in (None, -1):
+            self.lo, self.hi = None, None
+        elif proto in ("1", "58"):
+            # ICMP : FromPort est le type, ToPort le code
+            self.lo = self.hi = from_port
+        else:
+            self.lo, self.hi = from_port, to_port
+        cidrs = [r['CidrIp'] for r in perm.get('IpRanges', [])] + \
+                [r['CidrIpv6'] for r in perm.get('Ipv6Ranges', [])]
+        self.cidrs = cidrs
+        self.ranges = Ranges(cidrs)
+        self.groups = {g['GroupId'] for g in perm.get('UserIdGroupPairs', []) if g.get('GroupId')}
+        self.prefix_lists = [p['PrefixListId'] for p in perm.get('PrefixListIds', [])]
+        ports = "all" if self.lo is None else (str(self.lo) if self.lo == self.hi else f"{self.lo}-{self.hi}")
+        sources = cidrs + sorted(self.groups) + self.prefix_lists
+        self.text = f"{perm.get('IpProtocol')} {ports} <- {', '.join(sources) or '-'}"
+
+    def port_match(self, port):
+        return self.lo is None or port is None or self.lo <= port <= self.hi
+
+class SgIndex:
+    """
+    Règles d'entrée de tous les security groups d'une région, chargées une
+    fois et indexées par (SG, protocole). Les références SG->SG sont
+    résolues via les adresses privées des ENI, les prefix lists via leurs
+    entrées.
+    """
+
+    def __init__(self, groups, interfaces=(), prefix_lists=None):
+        self.rules = {}
+        for sg in groups:
+            by_proto = self.rules.setdefault(sg['GroupId'], {})
+            for perm in sg.get('IpPermissions', []):
+                proto = protocol_number(perm.get('IpProtocol', '-1'))
+                by_proto.setdefault(proto, []).append(Rule(perm))
+        # Adresse privée -> SG de l'ENI qui la porte
+        self.members = {}
+        for eni in interfaces:
+            groups_of = {g['GroupId'] for g in eni.get('Groups', [])}
+            addresses = [a['PrivateIpAddress'] for a in eni.get('PrivateIpAddresses', [])] + \
+                        [a['Ipv6Address'] for a in eni.get('Ipv6Addresses', [])]
+            for addr in addresses:
+                self.members.setdefault(ipaddress.ip_address(addr), set()).update(groups_of)
+        self.prefix_cidrs = prefix_lists or {}
+        self.prefix_lists = {pl: Ranges(cidrs) for pl, cidrs in self.prefix_cidrs.items()}
+        self._combined = {}
+
+    @classmethod
+    def load(cls, ec2):
+        groups = cached(ec2, 'describe_security_groups', 'SecurityGroups')
+        interfaces = cached(ec2, 'describe_network_interfaces', 'NetworkInterfaces')
+        referenced = {p['PrefixListId'] for sg in groups for perm in sg.get('IpPermissions', [])
+                      for p in perm.get('PrefixListIds', [])}
+        prefix_lists = {pl: [e['Cidr'] for e in cached(ec2, 'get_managed_prefix_list_entries', 'Entries',
+                                                       PrefixListId=pl)]
+                        for pl in referenced}
+        return cls(groups, interfaces, prefix_lists)
+
+    def match(self, sg_id, source, port=None, proto="tcp"):
+        """
+        Première règle de `sg_id` qui autorise `source` (IP ou "sg-...") sur
+        port/protocole, ou None.
+        """
+        if str(source).startswith("sg-"):
+            ip, source_groups = None, {source}
+        else:
+            ip = ipaddress.ip_address(source)
+            source_groups = self.members.get(ip, ())
+        by_proto = self.rules.get(sg_id, {})
+        proto = protocol_number(proto)
+        for rule in by_proto.get(proto, []) + (by_proto.get("-1", []) if proto != "-1" else []):
+            if not rule.port_match(port):
+                continue
+            if ip is not None and (ip in rule.ranges or
+                                   any(ip in self.prefix_lists.get(pl, Ranges()) for pl in rule.prefix_lists)):
+                return rule
+            if rule.groups and not rule.groups.isdisjoint(source_groups):
+                return rule
+        return None
+
+    def allows(self, sg_ids, source, port=None, proto="tcp"):
+        """(SG, règle) du premier groupe qui autorise le trafic, ou None (les SG d'une ENI s'additionnent)."""
+        for sg_id in sg_ids:
+            rule = self.match(sg_id, source, port, proto)
+            if rule is not None:
+                return sg_id, rule
+        return None
+
+    def coverage(self, sg_ids, network, port=None, proto="tcp"):
+        """
+        Verdict des SG `sg_ids` pour tout un réseau source : ("allow", règle),
+        ("partial", None) si seule une partie du réseau est autorisée, ou
+        ("deny", None). Une adresse seule passe par match() (références SG).
+        """
+        if network.num_addresses == 1:
+            found = self.allows(sg_ids, str(network.network_address), port, proto)
+            return ("allow", f"{found[0]}: {found[1].text}") if found else ("deny", None)
+        proto = protocol_number(proto)
+        key = (tuple(sorted(sg_ids)), port, proto)
+        ranges = self._combined.get(key)
+        if ranges is None:
+            # Union des plages de toutes les règles applicables
+            cidrs = []
+            for sg_id in sg_ids:
+                by_proto = self.rules.get(sg_id, {})
+                for rule in by_proto.get(proto, []) + (by_proto.get("-1", []) if proto != "-1" else []):
+                    if rule.port_match(port):
+                        cidrs += rule.cidrs
+                        for pl in rule.prefix_lists:
+                            cidrs += self.prefix_cidrs.get(pl, [])
+            ranges = self._combined[key] = Ranges(cidrs)
+        if ranges.covers(network):
+            return "allow", None
+        return ("partial", None) if ranges.overlaps(network) else ("deny", None)
+
+    def evaluate(self, sg_ids, source, port=None, proto="tcp"):
+        """Verdict de coverage() pour une source IP, réseau (CIDR) ou "sg-..."."""
+        if str(source).startswith("sg-"):
+            found = self.allows(sg_ids, source, port, proto)
+            return ("allow", f"{found[0]}: {found[1].text}") if found else ("deny", None)
+        return self.coverage(sg_ids, ipaddress.ip_network(source, strict=False), port, proto)
+
+# Index déjà construits, par client ec2 (aws_local réutilise ses clients)
+_indexes = weakref.WeakKeyDictionary()
+
+def sg_index(ec2):
+    """SgIndex de la région de `ec2`, construit une seule fois par client."""
+    index = _indexes.get(ec2)
+    if index is None:
+        index = _indexes[ec2] = SgIndex.load(ec2)
+    return index
+
+def check_ingress(security_group_id, source_ip, port, proto="tcp", index=None):
+    """Vérifie si une règle autorise le trafic depuis toute la source (IP, réseau ou SG)."""
     try:
-        sgs = ec2.describe_security_groups(GroupIds=[security_group_id])
-        for sg in sgs.get('SecurityGroups', []):
-            for rule in sg.get('IpPermissions', []):
-                from_port = rule.get('FromPort')
-                to_port = rule.get('ToPort')
-                # Vérification port et IP
-                port_match = (from_port is None) or (from_port <= port <= to_port)
-                ip_match = any(r.get('CidrIp') == source_ip or r.get('CidrIp') == '0.0.0.0/0' 
-                               for r in rule.get('IpRanges', []))
-                if port_match and ip_match:
-                    return True
-    except:
+        index = index or sg_index(client("ec2"))
+    except ClientError:
         return False
-    return False
+    return index.evaluate([security_group_id], source_ip, port, proto)[0] == "allow"
 
-def trace(instance_id, source_ip, port):
+def trace(instance_id, source_ip, port, proto="tcp"):
     elbv2_ok = is_elbv2_available()
     console.print(f"[bold cyan]Tracing ingress path to: {instance_id}[/]")
     ec2 = client("ec2")
     
     try:
-        inst_data = ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
+        inst_data = cached(ec2, 'describe_instances', 'Reservations[].Instances[]', InstanceIds=[instance_id])[0]
+        index = sg_index(ec2) if source_ip and port else None
         
         # Trace conditionnelle ELB
         if elbv2_ok:
@@ -58,8 +245,14 @@ def trace(instance_id, source_ip, port):
             for sg in eni.get('Groups', []):
                 sg_id = sg['GroupId']
                 status = "[bold green]ALLOWED"
-                if source_ip and port:
-                    status = "[bold green]ALLOWED" if check_ingress(sg_id, source_ip, port) else "[bold red]BLOCKED"
+                if index:
+                    verdict, rule = index.evaluate([sg_id], source_ip, port, proto)
+                    if verdict == "allow":
+                        status = f"[bold green]ALLOWED[/] ({rule})" if rule else "[bold green]ALLOWED"
+                    elif verdict == "partial":
+                        status = "[bold yellow]PARTIAL[/] (une partie du réseau seulement)"
+                    else:
+                        status = "[bold red]BLOCKED"
                 
                 console.print(f"                     └──> [bold cyan]SG:[/] {sg_id} -> {status}")
         
@@ -68,18 +261,236 @@ def trace(instance_id, source_ip, port):
     except Exception as e:
         console.print(f"[bold red]ERR: {str(e)}[/]")
 
+# --- Mode batch : matrice d'accessibilité ---
+
+class Nacl:
+    """Règles d'entrée d'une NACL, évaluées dans l'ordre des numéros (première correspondance)."""
+
+    def __init__(self, acl):
+        self.id = acl['NetworkAclId']
+        self.inbound = []
+        for e in sorted(acl.get('Entries', []), key=lambda e: e['RuleNumber']):
+            if e.get('Egress'):
+                continue
+            ports = e.get('PortRange')
+            self.inbound.append((
+                e['RuleNumber'], str(e.get('Protocol', '-1')),
+                ports['From'] if ports else None, ports['To'] if ports else None,
+                ipaddress.ip_network(e.get('CidrBlock') or e.get('Ipv6CidrBlock')), e['RuleAction']))
+
+    def evaluate(self, network, port=None, proto="tcp"):
+        """("allow"|"deny"|"partial", numéro de règle). Un réseau à cheval sur une règle est "partial"."""
+        proto = protocol_number(proto)
+        for number, rproto, lo, hi, net, action in self.inbound:
+            if rproto != "-1" and rproto != proto:
+                continue
+            if lo is not None and port is not None and not lo <= port <= hi:
+                continue
+            if net.version != network.version or not net.overlaps(network):
+                continue
+            if network.subnet_of(net):
+                return action, number
+            return "partial", number
+        return "deny", None
+
+def fetch_network(ec2):
+    """Données brutes (sérialisables) nécessaires à la matrice, chargées une fois."""
+    data = {
+        "instances": cached(ec2, 'describe_instances', 'Reservations[].Instances[]'),
+        "groups": cached(ec2, 'describe_security_groups', 'SecurityGroups'),
+        "interfaces": cached(ec2, 'describe_network_interfaces', 'NetworkInterfaces'),
+        "nacls": cached(ec2, 'describe_network_acls', 'NetworkAcls'),
+        "route_tables": cached(ec2, 'describe_route_tables', 'RouteTables'),
+        "subnets": cached(ec2, 'describe_subnets', 'Subnets'),
+    }
+    referenced = {p['PrefixListId'] for sg in data["groups"] for perm in sg.get('IpPermissions', [])
+                  for p in perm.get('PrefixListIds', [])}
+    referenced |= {r['DestinationPrefixListId'] for rt in data["route_tables"] for r in rt.get('Routes', [])
+                   if r.get('DestinationPrefixListId')}
+    data["prefix_lists"] = {pl: [e['Cidr'] for e in cached(ec2, 'get_managed_prefix_list_entries', 'Entries',
+                                                           PrefixListId=pl)]
+                            for pl in referenced}
+    return data
+
+class Reachability:
+    """SG, NACL et routes indexés en mémoire ; check() n'appelle plus l'API."""
+
+    def __init__(self, data):
+        self.instances = {i['InstanceId']: i for i in data["instances"]}
+        self.sgs = SgIndex(data["groups"], data["interfaces"], data["prefix_lists"])
+        self.nacls = {}
+        for acl in data["nacls"]:
+            nacl = Nacl(acl)
+            for assoc in acl.get('Associations', []):
+                self.nacls[assoc['SubnetId']] = nacl
+        self.routes = RouteEngine(data["route_tables"], data["subnets"], data["prefix_lists"])
+
+    def running(self):
+        return [i for i, inst in self.instances.items() if inst.get('State', {}).get('Name') == 'running']
+
+    def check_eni(self, eni, source, port, proto):
+        row = {"eni": eni['NetworkInterfaceId']}
+        row["sg"], row["sg_rule"] = self.sgs.coverage([g['GroupId'] for g in eni.get('Groups', [])], source, port, proto)
+        nacl = self.nacls.get(eni.get('SubnetId'))
+        row["nacl"], number = nacl.evaluate(source, port, proto) if nacl else ("allow", None)
+        row["nacl_rule"] = f"{nacl.id}#{number}" if nacl and number is not None else None
+        route = self.routes.lookup(eni.get('SubnetId'), source, eni.get('VpcId'))
+        target = route and (f"blackhole ({route['target']})" if route["state"] == "blackhole" else route["target"])
+        row["route"] = target
+        reasons = []
+        if row["sg"] != "allow":
+            reasons.append(f"SG {row['sg']}")
+        if row["nacl"] != "allow":
+            reasons.append(f"NACL {row['nacl']}")
+        if target is None or target.startswith("blackhole"):
+            reasons.append("pas de route retour")
+        elif target.startswith("igw-") and not (eni.get('Association') or {}).get('PublicIp'):
+            reasons.append("pas d'IP publique")
+        verdicts = {row["sg"], row["nacl"]}
+        if "deny" in verdicts or any(r.startswith("pas ") for r in reasons):
+            row["verdict"] = "deny"
+        else:
+            row["verdict"] = "partial" if "partial" in verdicts else "allow"
+        row["reason"] = ", ".join(reasons)
+        return row
+
+    def check(self, instance_id, source, port=None, proto="tcp"):
+        """Une ligne de la matrice ; l'instance est accessible si l'une de ses ENI l'est."""
+        base = {"instance": instance_id, "source": source, "port": port, "protocol": proto}
+        try:
+            inst = self.instances.get(instance_id)
+            if inst is None:
+                return dict(base, verdict="error", reason="instance inconnue")
+            network = ipaddress.ip_network(source, strict=False)
+            rows = [self.check_eni(eni, network, port, proto) for eni in inst.get('NetworkInterfaces', [])]
+        except ValueError as e:
+            return dict(base, verdict="error", reason=str(e))
+        if not rows:
+            return dict(base, verdict="deny", reason="aucune ENI")
+        rank = {"allow": 0, "partial": 1, "deny": 2}
+        return dict(base, **min(rows, key=lambda r: rank[r["verdict"]]))
+
+FIELDS = ["instance", "source", "port", "protocol", "verdict", "eni", "sg", "sg_rule", "nacl", "nacl_rule", "route", "reason"]
+
+def parse_port(spec):
+    """
+    "22", "22/tcp", "53/udp", "-1/all" -> (port, proto) ; ValueError si invalide.
+    "*" ou "-1" : tous les ports du protocole. Avec "all" (le défaut sans
+    port), seule une règle "tout le trafic" correspond.
+    """
+    port, _, proto = spec.partition("/")
+    proto = proto or "tcp"
+    if not (proto.isdigit() or proto.lower() in PROTOCOLS):
+        raise ValueError(f"protocole inconnu '{proto}'")
+    if port in ("", "*", "-1"):
+        return None, proto
+    if not port.isdigit() or not 0 <= int(port) <= 65535:
+        raise ValueError(f"port invalide '{port}'")
+    return int(port), proto
+
+def parse_queries(lines, all_instances):
+    """
+    Lignes "<instances> <sources> <ports>" : chaque champ accepte une liste
+    séparée par des virgules (produit cartésien), "*" pour toutes les
+    instances démarrées et "port/proto" (tcp par défaut).
+
+    Retourne (requêtes, lignes d'erreur) : une ligne invalide donne une ligne
+    "error" dans la matrice au lieu d'interrompre le batch.
+    """
+    queries, errors = [], []
+    for number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        instances, sources, ports = (line.split() + ["", "", ""])[:3]
+        try:
+            if not sources:
+                raise ValueError("source manquante")
+            specs = [parse_port(p) for p in (ports or "-1/all").split(",")]
+        except ValueError as e:
+            errors.append({"instance": instances, "source": sources, "port": ports, "verdict": "error",
+                           "reason": f"ligne {number} : {e}"})
+            continue
+        instances = all_instances() if instances == "*" else instances.split(",")
+        queries += [(inst, src, port, proto) for inst, src, (port, proto)
+                    in itertools.product(instances, sources.split(","), specs)]
+    return queries, errors
+
+_worker = None
+
+def _init_worker(data):
+    global _worker
+    _worker = Reachability(data)
+
+def _check_chunk(chunk):
+    return [_worker.check(*q) for q in chunk]
+
+def batch(ec2, lines, jobs=1, chunk=2000):
+    """Évalue toutes les requêtes ; au-delà d'un processus, l'index est reconstruit dans chaque worker."""
+    data = fetch_network(ec2)
+    reach = Reachability(data)
+    queries, errors = parse_queries(lines, reach.running)
+    if jobs <= 1 or len(queries) <= chunk:
+        return errors + [reach.check(*q) for q in queries]
+    chunks = [queries[i:i + chunk] for i in range(0, len(queries), chunk)]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(data,)) as pool:
+        return errors + [row for rows in pool.map(_check_chunk, chunks) for row in rows]
+
+def write_matrix(rows, fmt, out):
+    if fmt == "json":
+        json.dump(rows, out, indent=2, default=str)
+        out.write("\n")
+        return
+    writer = csv.DictWriter(out, fieldnames=FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+
+def source_arg(value):
+    """IP, réseau CIDR ou security group source."""
+    if value.startswith("sg-"):
+        return value
+    try:
+        ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"source invalide '{value}' (IP, réseau CIDR ou sg-...)")
+    return value
+
 def main():
     parser = argparse.ArgumentParser(description="Trace ingress path with conditional API checks")
-    parser.add_argument("instance_id", help="Instance ID (i-...)")
-    parser.add_argument("-s", "--source", help="IP source")
+    parser.add_argument("instance_id", nargs="?", help="Instance ID (i-...)")
+    parser.add_argument("-s", "--source", type=source_arg,
+                        help="Source : IP, réseau CIDR (autorisé seulement si tout le réseau passe) ou sg-...")
     parser.add_argument("-d", "--port", type=int, help="Port")
+    parser.add_argument("-b", "--batch", metavar="FICHIER",
+                        help="Matrice d'accessibilité : requêtes '<instances> <sources> <ports>' ('-' pour stdin). "
+                             "Sans port, la requête porte sur tout le trafic et n'est autorisée que par une règle 'all'")
+    parser.add_argument("-f", "--format", choices=["csv", "json"], default="csv", help="Format de la matrice (défaut: %(default)s)")
+    parser.add_argument("-o", "--output", help="Fichier de sortie de la matrice (défaut: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Processus pour évaluer la matrice (défaut: %(default)s)")
+    parser.add_argument("-p", "--protocol", default="tcp", help="Protocole : tcp, udp, icmp ou numéro (défaut: %(default)s)")
+    aws_cache.add_argument(parser)
+    aws_apitrace.add_argument(parser)
     args = parser.parse_args()
-    
-    if not args.instance_id.startswith("i-"):
+    aws_cache.setup(args)
+    aws_apitrace.setup(args)
+
+    if args.batch:
+        lines = sys.stdin if args.batch == "-" else open(args.batch)
+        with lines:
+            rows = batch(client("ec2"), list(lines), jobs=args.jobs)
+        out = open(args.output, "w", newline="") if args.output else sys.stdout
+        write_matrix(rows, args.format, out)
+        if args.output:
+            out.close()
+        counts = {v: sum(1 for r in rows if r["verdict"] == v) for v in ("allow", "partial", "deny", "error")}
+        print(" ".join(f"{k}={v}" for k, v in counts.items()), file=sys.stderr)
+        return
+
+    if not args.instance_id or not args.instance_id.startswith("i-"):
         console.print("[bold red]Erreur:[/bold red] L'ID doit commencer par 'i-'.")
         sys.exit(1)
         
-    trace(args.instance_id, args.source, args.port)
+    trace(args.instance_id, args.source, args.port, args.protocol)
 
 if __name__ == "__main__":
     main()
@@ -1,29 +1,225 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import json
+import time
+import queue
+import argparse
+import aws_apitrace
+import threading
+from botocore.exceptions import ClientError
+from rich.console import Console
+from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
 from aws_local import client
 
-try:
-    bucket_name=sys.argv[1]
-except:
-    print ("Must profide a bucket name")
-    exit(1)
+console = Console()
 
-s3 = client("s3")
-paginator = s3.get_paginator('list_objects_v2')
-pages = paginator.paginate(Bucket=bucket_name)
+BATCH = 1000        # maximum accepté par DeleteObjects
+RETRIES = 5
 
-for page in pages:
-    objects = page.get("Contents", [])
-    
-    if not objects:
-        continue
+def list_batches(s3, bucket, versions=True, start=None):
+    """
+    Générateur de lots (entrées à supprimer, marqueur de reprise).
 
-    for obj in objects:
-        print(f"Deleting {obj['Key']}")
+    Avec versions=True on liste aussi les anciennes versions et les delete
+    markers, sans quoi un bucket versionné ne se vide jamais. Le marqueur
+    retourné permet de reprendre le listing juste après le lot.
+    """
+    start = start or {}
+    if versions:
+        params = {"Bucket": bucket, "MaxKeys": BATCH}
+        params.update(start)
+        while True:
+            page = s3.list_object_versions(**params)
+            entries = [{"Key": v["Key"], "VersionId": v["VersionId"]}
+                       for v in page.get("Versions", []) + page.get("DeleteMarkers", [])]
+            marker = {}
+            if page.get("IsTruncated"):
+                marker = {"KeyMarker": page["NextKeyMarker"]}
+                if page.get("NextVersionIdMarker"):
+                    marker["VersionIdMarker"] = page["NextVersionIdMarker"]
+            if entries:
+                yield entries, marker
+            if not marker:
+                return
+            params.update(marker)
+    else:
+        params = {"Bucket": bucket, "MaxKeys": BATCH}
+        params.update(start)
+        while True:
+            page = s3.list_objects_v2(**params)
+            entries = [{"Key": o["Key"]} for o in page.get("Contents", [])]
+            marker = {"ContinuationToken": page["NextContinuationToken"]} if page.get("IsTruncated") else {}
+            if entries:
+                yield entries, marker
+            if not marker:
+                return
+            params.update(marker)
 
-    delete_list = {'Objects': [{'Key': obj['Key']} for obj in objects]}
-    s3.delete_objects(Bucket=bucket_name, Delete=delete_list)
+def delete_batch(s3, bucket, entries):
+    """
+    Supprime un lot ; les clés en erreur sont retentées avec backoff.
+    Retourne (nombre supprimé, erreurs définitives).
+    """
+    deleted = 0
+    for attempt in range(RETRIES):
+        try:
+            resp = s3.delete_objects(Bucket=bucket, Delete={"Objects": entries, "Quiet": True})
+        except ClientError as e:
+            errors = [{"Key": x["Key"], "VersionId": x.get("VersionId"), "Code": e.response["Error"]["Code"]} for x in entries]
+        else:
+            errors = resp.get("Errors", [])
+        deleted += len(entries) - len(errors)
+        if not errors:
+            return deleted, []
+        failed = {(e["Key"], e.get("VersionId")) for e in errors}
+        entries = [x for x in entries if (x["Key"], x.get("VersionId")) in failed]
+        time.sleep(min(2 ** attempt * 0.2, 5))
+    return deleted, errors
 
-print("Done")
+class Checkpoint:
+    """
+    Marqueur de reprise : avancé uniquement quand tous les lots précédents
+    sont terminés, pour ne jamais sauter d'objets après une interruption.
 
+    Le marqueur est enregistré avec son mode de listing ("versions" ou
+    "objects") : un ContinuationToken ne peut pas reprendre un listing de
+    versions, et inversement.
+    """
+
+    def __init__(self, path, mode="versions"):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.done = {}
+        self.next_index = 0
+
+    def load(self):
+        """Marqueur enregistré, ou None ; ValueError s'il provient de l'autre mode."""
+        if not (self.path and os.path.exists(self.path)):
+            return None
+        with open(self.path) as f:
+            data = json.load(f)
+        if "mode" in data:
+            mode, marker = data["mode"], data.get("marker")
+        else:
+            # Ancien format : le marqueur seul, dont les clés trahissent le mode
+            mode, marker = ("objects" if "ContinuationToken" in data else "versions"), data
+        if mode != self.mode:
+            raise ValueError(f"{self.path} a été créé en mode {mode}, pas {self.mode}")
+        return marker
+
+    def complete(self, index, marker):
+        with self.lock:
+            self.done[index] = marker
+            advanced = None
+            while self.next_index in self.done:
+                advanced = self.done.pop(self.next_index)
+                self.next_index += 1
+            if advanced is not None and self.path:
+                with open(self.path, "w") as f:
+                    json.dump({"mode": self.mode, "marker": advanced}, f)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def vacuum(s3, bucket, workers=8, versions=True, checkpoint=None, progress=None):
+    """Vide le bucket : un thread de listing alimente `workers` threads de suppression."""
+    ckpt = Checkpoint(checkpoint, "versions" if versions else "objects")
+    start = ckpt.load()
+    if start:
+        console.print(f"Reprise depuis {start}")
+
+    work = queue.Queue(maxsize=workers * 2)
+    stats = {"deleted": 0, "errors": []}
+    lock = threading.Lock()
+    t0 = time.monotonic()
+    task = progress.add_task("Suppression", total=None) if progress else None
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            index, entries, marker = item
+            try:
+                deleted, errors = delete_batch(s3, bucket, entries)
+            except Exception as e:
+                # Erreur hors ClientError (réseau, BotoCoreError...) : le lot entier est en échec
+                deleted = 0
+                errors = [{"Key": x["Key"], "VersionId": x.get("VersionId"), "Code": type(e).__name__,
+                           "Message": str(e)} for x in entries]
+            with lock:
+                stats["deleted"] += deleted
+                stats["errors"].extend(errors)
+                rate = stats["deleted"] / max(time.monotonic() - t0, 1e-6)
+                if progress:
+                    progress.update(task, description=f"{stats['deleted']:,} objets supprimés ({rate:,.0f}/s)")
+            # Un lot en échec bloque le marqueur : la reprise le relistera
+            if not errors:
+                ckpt.complete(index, marker)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+
+    def put(item):
+        # Jamais de blocage définitif si tous les workers sont morts
+        while any(t.is_alive() for t in threads):
+            try:
+                work.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for index, (entries, marker) in enumerate(list_batches(s3, bucket, versions, start)):
+            if not put((index, entries, marker)):
+                raise RuntimeError("Plus aucun thread de suppression actif")
+    finally:
+        for _ in threads:
+            put(None)
+        for t in threads:
+            t.join()
+
+    if not stats["errors"]:
+        ckpt.clear()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Vide un bucket S3 (objets, versions et delete markers)")
+    parser.add_argument("bucket", help="Bucket à vider")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Suppressions simultanées (défaut: %(default)s)")
+    parser.add_argument("--no-versions", action="store_true", help="Ne supprime que les versions courantes")
+    parser.add_argument("--checkpoint", help="Fichier de reprise (défaut: .vacuum-<bucket>.json)")
+    aws_apitrace.add_argument(parser)
+    args = parser.parse_args()
+    aws_apitrace.setup(args)
+
+    s3 = client("s3")
+    checkpoint = args.checkpoint or f".vacuum-{args.bucket}.json"
+
+    t0 = time.monotonic()
+    try:
+        Checkpoint(checkpoint, "objects" if args.no_versions else "versions").load()
+    except ValueError as e:
+        console.print(f"[red]{e} : supprimer le fichier ou changer d'option[/red]")
+        sys.exit(1)
+    with Progress(SpinnerColumn(), TextColumn("{task.description}"), TimeElapsedColumn(), console=console) as progress:
+        stats = vacuum(s3, args.bucket, workers=args.workers, versions=not args.no_versions,
+                       checkpoint=checkpoint, progress=progress)
+    elapsed = time.monotonic() - t0
+
+    console.print(f"{stats['deleted']:,} objets supprimés en {elapsed:.1f}s")
+    if stats["errors"]:
+        for e in stats["errors"][:20]:
+            console.print(f"[red]{e.get('Key')} ({e.get('VersionId')}) : {e.get('Code')} {e.get('Message', '')}[/red]")
+        console.print(f"[red]{len(stats['errors'])} erreur(s) ; relancer pour reprendre depuis {checkpoint}[/red]")
+        sys.exit(1)
+    print("Done")
+
+if __name__ == "__main__":
+    main()